@@ -1,25 +1,33 @@
 import streamlit as st
 import pandas as pd
-import requests
 import json
+import asyncio
 import re
-from io import BytesIO
+import hashlib
+import tempfile
+import zipfile
 from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import os
 import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import OrderedDict
 import altair as alt
-
-# Attempt to import ReportLab for PDF generation
-try:
-    from reportlab.lib.pagesizes import letter
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-    from html.parser import HTMLParser
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+from html_export import (
+    REPORTLAB_AVAILABLE, INLINE_ASSET_MAX_BYTES, INLINE_ASSET_BUDGET_BYTES, SpooledExport, artifact_size,
+    discard_artifact, prettify_html, purge_spooled_exports, render_export
+)
+from code_search import CodeSearchIndex
+from sheets import SHEET_CACHE_TTL_SECONDS, SheetCache, SheetLoadJob
+from outbox import OUTBOX_MAX_ATTEMPTS, OUTBOX_RATE_LIMIT_PER_SECOND, WebhookOutbox, outbox_idempotency_key
+from webhooks import (
+    TELEMETRY_HISTOGRAM_GROWTH, TELEMETRY_WINDOW_SECONDS, TELEMETRY_WINDOWS, TELEMETRY_TIMING_METRICS,
+    TELEMETRY_SIZE_METRICS, ADAPTIVE_TIMEOUT_MIN_SAMPLES, WEBHOOK_CACHE_TTL_SECONDS, WEBHOOK_CACHE_VOLATILE_FIELDS,
+    PooledHTTPClient, CircuitBreakerRegistry, WebhookResponseCache, WebhookStream, latency_percentile, send_webhook
+)
 
 # ==========================================
 # PAGE CONFIG
@@ -174,11 +182,39 @@ if "data_load_stats" not in st.session_state:
     st.session_state.data_load_stats = {"total_rows": 0, "load_time": 0, "duplicates": 0}
 if "force_refresh_counter" not in st.session_state:
     st.session_state.force_refresh_counter = 0
+if "sheet_load_job" not in st.session_state:
+    st.session_state.sheet_load_job = None
+if "code_index" not in st.session_state:
+    st.session_state.code_index = None
+if "search_index" not in st.session_state:
+    st.session_state.search_index = None
+if "export_job_ids" not in st.session_state:
+    st.session_state.export_job_ids = {}
+if "bulk_export_job" not in st.session_state:
+    st.session_state.bulk_export_job = None
+if "optimize_html_export" not in st.session_state:
+    st.session_state.optimize_html_export = False
+if "preview_update_mode" not in st.session_state:
+    st.session_state.preview_update_mode = "Debounced"
+if "preview_code" not in st.session_state:
+    st.session_state.preview_code = None
+if "preview_hash" not in st.session_state:
+    st.session_state.preview_hash = None
+if "last_code_edit_at" not in st.session_state:
+    st.session_state.last_code_edit_at = 0.0
+if "webhook_batch_job" not in st.session_state:
+    st.session_state.webhook_batch_job = None
+if "use_webhook_cache" not in st.session_state:
+    st.session_state.use_webhook_cache = False
+if "preview_stats" not in st.session_state:
+    st.session_state.preview_stats = {"edits": 0, "renders": 0, "reused": 0, "reruns": 0,
+                                      "render_time": 0.0, "last_edit_latency": None}
 
 # ==========================================
 # WEBHOOK CONFIGURATIONS
 # ==========================================
-WEBHOOK_BASE = "https://agentonline-u29564.vm.elestio.app/webhook"
+# Point WEBHOOK_BASE at a local stand-in server to try the webhooks without the live endpoints
+WEBHOOK_BASE = os.environ.get("WEBHOOK_BASE", "https://agentonline-u29564.vm.elestio.app/webhook")
 WEBHOOKS = {
     "Newsletter": {
         "url": f"{WEBHOOK_BASE}/newsletter-trigger",
@@ -267,137 +303,310 @@ WEBHOOKS = {
 }
 
 # ==========================================
-# HELPER FUNCTIONS
+# SHARED SHEET CACHE
 # ==========================================
+@st.cache_resource
+def get_sheet_cache():
+    """Return the single SheetCache instance shared by all sessions"""
+    return SheetCache()
 
-def load_data_with_retry(url, max_retries=3, force_refresh=False):
+# ==========================================
+# SHARED ARTIFACT CACHES
+# ==========================================
+PRETTIFY_CACHE_MAX_BYTES = 32 * 1024 * 1024
+EXPORT_ARTIFACT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def content_hash(text):
+    """Short, stable digest of a text/bytes value for use as a cache key"""
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    return hashlib.blake2b(text, digest_size=16).hexdigest()
+
+class ByteBoundedLRU:
     """
-    Load ALL data from Google Sheets with retry logic and cache busting.
-    This ensures complete data retrieval without row limitations.
+    Thread-safe LRU cache bounded by the total size of its values rather than
+    their count; least recently used values are evicted once max_bytes is exceeded.
     """
-    start_time = time.time()
-    
-    for attempt in range(max_retries):
-        try:
-            # Add timestamp to URL to bypass caching if force_refresh is True
-            cache_buster = f"&_cb={int(time.time())}" if force_refresh else ""
-            full_url = url + cache_buster
-            
-            # Use low_memory=False to handle large datasets and ensure all rows are read
-            # Set dtype to object for flexibility with mixed data types
-            df = pd.read_csv(
-                full_url,
-                low_memory=False,
-                dtype=str,  # Read all as strings to avoid type inference issues
-                na_filter=True,
-                keep_default_na=True,
-                encoding='utf-8'
-            )
-            
-            # Validate required columns
-            required_columns = ['Number', 'Code']
-            optional_columns = ['Title', 'Category', 'Description']
-            
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                error_msg = f"Missing required columns: {', '.join(missing_columns)}"
-                st.error(error_msg)
-                return pd.DataFrame(columns=required_columns + optional_columns), {
-                    "total_rows": 0,
-                    "load_time": time.time() - start_time,
-                    "duplicates": 0,
-                    "error": error_msg
-                }
-            
-            # Add optional columns if missing
-            for col in optional_columns:
-                if col not in df.columns:
-                    if col == 'Title':
-                        df[col] = df['Number'].astype(str) + " - Custom Code"
-                    elif col == 'Category':
-                        df[col] = "Custom"
-                    elif col == 'Description':
-                        df[col] = "Custom HTML/CSS code from Google Sheets"
-            
-            # Remove completely empty rows
-            df = df.dropna(how='all')
-            
-            # Check for duplicate Numbers
-            duplicates_count = df['Number'].duplicated().sum()
-            
-            # Keep first occurrence of duplicates
-            df = df.drop_duplicates(subset=['Number'], keep='first')
-            
-            # Convert Number column and set as index
-            df['Number'] = pd.to_numeric(df['Number'], errors='coerce')
-            df = df.dropna(subset=['Number'])  # Remove rows where Number couldn't be converted
-            df['Number'] = df['Number'].astype(int)
-            
-            # Set Number as index for easy lookup
-            df = df.set_index('Number', drop=False)
-            
-            load_time = time.time() - start_time
-            
-            stats = {
-                "total_rows": len(df),
-                "load_time": load_time,
-                "duplicates": duplicates_count,
-                "columns": list(df.columns),
-                "attempt": attempt + 1
+
+    def __init__(self, max_bytes, sizeof=len, on_evict=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            if self.on_evict:
+                self.on_evict(value)
+            return
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+                evicted.append(previous[0])
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+                evicted.append(evicted_value)
+        if self.on_evict:
+            for value in evicted:
+                self.on_evict(value)
+
+    def peek(self, key):
+        """Return the cached value without counting a lookup or refreshing its recency"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def values(self):
+        with self._lock:
+            return [value for value, _ in self._entries.values()]
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups * 100) if lookups else 0.0,
             }
-            
-            return df, stats
-            
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 2  # Exponential backoff: 2s, 4s, 6s
-                st.warning(f"Attempt {attempt + 1} failed. Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                error_msg = f"Failed to load data after {max_retries} attempts: {str(e)}"
-                st.error(error_msg)
-                return pd.DataFrame(columns=['Number', 'Code', 'Title', 'Category', 'Description']), {
-                    "total_rows": 0,
-                    "load_time": time.time() - start_time,
-                    "duplicates": 0,
-                    "error": error_msg
-                }
+
+@st.cache_resource
+def get_prettify_cache():
+    """Prettified HTML keyed by content hash, shared by all sessions"""
+    return ByteBoundedLRU(PRETTIFY_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_export_artifact_cache():
+    """Rendered exports keyed by (kind, content hash, title), shared by all sessions"""
+    return ByteBoundedLRU(EXPORT_ARTIFACT_CACHE_MAX_BYTES, sizeof=artifact_size, on_evict=discard_artifact)
+
+# ==========================================
+# WEBHOOK CLIENT
+# ==========================================
+# Set WEBHOOK_METRICS_PORT to serve /metrics in Prometheus text format for scraping.
+# Local-only by default; set WEBHOOK_METRICS_HOST (e.g. 0.0.0.0) to expose it to a remote scraper
+TELEMETRY_METRICS_PORT = os.environ.get("WEBHOOK_METRICS_PORT")
+TELEMETRY_METRICS_HOST = os.environ.get("WEBHOOK_METRICS_HOST", "127.0.0.1")
+
+@st.cache_resource
+def get_http_client():
+    """The pooled HTTP client shared by all sessions"""
+    return PooledHTTPClient()
+
+def get_webhook_telemetry():
+    return get_http_client().telemetry
+
+def webhook_endpoint_names():
+    """Webhook URL -> configured webhook name, used to label telemetry"""
+    return {info["url"]: name for name, info in WEBHOOKS.items()}
+
+@st.cache_resource
+def get_metrics_server(host, port):
+    """Background /metrics endpoint in Prometheus text format, one per process"""
+    telemetry = get_webhook_telemetry()
+    endpoint_names = webhook_endpoint_names()
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.prometheus_text(endpoint_names).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
         
-        except Exception as e:
-            error_msg = f"Unexpected error loading data: {str(e)}"
-            st.error(error_msg)
-            return pd.DataFrame(columns=['Number', 'Code', 'Title', 'Category', 'Description']), {
-                "total_rows": 0,
-                "load_time": time.time() - start_time,
-                "duplicates": 0,
-                "error": error_msg
-            }
+        def log_message(self, format, *args):
+            pass
     
-    # Should never reach here
-    return pd.DataFrame(columns=['Number', 'Code', 'Title', 'Category', 'Description']), {
-        "total_rows": 0,
-        "load_time": time.time() - start_time,
-        "duplicates": 0,
-        "error": "Unknown error"
-    }
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="webhook-metrics", daemon=True).start()
+    return server
 
-def send_webhook(webhook_url, payload):
-    """Send webhook request and return detailed response"""
-    try:
-        resp = requests.post(webhook_url, json=payload, timeout=30)
-        return {
-            "success": resp.status_code < 300,
-            "status_code": resp.status_code,
-            "response": resp.text,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "status_code": 0,
-            "response": str(e),
-            "timestamp": datetime.utcnow().isoformat()
-        }
+if TELEMETRY_METRICS_PORT:
+    get_metrics_server(TELEMETRY_METRICS_HOST, int(TELEMETRY_METRICS_PORT))
+
+@st.cache_resource
+def get_circuit_breakers():
+    """Endpoint circuit breakers shared by all sessions"""
+    return CircuitBreakerRegistry()
+
+BREAKER_BADGES = {
+    "closed": ("status-success", "🟢 Closed"),
+    "half-open": ("status-pending", "🟡 Half-open"),
+    "open": ("status-error", "🔴 Open")
+}
+
+def circuit_badge_html(url, ceiling=30):
+    """Status badge with an endpoint's breaker state and current timeout, for webhook cards"""
+    breaker = get_circuit_breakers().get(url).snapshot(ceiling)
+    badge_class, label = BREAKER_BADGES[breaker["state"]]
+    if breaker["state"] == "open":
+        detail = f"failing fast · probe in {breaker['retry_in']:.0f}s"
+    elif breaker["samples"] >= ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+        detail = f"timeout {breaker['timeout']:.1f}s (p95 {breaker['p95']:.2f}s)"
+    else:
+        detail = f"timeout {breaker['timeout']:.0f}s"
+    return f"<span class='status-badge {badge_class}'>{label}</span> <span style='font-size: 0.8rem; color: #666;'>{detail}</span>"
+
+@st.cache_resource
+def get_webhook_response_cache():
+    """The webhook response memo shared by all sessions"""
+    return WebhookResponseCache()
+
+# ==========================================
+# CODE LIBRARY SEARCH
+# ==========================================
+# Frames the sheet cache no longer holds get their index built in the background, shared by sessions
+SEARCH_INDEX_BUILDS_MAX = 4
+
+def build_search_index(df):
+    search_index = CodeSearchIndex()
+    search_index.rebuild(df)
+    return search_index
+
+class SearchIndexBuilds:
+    """
+    Search indexes being built on the loader pool for frames that are not (or no
+    longer) in the shared sheet cache, keyed by frame so sessions holding the same
+    frame share one build. Only the most recent max_entries frames are kept.
+    """
+
+    def __init__(self, max_entries=SEARCH_INDEX_BUILDS_MAX):
+        self.max_entries = max_entries
+        self._builds = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, df, executor):
+        """The build future for df, submitting one if there is none yet"""
+        with self._lock:
+            build = self._builds.get(id(df))
+            # A failed build is submitted again
+            if build is not None and build[0] is df and not (build[1].done() and build[1].exception()):
+                self._builds.move_to_end(id(df))
+                return build[1]
+            future = executor.submit(build_search_index, df)
+            self._builds[id(df)] = (df, future)
+            while len(self._builds) > self.max_entries:
+                self._builds.popitem(last=False)
+            return future
+
+@st.cache_resource
+def get_search_index_builds():
+    """Return the single SearchIndexBuilds registry shared by all sessions"""
+    return SearchIndexBuilds()
+
+def get_search_index(df):
+    """
+    Return (index, ready) for this session's frame. The shared sheet cache's index
+    is used when it belongs to this frame; otherwise one is built in the background
+    and, until it is ready, the last index this session searched (or the cache's
+    index for the newer frame) is served instead. index is None if there is none yet.
+    """
+    entry = get_sheet_cache().peek(st.session_state.sheet_url)
+    if entry is not None and entry["df"] is df and entry.get("search_index") is not None:
+        st.session_state.search_index = entry["search_index"]
+        return entry["search_index"], True
+    build = get_search_index_builds().get(df, get_sheet_load_executor())
+    if build.done() and build.exception() is None:
+        st.session_state.search_index = build.result()
+        return st.session_state.search_index, True
+    fallback = st.session_state.search_index
+    if fallback is None and entry is not None:
+        fallback = entry.get("search_index")
+    return fallback, False
+
+# ==========================================
+# HELPER FUNCTIONS
+# ==========================================
+@st.cache_resource
+def get_sheet_load_executor():
+    """Thread pool shared by all sessions for background sheet loads"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="sheet-load")
+
+def start_sheet_load(url, force_refresh=False):
+    """Kick off a background sheet load for this session"""
+    st.session_state.sheet_load_job = SheetLoadJob(url, force_refresh).start(
+        get_sheet_load_executor(), get_sheet_cache()
+    )
+
+class CodeIndex:
+    """
+    Selector lookups for one code library frame, built once per load:
+    Category -> sorted Numbers, plus Number -> position in each selector list.
+    """
+
+    def __init__(self, df):
+        self.frame = df
+        numbers = df.index.to_numpy()
+        self.all_numbers = sorted(numbers.tolist())
+        self.by_category = {}
+        if 'Category' in df.columns:
+            for category, rows in df.groupby('Category', observed=True, sort=False).indices.items():
+                self.by_category[category] = sorted(numbers[rows].tolist())
+        self.categories = sorted(self.by_category)
+        self._positions = {}
+
+    def numbers_for(self, category=None):
+        if category is None:
+            return self.all_numbers
+        return self.by_category.get(category, [])
+
+    def selector_position(self, category, number):
+        """Position of number in the selector list for category, or 0 if it is not listed"""
+        positions = self._positions.get(category)
+        if positions is None:
+            positions = {n: i for i, n in enumerate(self.numbers_for(category))}
+            self._positions[category] = positions
+        return positions.get(number, 0)
+
+def get_code_index(df):
+    """Return this session's CodeIndex, rebuilding it only when code_data has changed"""
+    code_index = st.session_state.code_index
+    if code_index is None or code_index.frame is not df:
+        code_index = CodeIndex(df)
+        st.session_state.code_index = code_index
+    return code_index
+
+def apply_loaded_sheet(df, stats):
+    """Store a finished sheet load in session state and select its first entry"""
+    st.session_state.code_data = df
+    st.session_state.data_load_stats = stats
+    
+    if not df.empty:
+        st.session_state.selected_code_number = int(df.index[0])
+        st.session_state.current_code = df.loc[st.session_state.selected_code_number]['Code']
+        st.session_state.selected_code_row = df.loc[st.session_state.selected_code_number].to_dict()
+    else:
+        st.session_state.current_code = "<h1>No Data</h1><p>Please provide a valid Google Sheet URL.</p>"
+        st.session_state.selected_code_row = {'Title': 'No Data', 'Category': 'Error', 'Description': 'No data available'}
 
 def add_to_chat_history(role, content, metadata=None):
     """Add message to chat history with timestamp"""
@@ -408,244 +617,668 @@ def add_to_chat_history(role, content, metadata=None):
         "metadata": metadata or {}
     })
 
-def clean_html_for_download(html_content):
-    """Clean HTML content for download - embed CSS properly"""
-    css_pattern = r'<style[^>]*>(.*?)</style>'
-    css_matches = re.findall(css_pattern, html_content, re.DOTALL)
-    
-    # Remove script tags completely for security
-    html_content = re.sub(r'<script[^>]*>.*?</script>', '', html_content, flags=re.DOTALL)
-    
-    # Embed CSS properly in head
-    if css_matches:
-        combined_css = '\n'.join(css_matches)
-        html_content = re.sub(css_pattern, '', html_content, flags=re.DOTALL)
+def cached_prettify_html(html_content):
+    """prettify_html memoized by content hash in the shared prettify cache"""
+    cache = get_prettify_cache()
+    key = content_hash(html_content)
+    prettified = cache.get(key)
+    if prettified is None:
+        prettified = prettify_html(html_content)
+        cache.put(key, prettified)
+    return prettified
+
+# ==========================================
+# EXPORT WORKER POOL
+# ==========================================
+EXPORT_POOL_WORKERS = max(1, min(4, os.cpu_count() or 1))
+EXPORT_QUEUE_LIMIT = 16
+EXPORT_JOB_HISTORY = 200
+# Spooled exports and bulk ZIPs no cached artifact refers to are deleted after this long
+EXPORT_SPOOL_TTL_SECONDS = 6 * 60 * 60
+
+def export_key(kind, html_content, title):
+    """Artifact cache key for one export of html_content"""
+    return (kind, content_hash(html_content), title)
+
+def export_download_button(artifact, **button_args):
+    """
+    st.download_button for an export artifact. Spooled exports are passed as a
+    deferred callable that opens the file, so nothing is read until the button is clicked.
+    """
+    if isinstance(artifact, SpooledExport):
+        if not artifact.exists():
+            st.caption("This export was evicted from the cache; select the entry again to re-render it.")
+            return False
+        return st.download_button(data=artifact.open, **button_args)
+    return st.download_button(data=artifact, **button_args)
+
+def purge_stale_exports():
+    """Delete expired spooled exports and bulk ZIPs, keeping those still in the artifact cache"""
+    keep = {artifact.path for artifact in get_export_artifact_cache().values() if isinstance(artifact, SpooledExport)}
+    return purge_spooled_exports(EXPORT_SPOOL_TTL_SECONDS, keep)
+
+class ExportService:
+    """
+    Runs PDF/HTML exports on a bounded worker pool. Each submission gets a job ID
+    whose status the script thread polls; finished artifacts land in the shared
+    artifact cache. Submissions are refused once queue_limit jobs are pending.
+    """
+
+    def __init__(self, artifacts, workers=EXPORT_POOL_WORKERS, queue_limit=EXPORT_QUEUE_LIMIT):
+        self.artifacts = artifacts
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def get_executor(self):
+        """
+        The worker processes, started on first use. Workers are fresh interpreters
+        that import html_export (forkserver where available, else spawn): forking the
+        multi-threaded server could copy locks other threads hold at that moment.
+        """
+        with self._lock:
+            if self._executor is None:
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload(["html_export"])
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def _reset_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _pending_count(self):
+        return sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+
+    def submit(self, kind, html_content, title):
+        """Queue an export and return its job ID, or None when the queue is full"""
+        key = export_key(kind, html_content, title)
+        now = time.time()
+        with self._lock:
+            if key in self._inflight:
+                return self._inflight[key]
+            job_id = uuid.uuid4().hex[:8]
+            job = {
+                "id": job_id,
+                "kind": kind,
+                "title": title,
+                "key": key,
+                "status": "queued",
+                "submitted_at": now,
+                "finished_at": None,
+                "render_time": None,
+                "wait_time": None,
+                "error": None,
+                "future": None
+            }
+            if self.artifacts.peek(key) is not None:
+                job.update(status="cached", finished_at=now, render_time=0.0, wait_time=0.0)
+            elif self._pending_count() >= self.queue_limit:
+                self.rejected += 1
+                return None
+            self._jobs[job_id] = job
+            while len(self._jobs) > EXPORT_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+            if job["status"] == "cached":
+                return job_id
+            self._inflight[key] = job_id
         
-        if '<head>' in html_content:
-            html_content = html_content.replace('<head>', f'<head>\n<style>\n{combined_css}\n</style>')
-        elif '<html>' in html_content:
-            html_content = html_content.replace('<html>', f'<html>\n<head>\n<style>\n{combined_css}\n</style>\n</head>')
+        executor = self.get_executor()
+        try:
+            future = executor.submit(render_export, kind, html_content, title)
+        except Exception as e:
+            # A crashed worker breaks the whole process pool; start a fresh one next time
+            self._reset_executor(executor)
+            with self._lock:
+                job.update(status="failed", error=str(e), finished_at=time.time())
+                self._inflight.pop(key, None)
+            return job_id
+        job["future"] = future
+        future.add_done_callback(lambda done: self._finish(job, done))
+        return job_id
+
+    def _finish(self, job, future):
+        finished_at = time.time()
+        try:
+            data, render_time = future.result()
+            self.artifacts.put(job["key"], data)
+            status, error = "done", None
+        except Exception as e:
+            render_time, status, error = None, "failed", str(e)
+        with self._lock:
+            total = finished_at - job["submitted_at"]
+            job.update(
+                status=status,
+                error=error,
+                finished_at=finished_at,
+                render_time=render_time,
+                wait_time=max(0.0, total - (render_time or 0.0))
+            )
+            self._inflight.pop(job["key"], None)
+
+    def status(self, job_id):
+        """Snapshot of a job (without its future), or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {name: value for name, value in job.items() if name != "future"}
+        if snapshot["status"] == "queued" and job["future"] is not None and job["future"].running():
+            snapshot["status"] = "running"
+        end = snapshot["finished_at"] or time.time()
+        snapshot["elapsed"] = end - snapshot["submitted_at"]
+        return snapshot
+
+    def result(self, job_id):
+        """The finished artifact for a job, served from the artifact cache"""
+        job = self.status(job_id)
+        if job is None or job["status"] not in ("done", "cached"):
+            return None
+        return self.artifacts.peek(job["key"])
+
+    def metrics(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        rendered = [job for job in jobs if job["status"] == "done"]
+        return {
+            "pending": sum(1 for job in jobs if job["status"] == "queued"),
+            "done": len(rendered),
+            "cached": sum(1 for job in jobs if job["status"] == "cached"),
+            "failed": sum(1 for job in jobs if job["status"] == "failed"),
+            "rejected": self.rejected,
+            "avg_render_time": sum(job["render_time"] for job in rendered) / len(rendered) if rendered else 0.0,
+            "avg_wait_time": sum(job["wait_time"] for job in rendered) / len(rendered) if rendered else 0.0
+        }
+
+@st.cache_resource
+def get_export_service():
+    """The export worker pool shared by all sessions"""
+    # Runs once per server process: clear out temp files earlier processes left behind
+    purge_stale_exports()
+    return ExportService(get_export_artifact_cache())
+
+def request_export(kind, html_content, title, submit=True):
+    """
+    Return this session's export job status for (kind, content, title), submitting
+    a new job when none exists and submit is True (or the artifact is already
+    cached). Only the latest job per kind is remembered, so a job for superseded
+    content is forgotten. A refused submission returns {"status": "rejected"} so
+    the caller can ask the user to retry; None means nothing was requested yet.
+    """
+    service = get_export_service()
+    key = export_key(kind, html_content, title)
+    latest = st.session_state.export_job_ids.get(kind)
+    job = service.status(latest[1]) if latest is not None and latest[0] == key else None
+    if job is not None and job["status"] in ("done", "cached") and service.artifacts.peek(key) is None:
+        # The artifact was evicted from the cache since; render it again
+        job = None
+    if job is None and (submit or service.artifacts.peek(key) is not None):
+        job_id = service.submit(kind, html_content, title)
+        if job_id is None:
+            return {"status": "rejected"}
+        st.session_state.export_job_ids[kind] = (key, job_id)
+        job = service.status(job_id)
+    return job
+
+def export_job_pending(job):
+    return job is not None and job["status"] in ("queued", "running")
+
+class BulkExportJob:
+    """
+    Renders many code entries to a ZIP on a coordinator thread. Documents fan out to
+    the export pool with a bounded in-flight window and are written into the archive
+    (a temp file) as they complete, so only a handful of rendered files are in memory.
+    """
+
+    def __init__(self, rows, formats, label):
+        self.rows = rows
+        self.formats = formats
+        self.label = label
+        self.total = len(rows) * len(formats)
+        self.completed = 0
+        self.failed = []
+        self.path = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._future = None
+
+    def start(self, coordinator, pool, render):
+        self._future = coordinator.submit(self._run, pool, render)
+        return self
+
+    def _run(self, pool, render):
+        handle = tempfile.NamedTemporaryFile(prefix="code-export-", suffix=".zip", delete=False)
+        handle.close()
+        self.path = handle.name
+        window = max(2, EXPORT_POOL_WORKERS * 2)
+        tasks = ((number, title, code, kind) for number, title, code in self.rows for kind in self.formats)
+        pending = {}
+        try:
+            with zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                while True:
+                    for task in tasks:
+                        number, title, code, kind = task
+                        pending[pool.submit(render, kind, code, title)] = task
+                        if len(pending) >= window:
+                            break
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        number, title, code, kind = pending.pop(future)
+                        try:
+                            data, _ = future.result()
+                            safe_title = re.sub(r'[^A-Za-z0-9_-]+', '_', str(title)).strip('_') or "document"
+                            entry_name = f"{kind}/{number}_{safe_title}.{kind}"
+                            if isinstance(data, SpooledExport):
+                                archive.write(data.path, entry_name)
+                                data.discard()
+                            else:
+                                archive.writestr(entry_name, data)
+                        except Exception as e:
+                            self.failed.append({"Number": number, "Title": title, "Format": kind.upper(), "Error": str(e)})
+                        self.completed += 1
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    def done(self):
+        return self._future is not None and self._future.done()
+
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def throughput(self):
+        elapsed = self.elapsed()
+        return self.completed / elapsed if elapsed else 0.0
+
+    def cleanup(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+@st.cache_resource
+def get_bulk_export_coordinator():
+    """Threads that drive bulk exports, shared by all sessions"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="bulk-export")
+
+def start_bulk_export(df, numbers, formats, label):
+    """Replace this session's bulk export (if any) with a new one over the given Numbers"""
+    previous = st.session_state.bulk_export_job
+    if previous is not None and previous.done():
+        previous.cleanup()
+    purge_stale_exports()
+    subset = df.loc[numbers]
+    rows = list(zip(subset.index.tolist(), subset['Title'].tolist(), subset['Code'].tolist()))
+    st.session_state.bulk_export_job = BulkExportJob(rows, formats, label).start(
+        get_bulk_export_coordinator(), get_export_service().get_executor(), render_export
+    )
+
+def export_status_caption(job):
+    """One-line status for an export job"""
+    if job["status"] == "cached":
+        return f"Job {job['id']} · served from artifact cache"
+    if job["status"] == "done":
+        return f"Job {job['id']} · rendered in {job['render_time']:.2f}s (waited {job['wait_time']:.2f}s)"
+    if job["status"] == "failed":
+        return f"Job {job['id']} · failed: {job['error']}"
+    return f"Job {job['id']} · {job['status']} for {job['elapsed']:.1f}s"
+
+EXPORT_POLL_SECONDS = 0.5
+
+def request_html_exports(code, title, submit=False):
+    """The plain HTML job and, when minifying is on, the html-min job (else None)"""
+    html_job = request_export("html", code, title, submit)
+    min_job = request_export("html-min", code, title, submit) if st.session_state.optimize_html_export else None
+    return html_job, min_job
+
+def render_html_download(code, title, file_stem):
+    html_job, min_job = request_html_exports(code, title)
+    service = get_export_service()
+    html_data = service.result(html_job["id"]) if html_job and html_job.get("id") else None
+    download_job = min_job if st.session_state.optimize_html_export else html_job
+    download_data = service.result(download_job["id"]) if download_job and download_job.get("id") else None
+    if download_data is not None:
+        if min_job is not None and html_data is not None:
+            plain_size, optimized_size = artifact_size(html_data), artifact_size(download_data)
+            st.caption(f"Size: {plain_size / 1024:.1f} KB → {optimized_size / 1024:.1f} KB "
+                       f"({(optimized_size - plain_size) / max(plain_size, 1):+.0%})")
+        export_download_button(
+            download_data,
+            label="🌐 Download HTML",
+            file_name=f"{file_stem}.html",
+            mime="text/html",
+            help="Download as HTML file with embedded CSS",
+            use_container_width=True
+        )
+    elif export_job_pending(html_job) or export_job_pending(min_job):
+        st.button("⏳ Preparing HTML...", use_container_width=True, disabled=True)
+    elif st.button("🌐 Prepare HTML", use_container_width=True,
+                   help="Clean up (and minify, if enabled) this entry for download in the background"):
+        jobs = request_html_exports(code, title, submit=True)
+        if any(job is not None and job["status"] == "rejected" for job in jobs):
+            st.warning("⚠️ The export queue is full. Please try again in a moment.")
         else:
-            html_content = f'<!DOCTYPE html>\n<html>\n<head>\n<style>\n{combined_css}\n</style>\n</head>\n<body>\n{html_content}\n</body>\n</html>'
-    
-    return html_content
+            st.rerun()
+    for job in (html_job, min_job):
+        if job is not None and job["status"] == "failed":
+            st.caption(export_status_caption(job))
 
-def prettify_html(html_content):
-    """Prettify HTML/CSS content for better readability"""
-    html_content = re.sub(r'(?<=>)(<[^/])', r'\n\1', html_content)
-    html_content = re.sub(r'(?<=/?>)(<)', r'\n\1', html_content)
-    
-    lines = html_content.split('\n')
-    indent_level = 0
-    prettified_lines = []
+def render_pdf_download(code, title, file_stem):
+    if not REPORTLAB_AVAILABLE:
+        st.button("📄 Download PDF", use_container_width=True, disabled=True,
+                  help="ReportLab not installed or PDF generation failed.")
+        return
+    pdf_job = request_export("pdf", code, title, submit=False)
+    if pdf_job is None:
+        if st.button("📄 Prepare PDF", use_container_width=True,
+                     help="Render this entry as a formatted PDF document in the background"):
+            pdf_job = request_export("pdf", code, title)
+            if pdf_job["status"] == "rejected":
+                st.warning("⚠️ The export queue is full. Please try again in a moment.")
+            else:
+                st.rerun()
+        return
+    pdf_data = get_export_service().result(pdf_job["id"]) if pdf_job.get("id") else None
+    if pdf_data:
+        export_download_button(
+            pdf_data,
+            label="📄 Download PDF",
+            file_name=f"{file_stem}.pdf",
+            mime="application/pdf",
+            help="Download as formatted PDF document",
+            use_container_width=True
+        )
+    elif pdf_job.get("id"):
+        st.button("⏳ Rendering PDF...", use_container_width=True, disabled=True)
+    if pdf_job.get("id"):
+        st.caption(export_status_caption(pdf_job))
+
+def exports_pending(code, title):
+    """True while an HTML or PDF export of this content is queued or running"""
+    jobs = request_html_exports(code, title) + (request_export("pdf", code, title, submit=False),)
+    return any(export_job_pending(job) for job in jobs)
+
+def render_export_downloads(code, title, file_stem):
+    """
+    HTML and PDF download buttons. Exports are only rendered when the user asks for
+    them, or served straight from the artifact cache. While one renders, this area
+    runs as a fragment that reruns by itself every EXPORT_POLL_SECONDS instead of
+    rerunning the whole page.
+    """
+    polling = exports_pending(code, title)
+    page_run = True
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        if line.startswith('</') or line.startswith('}'):
-            indent_level = max(0, indent_level - 1)
-        
-        prettified_lines.append('    ' * indent_level + line)
-        
-        if not line.startswith('</') and not line.startswith('}') and ('<' in line and '>' in line) and not line.endswith('/>'):
-            if not line.startswith('<br') and not line.startswith('<hr'):
-                indent_level += 1
+    def draw():
+        nonlocal page_run
+        html_col, pdf_col = st.columns(2)
+        with html_col:
+            render_html_download(code, title, file_stem)
+        with pdf_col:
+            render_pdf_download(code, title, file_stem)
+        if polling and not page_run and not exports_pending(code, title):
+            # Finished: one page rerun registers the fragment again without its timer
+            st.rerun()
+        page_run = False
     
-    return '\n'.join(prettified_lines)
+    st.fragment(draw, run_every=EXPORT_POLL_SECONDS if polling else None)()
 
-def generate_pdf_from_html(html_content, title="Document"):
-    """Generate PDF from HTML with enhanced formatting"""
-    if not REPORTLAB_AVAILABLE:
-        return None
-    
-    class EnhancedHTMLParser(HTMLParser):
-        def __init__(self):
-            super().__init__()
-            self.content = []
-            self.current_text = ""
-            self.in_title = False
-            self.in_header = False
-            self.in_paragraph = False
-            self.in_list = False
-            self.in_table = False
-            self.header_level = 1
-            self.list_items = []
-            self.table_rows = []
-            self.current_row = []
-        
-        def handle_starttag(self, tag, attrs):
-            if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                self.in_header = True
-                self.header_level = int(tag[1])
-            elif tag == 'p':
-                self.in_paragraph = True
-            elif tag in ['ul', 'ol']:
-                self.in_list = True
-                self.list_items = []
-            elif tag == 'li':
-                self.current_text = ""
-            elif tag == 'title':
-                self.in_title = True
-            elif tag == 'table':
-                self.in_table = True
-                self.table_rows = []
-            elif tag == 'tr':
-                self.current_row = []
-            elif tag == 'br':
-                self.current_text += "\n"
-        
-        def handle_endtag(self, tag):
-            if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                if self.current_text.strip():
-                    self.content.append(('header', self.current_text.strip(), self.header_level))
-                self.current_text = ""
-                self.in_header = False
-            elif tag == 'p':
-                if self.current_text.strip():
-                    self.content.append(('paragraph', self.current_text.strip()))
-                self.current_text = ""
-                self.in_paragraph = False
-            elif tag in ['ul', 'ol']:
-                if self.list_items:
-                    self.content.append(('list', self.list_items))
-                self.in_list = False
-            elif tag == 'li':
-                if self.current_text.strip():
-                    self.list_items.append(self.current_text.strip())
-                self.current_text = ""
-            elif tag == 'title':
-                self.in_title = False
-            elif tag == 'table':
-                if self.table_rows:
-                    self.content.append(('table', self.table_rows))
-                self.in_table = False
-            elif tag == 'tr':
-                if self.current_row:
-                    self.table_rows.append(self.current_row)
-            elif tag in ['td', 'th']:
-                if self.current_text.strip():
-                    self.current_row.append(self.current_text.strip())
-                self.current_text = ""
-        
-        def handle_data(self, data):
-            if not self.in_title:
-                self.current_text += data
-        
-        def get_content(self):
-            if self.current_text.strip():
-                self.content.append(('paragraph', self.current_text.strip()))
-            return self.content
+# ==========================================
+# LIVE PREVIEW
+# ==========================================
+PREVIEW_UPDATE_MODES = ["Debounced", "Instant"]
+PREVIEW_DEBOUNCE_SECONDS = 0.75
+
+def record_code_edit(edited_code):
+    """
+    Store an edit from the code editor. The preview is drawn after the editor, so
+    instant mode shows the edit in the same run; debounced mode catches up once
+    edits go quiet.
+    """
+    st.session_state.current_code = edited_code
+    st.session_state.last_code_edit_at = time.time()
+    st.session_state.preview_stats["edits"] += 1
+
+def sync_live_preview(code):
+    """
+    Hand the preview new content when the code's hash changes (in debounced mode,
+    once edits have been quiet for PREVIEW_DEBOUNCE_SECONDS). Returns True while
+    the preview is still holding back the latest edit.
+    """
+    stats = st.session_state.preview_stats
+    code_hash = content_hash(code)
+    if code_hash == st.session_state.preview_hash:
+        stats["reused"] += 1
+        st.session_state.last_code_edit_at = 0.0
+        return False
+    quiet_for = time.time() - st.session_state.last_code_edit_at
+    if (st.session_state.preview_update_mode == "Debounced" and st.session_state.preview_hash is not None
+            and quiet_for < PREVIEW_DEBOUNCE_SECONDS):
+        return True
+    st.session_state.preview_code = code
+    st.session_state.preview_hash = code_hash
+    stats["renders"] += 1
+    if st.session_state.last_code_edit_at:
+        stats["last_edit_latency"] = quiet_for
+        st.session_state.last_code_edit_at = 0.0
+    return False
+
+def render_live_preview(code):
+    """
+    Live Preview iframe. The iframe is only handed new content when the code's hash
+    changes, so unrelated reruns leave it untouched instead of reloading it. While a
+    debounced edit is held back the preview runs as a fragment that reruns by itself
+    every PREVIEW_DEBOUNCE_SECONDS, without rerunning the rest of the page.
+    """
+    ticking = sync_live_preview(code)
+    page_run = True
     
-    try:
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch, bottomMargin=1*inch)
-        
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Title'],
-            fontSize=24,
-            spaceAfter=30,
-            textColor=colors.HexColor('#2c3e50'),
-            alignment=TA_CENTER
-        )
-        
-        heading_styles = {
-            1: ParagraphStyle('CustomH1', parent=styles['Heading1'], fontSize=20, spaceAfter=20, textColor=colors.HexColor('#34495e')),
-            2: ParagraphStyle('CustomH2', parent=styles['Heading2'], fontSize=18, spaceAfter=18, textColor=colors.HexColor('#34495e')),
-            3: ParagraphStyle('CustomH3', parent=styles['Heading3'], fontSize=16, spaceAfter=16, textColor=colors.HexColor('#34495e')),
-            4: ParagraphStyle('CustomH4', parent=styles['Heading4'], fontSize=14, spaceAfter=14, textColor=colors.HexColor('#34495e')),
-            5: ParagraphStyle('CustomH5', parent=styles['Heading5'], fontSize=12, spaceAfter=12, textColor=colors.HexColor('#34495e')),
-            6: ParagraphStyle('CustomH6', parent=styles['Heading6'], fontSize=11, spaceAfter=11, textColor=colors.HexColor('#34495e'))
-        }
+    def draw():
+        nonlocal page_run
+        stats = st.session_state.preview_stats
+        # Timer reruns of the fragment skip the page script, so they read the code from session state
+        waiting = ticking if page_run else sync_live_preview(st.session_state.current_code)
+        page_run = False
+        started = time.time()
+        st.components.v1.html(st.session_state.preview_code, height=700, scrolling=True)
+        stats["render_time"] += time.time() - started
+        stats["reruns"] += 1
         
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['Normal'],
-            fontSize=11,
-            spaceAfter=12,
-            leading=14,
-            textColor=colors.HexColor('#2c3e50'),
-            alignment=TA_JUSTIFY
-        )
-        
-        list_style = ParagraphStyle(
-            'CustomList',
-            parent=styles['Normal'],
-            fontSize=11,
-            leftIndent=20,
-            spaceAfter=6,
-            leading=14,
-            textColor=colors.HexColor('#2c3e50')
-        )
-        
-        parser = EnhancedHTMLParser()
-        parser.feed(html_content)
-        content_elements = parser.get_content()
-        
-        story = []
-        story.append(Paragraph(title, title_style))
-        story.append(Spacer(1, 20))
-        
-        for element in content_elements:
-            if element[0] == 'header':
-                level = element[2] if len(element) > 2 else 1
-                style = heading_styles.get(level, heading_styles[1])
-                story.append(Paragraph(element[1], style))
-            
-            elif element[0] == 'paragraph':
-                text = element[1].replace('&nbsp;', ' ').replace('&amp;', '&')
-                story.append(Paragraph(text, body_style))
-            
-            elif element[0] == 'list':
-                for item in element[1]:
-                    story.append(Paragraph(f"• {item}", list_style))
-                story.append(Spacer(1, 10))
+        caption = (f"Preview: {stats['renders']} renders for {stats['edits']} edits · "
+                   f"{stats['reused']} reruns reused the last render · "
+                   f"{stats['render_time'] / stats['reruns'] * 1000:.1f} ms per rerun")
+        if stats["last_edit_latency"] is not None:
+            caption += f" · last edit shown after {stats['last_edit_latency']:.2f}s"
+        if waiting:
+            caption += " · ⏳ waiting for edits to settle"
+        st.caption(caption)
+        if ticking and not waiting:
+            # Caught up: one page rerun registers the fragment again without its timer
+            st.rerun()
+    
+    st.fragment(draw, run_every=PREVIEW_DEBOUNCE_SECONDS if ticking else None)()
+
+# ==========================================
+# WEBHOOK BATCH DISPATCH
+# ==========================================
+BATCH_PER_ENDPOINT_CONCURRENCY = 4
+BATCH_REQUEST_TIMEOUT_SECONDS = 30
+BATCH_MAX_WORKERS = 32
+
+def webhook_prompt_payload(name, text):
+    """
+    Payload for a prompt sent to the named webhook. Chat and batch sends share it,
+    so the same prompt gets the same response cache key whichever one sends it.
+    """
+    return {
+        "title": f"{name} - Custom Prompt",
+        "type": "text",
+        "text": text,
+        "category": name,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def build_batch_items(webhook_names, rows=None):
+    """
+    One request per prompt: every example of each named webhook, or every row of
+    field values (e.g. from an uploaded CSV) for a single webhook when rows is given.
+    Returns (items, skipped); skipped lists the examples/rows whose values lack a
+    field the prompt template needs.
+    """
+    items = []
+    skipped = []
+    for name in webhook_names:
+        info = WEBHOOKS[name]
+        for number, values in enumerate(info["examples"] if rows is None else rows, start=1):
+            try:
+                prompt = info["prompt_template"].format(**values)
+            except KeyError as e:
+                skipped.append({
+                    "webhook": name,
+                    "source": f"{'example' if rows is None else 'row'} {number}",
+                    "field": e.args[0]
+                })
+                continue
+            items.append({
+                "webhook": name,
+                "url": info["url"],
+                "payload": webhook_prompt_payload(name, prompt)
+            })
+    return items, skipped
+
+class WebhookBatchJob:
+    """
+    Sends a list of webhook requests from an asyncio event loop on a background
+    thread. A semaphore per endpoint URL bounds how many requests hit each endpoint
+    at once; the blocking sends run on a thread pool over the shared HTTP client.
+    The script thread collects finished results with drain() as they complete.
+    """
+
+    def __init__(self, items, per_endpoint=BATCH_PER_ENDPOINT_CONCURRENCY, timeout=BATCH_REQUEST_TIMEOUT_SECONDS,
+                 cache=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.items = items
+        self.per_endpoint = per_endpoint
+        self.timeout = timeout
+        self.cache = cache
+        self.total = len(items)
+        self.latencies = []
+        self.succeeded = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self._results = []
+        self._drained = 0
+        self._lock = threading.Lock()
+        self._future = None
+
+    def start(self, executor, client, breakers):
+        self._future = executor.submit(self._run, client, breakers)
+        return self
+
+    def _run(self, client, breakers):
+        try:
+            asyncio.run(self._dispatch(client, breakers))
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    async def _dispatch(self, client, breakers):
+        loop = asyncio.get_running_loop()
+        semaphores = {url: asyncio.Semaphore(self.per_endpoint) for url in {item["url"] for item in self.items}}
+        workers = max(1, min(BATCH_MAX_WORKERS, len(semaphores) * self.per_endpoint))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook-batch") as pool:
             
-            elif element[0] == 'table':
-                if element[1]:
-                    table_data = element[1]
-                    table = Table(table_data)
-                    table.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f8f9fa')),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-                        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, 0), (-1, 0), 10),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#2c3e50')),
-                        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                        ('FONTSIZE', (0, 1), (-1, -1), 9),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#dee2e6'))
-                    ]))
-                    story.append(table)
-                    story.append(Spacer(1, 15))
-        
-        if not story or len(story) <= 2:
-            clean_text = re.sub(r'<[^>]+>', ' ', html_content)
-            clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+            async def send(item):
+                async with semaphores[item["url"]]:
+                    started = time.time()
+                    request = loop.run_in_executor(pool, send_webhook, item["url"], item["payload"], client, breakers, self.timeout, self.cache)
+                    done, _ = await asyncio.wait({request}, timeout=self.timeout)
+                    if done:
+                        response_data = request.result()
+                    else:
+                        response_data = {
+                            "success": False,
+                            "status_code": 0,
+                            "response": f"Timed out after {self.timeout}s",
+                            "timestamp": datetime.utcnow().isoformat()
+                        }
+                    latency = time.time() - started
+                    response_data.update(webhook=item["webhook"], url=item["url"], batch_id=self.id, latency=latency)
+                    with self._lock:
+                        self._results.append(response_data)
+                        self.latencies.append(latency)
+                        self.succeeded += bool(response_data["success"])
+                    if not done:
+                        # Keep the endpoint's slot until the abandoned request really ends
+                        await asyncio.wait({request})
             
-            if clean_text:
-                paragraphs = [p.strip() for p in clean_text.split('\n') if p.strip()]
-                if not paragraphs:
-                    paragraphs = [clean_text[:1000] + "..." if len(clean_text) > 1000 else clean_text]
-                
-                for para in paragraphs:
-                    if para:
-                        story.append(Paragraph(para, body_style))
-                        story.append(Spacer(1, 12))
-        
-        doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
-    
-    except Exception as e:
-        st.error(f"Error generating PDF: {str(e)}")
-        return None
+            await asyncio.gather(*(send(item) for item in self.items))
+
+    def drain(self):
+        """Results that finished since the previous drain()"""
+        with self._lock:
+            fresh = self._results[self._drained:]
+            self._drained = len(self._results)
+        return fresh
+
+    def completed(self):
+        with self._lock:
+            return len(self._results)
+
+    def done(self):
+        return self._future is not None and self._future.done()
+
+    def summary(self):
+        with self._lock:
+            latencies = list(self.latencies)
+            succeeded = self.succeeded
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "completed": len(latencies),
+            "succeeded": succeeded,
+            "elapsed": elapsed,
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50": latency_percentile(latencies, 50),
+            "p95": latency_percentile(latencies, 95)
+        }
+
+@st.cache_resource
+def get_webhook_batch_executor():
+    """Threads that run batch event loops, shared by all sessions"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="webhook-batch-loop")
+
+def start_webhook_batch(items, per_endpoint, timeout, cache=None):
+    st.session_state.webhook_batch_job = WebhookBatchJob(items, per_endpoint, timeout, cache).start(
+        get_webhook_batch_executor(), get_http_client(), get_circuit_breakers()
+    )
+
+def collect_webhook_batch_results():
+    """Move finished batch results into webhook_history; True while the batch is still running"""
+    job = st.session_state.webhook_batch_job
+    if job is None:
+        return False
+    st.session_state.webhook_history.extend(job.drain())
+    return not job.done()
+
+# ==========================================
+# WEBHOOK OUTBOX
+# ==========================================
+@st.cache_resource
+def get_webhook_outbox():
+    """The persistent outbox and its delivery thread, shared by all sessions"""
+    return WebhookOutbox(client=get_http_client()).start()
 
 # ==========================================
 # SIDEBAR - NAVIGATION & CONFIGURATION
@@ -655,7 +1288,7 @@ with st.sidebar:
     
     app_mode = st.radio(
         "Select Mode:",
-        ["🎨 Code Viewer", "🤖 AI Webhook Chat", "📊 Data Analysis", "📤 Simple Webhook Sender"],
+        ["🎨 Code Viewer", "🤖 AI Webhook Chat", "📊 Data Analysis", "📤 Simple Webhook Sender", "📈 Webhook Telemetry"],
         label_visibility="collapsed"
     )
     
@@ -674,6 +1307,8 @@ with st.sidebar:
         st.session_state.current_conversation = []
         st.session_state.webhook_simple_history = []
         st.session_state.code_data = pd.DataFrame()
+        st.session_state.code_index = None
+        st.session_state.search_index = None
         st.session_state.uploaded_data = pd.DataFrame()
         st.session_state.selected_code_number = None
         st.session_state.current_code = "<h1>Welcome</h1><p>Please load data to begin.</p>"
@@ -702,8 +1337,34 @@ with st.sidebar:
         st.markdown("### 📊 Data Load Stats")
         st.metric("Rows Loaded", st.session_state.data_load_stats["total_rows"])
         st.metric("Load Time", f"{st.session_state.data_load_stats['load_time']:.2f}s")
+        if "fetch_time" in st.session_state.data_load_stats:
+            st.caption(f"Fetch {st.session_state.data_load_stats['fetch_time']:.2f}s · "
+                       f"Parse {st.session_state.data_load_stats['parse_time']:.2f}s · "
+                       f"Attempt {st.session_state.data_load_stats.get('attempt', 1)}")
         if st.session_state.data_load_stats["duplicates"] > 0:
             st.metric("Duplicates Found", st.session_state.data_load_stats["duplicates"])
+        
+        cache_stats = get_sheet_cache().snapshot()
+        st.caption(f"Served from: {st.session_state.data_load_stats.get('source', 'downloaded')} · "
+                   f"{st.session_state.data_load_stats.get('bytes_transferred', 0) / 1024:.1f} KB moved")
+        cache_col1, cache_col2 = st.columns(2)
+        with cache_col1:
+            st.metric("Cache Hits", cache_stats["hits"])
+        with cache_col2:
+            st.metric("Cache Misses", cache_stats["misses"])
+        st.caption(f"Hit rate {cache_stats['hit_rate']:.1f}% · {cache_stats['entries']} sheet(s) cached · TTL {SHEET_CACHE_TTL_SECONDS // 60} min")
+
+    st.markdown("---")
+    with st.expander("🔌 Webhook Connections"):
+        http_stats = get_http_client().stats()
+        conn_col1, conn_col2 = st.columns(2)
+        with conn_col1:
+            st.metric("Reused", http_stats["reused_connections"])
+        with conn_col2:
+            st.metric("New Connects", http_stats["new_connections"])
+        st.caption(f"{http_stats['calls']} requests · {http_stats['retries']} connect retries that recovered · "
+                   f"{http_stats['failures']} failed · {http_stats['pool_maxsize']} connections per host "
+                   "(set with WEBHOOK_POOL_MAXSIZE)")
 
 # ==========================================
 # MAIN CONTENT AREA
@@ -716,6 +1377,7 @@ if app_mode == "🎨 Code Viewer":
         <p>Load ALL rows from Google Sheets with enhanced data fetching, preview, edit, and download capabilities</p>
     </div>
     """, unsafe_allow_html=True)
+    search_index_pending = False
     
     col1, col2, col3 = st.columns([3, 1, 1])
     with col1:
@@ -726,43 +1388,48 @@ if app_mode == "🎨 Code Viewer":
         )
     with col2:
         st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("🔄 Load Data", use_container_width=True, type="primary"):
+        if st.button("🔄 Load Data", use_container_width=True, type="primary",
+                     disabled=st.session_state.sheet_load_job is not None):
             st.session_state.sheet_url = sheet_url_input
-            with st.spinner("Loading ALL data from Google Sheets..."):
-                df, stats = load_data_with_retry(st.session_state.sheet_url, force_refresh=False)
-                st.session_state.code_data = df
-                st.session_state.data_load_stats = stats
-                
-                if not df.empty:
-                    st.session_state.selected_code_number = df.index[0]
-                    st.session_state.current_code = df.loc[st.session_state.selected_code_number]['Code']
-                    st.session_state.selected_code_row = df.loc[st.session_state.selected_code_number].to_dict()
-                    st.success(f"✅ Successfully loaded {stats['total_rows']} rows in {stats['load_time']:.2f} seconds!")
-                else:
-                    st.session_state.current_code = "<h1>No Data</h1><p>Please provide a valid Google Sheet URL.</p>"
-                    st.session_state.selected_code_row = {'Title': 'No Data', 'Category': 'Error', 'Description': 'No data available'}
+            start_sheet_load(st.session_state.sheet_url, force_refresh=False)
             st.rerun()
     
     with col3:
         st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("🔃 Force Refresh", use_container_width=True):
+        if st.button("🔃 Force Refresh", use_container_width=True,
+                     disabled=st.session_state.sheet_load_job is not None):
             st.session_state.force_refresh_counter += 1
-            with st.spinner("Force refreshing data (bypassing cache)..."):
-                df, stats = load_data_with_retry(st.session_state.sheet_url, force_refresh=True)
-                st.session_state.code_data = df
-                st.session_state.data_load_stats = stats
-                
-                if not df.empty:
-                    st.session_state.selected_code_number = df.index[0]
-                    st.session_state.current_code = df.loc[st.session_state.selected_code_number]['Code']
-                    st.session_state.selected_code_row = df.loc[st.session_state.selected_code_number].to_dict()
-                    st.success(f"✅ Force refreshed {stats['total_rows']} rows in {stats['load_time']:.2f} seconds!")
+            start_sheet_load(st.session_state.sheet_url, force_refresh=True)
             st.rerun()
     
+    sheet_load_job = st.session_state.sheet_load_job
+    if sheet_load_job is not None:
+        if sheet_load_job.done():
+            st.session_state.sheet_load_job = None
+            df, stats = sheet_load_job.result()
+            apply_loaded_sheet(df, stats)
+            if not df.empty:
+                source_note = f" ({stats['source']})" if stats.get("source") else ""
+                verb = "Force refreshed" if sheet_load_job.force_refresh else "Successfully loaded"
+                st.success(f"✅ {verb} {stats['total_rows']} rows in {stats['load_time']:.2f} seconds{source_note}!")
+        else:
+            load_progress = sheet_load_job.progress()
+            if load_progress["phase"] == "retrying":
+                st.warning(f"⚠️ Attempt {load_progress['attempt']} of {load_progress['max_attempts']} failed "
+                           f"({load_progress.get('message', 'unknown error')}). "
+                           f"Retrying in {load_progress['wait']:.1f} seconds...")
+            else:
+                st.info(f"⏳ {load_progress['phase'].capitalize()} sheet data · attempt {load_progress['attempt']} · "
+                        f"{load_progress['rows']:,} rows · {load_progress['bytes_read'] / 1024:.0f} KB · "
+                        f"{load_progress['elapsed']:.1f}s elapsed")
+    
+    if st.session_state.data_load_stats.get("error"):
+        st.error(st.session_state.data_load_stats["error"])
+    
     if st.session_state.data_load_stats.get("total_rows", 0) > 0:
         st.markdown("---")
         st.markdown("### 📊 Data Statistics")
-        stat_col1, stat_col2, stat_col3, stat_col4 = st.columns(4)
+        stat_col1, stat_col2, stat_col3, stat_col4, stat_col5, stat_col6 = st.columns(6)
         
         with stat_col1:
             st.markdown(f"""
@@ -789,12 +1456,29 @@ if app_mode == "🎨 Code Viewer":
             """, unsafe_allow_html=True)
         
         with stat_col4:
+            row_diff = st.session_state.data_load_stats.get('diff', {})
+            st.markdown(f"""
+            <div class="data-stat-card">
+                <h3>+{row_diff.get('inserted', 0)} ~{row_diff.get('updated', 0)} -{row_diff.get('deleted', 0)}</h3>
+                <p>Rows Inserted / Updated / Deleted</p>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with stat_col5:
             st.markdown(f"""
             <div class="data-stat-card">
                 <h3>{len(st.session_state.data_load_stats.get('columns', []))}</h3>
                 <p>Columns</p>
             </div>
             """, unsafe_allow_html=True)
+        
+        with stat_col6:
+            st.markdown(f"""
+            <div class="data-stat-card">
+                <h3>{st.session_state.data_load_stats.get('bytes_per_row', 0) / 1024:.2f} KB</h3>
+                <p>Memory per Row</p>
+            </div>
+            """, unsafe_allow_html=True)
 
     df = st.session_state.code_data
     
@@ -820,27 +1504,89 @@ if app_mode == "🎨 Code Viewer":
             st.warning("⚠️ Edit mode disabled due to edit lock")
             st.session_state.edit_mode = False
         
-        if 'Category' in df.columns:
-            categories = ["All Categories"] + sorted(list(df['Category'].unique()))
+        if st.session_state.edit_mode and st.session_state.show_live_preview:
+            st.radio("Preview updates:", PREVIEW_UPDATE_MODES, key="preview_update_mode", horizontal=True,
+                     help=f"Debounced waits until edits have been quiet for {PREVIEW_DEBOUNCE_SECONDS}s "
+                          "before refreshing the preview; Instant refreshes on every change")
+        
+        code_index = get_code_index(df)
+        selected_category = None
+        if code_index.categories:
+            categories = ["All Categories"] + code_index.categories
             selected_category = st.selectbox("Filter by Category:", categories)
+            if selected_category == "All Categories":
+                selected_category = None
+        
+        with st.expander("📦 Bulk Export"):
+            bulk_job = st.session_state.bulk_export_job
+            bulk_scope = st.radio("Export:", ["Selected category", "Whole library"], horizontal=True, key="bulk_scope")
+            bulk_formats = st.multiselect("Formats:", ["HTML", "PDF"] if REPORTLAB_AVAILABLE else ["HTML"],
+                                          default=["HTML"], key="bulk_formats")
+            bulk_numbers = code_index.numbers_for(selected_category if bulk_scope == "Selected category" else None)
+            bulk_label = (selected_category or "All Categories") if bulk_scope == "Selected category" else "Library"
+            st.caption(f"{len(bulk_numbers)} entries × {len(bulk_formats)} format(s) from {bulk_label}")
             
-            if selected_category != "All Categories":
-                df_filtered = df[df['Category'] == selected_category]
+            if st.button("🚀 Start Bulk Export", use_container_width=True,
+                         disabled=not bulk_formats or not bulk_numbers or (bulk_job is not None and not bulk_job.done())):
+                start_bulk_export(df, bulk_numbers, [fmt.lower() for fmt in bulk_formats], bulk_label)
+                st.rerun()
+            
+            if bulk_job is not None:
+                st.progress(bulk_job.completed / bulk_job.total if bulk_job.total else 1.0,
+                            text=f"{bulk_job.completed}/{bulk_job.total} documents · "
+                                 f"{bulk_job.throughput():.1f} docs/s · {bulk_job.elapsed():.1f}s")
+                if bulk_job.done():
+                    if bulk_job.error:
+                        st.error(f"Bulk export failed: {bulk_job.error}")
+                    elif not os.path.exists(bulk_job.path):
+                        st.caption("This ZIP has expired; start the bulk export again.")
+                    else:
+                        export_download_button(
+                            SpooledExport(bulk_job.path),
+                            label="📦 Download ZIP",
+                            file_name=f"{re.sub(r'[^A-Za-z0-9_-]+', '_', bulk_job.label)}_export.zip",
+                            mime="application/zip",
+                            use_container_width=True
+                        )
+                    if bulk_job.failed:
+                        st.warning(f"⚠️ {len(bulk_job.failed)} document(s) failed to export")
+                        st.dataframe(pd.DataFrame(bulk_job.failed), use_container_width=True, hide_index=True)
+        
+        search_query = st.text_input("🔍 Search code library:", key="code_search_query",
+                                     placeholder="Search titles, descriptions and code (prefixes match)...")
+        
+        entry_labels = None
+        if search_query.strip():
+            search_started = time.perf_counter()
+            search_index, search_ready = get_search_index(df)
+            search_index_pending = not search_ready
+            matches = search_index.search(search_query) if search_index is not None else []
+            search_ms = (time.perf_counter() - search_started) * 1000
+            allowed = set(code_index.numbers_for(selected_category)) if selected_category else None
+            numbers = [number for number, _ in matches
+                       if number in df.index and (allowed is None or number in allowed)]
+            entry_labels = df.loc[numbers, 'Title'].to_dict() if numbers else {}
+            if search_ready:
+                st.caption(f"{len(numbers)} match(es) in {search_ms:.1f} ms")
+            elif search_index is not None:
+                st.caption(f"{len(numbers)} match(es) in {search_ms:.1f} ms · the search index is being rebuilt, "
+                           "so recent changes may be missing")
             else:
-                df_filtered = df
+                st.caption("⏳ Building the search index...")
+            selector_index = numbers.index(st.session_state.selected_code_number) if st.session_state.selected_code_number in entry_labels else 0
         else:
-            df_filtered = df
-        
-        numbers = sorted(df_filtered['Number'].tolist())
+            numbers = code_index.numbers_for(selected_category)
+            selector_index = code_index.selector_position(selected_category, st.session_state.selected_code_number)
         
         if numbers:
-            selected_number = st.selectbox("Choose Code Entry:", numbers, 
-                                          index=numbers.index(st.session_state.selected_code_number) if st.session_state.selected_code_number in numbers else 0)
+            selected_number = st.selectbox("Choose Code Entry:", numbers, index=selector_index,
+                                          format_func=(lambda number: f"{number} – {entry_labels.get(number, '')}")
+                                          if entry_labels is not None else str)
             
             if selected_number != st.session_state.selected_code_number:
                 st.session_state.selected_code_number = selected_number
-                st.session_state.current_code = df_filtered.loc[selected_number]['Code']
-                st.session_state.selected_code_row = df_filtered.loc[selected_number].to_dict()
+                st.session_state.current_code = df.loc[selected_number]['Code']
+                st.session_state.selected_code_row = df.loc[selected_number].to_dict()
                 st.rerun()
             
             selected_row = st.session_state.selected_code_row
@@ -862,18 +1608,15 @@ if app_mode == "🎨 Code Viewer":
             
             code_to_display = current_code
             if st.session_state.code_display_mode == "Prettify":
-                code_to_display = prettify_html(current_code)
+                code_to_display = cached_prettify_html(current_code)
+                prettify_stats = get_prettify_cache().snapshot()
+                st.caption(f"Prettify cache: {prettify_stats['hit_rate']:.0f}% hit rate · "
+                           f"{prettify_stats['entries']} entries · {prettify_stats['bytes'] / 1024:.0f} KB")
             
             if st.session_state.show_live_preview and st.session_state.show_code_panel:
                 col1, col2 = st.columns([1, 1])
                 
-                with col1:
-                    st.markdown("### 🔴 Live Preview")
-                    if current_code:
-                        st.components.v1.html(current_code, height=700, scrolling=True)
-                    else:
-                        st.info("No code to preview")
-                
+                # The editor is filled first so the preview beside it shows this run's edit
                 with col2:
                     st.markdown("### 📝 Code Editor/Viewer")
                     if st.session_state.edit_mode and not st.session_state.halt_edit:
@@ -884,15 +1627,22 @@ if app_mode == "🎨 Code Viewer":
                             help="Edit the code and see live preview updates"
                         )
                         if edited_code != current_code:
-                            st.session_state.current_code = edited_code
-                            st.rerun()
+                            record_code_edit(edited_code)
+                            current_code = edited_code
                     else:
                         st.code(code_to_display, language="html", line_numbers=True)
+                
+                with col1:
+                    st.markdown("### 🔴 Live Preview")
+                    if current_code:
+                        render_live_preview(current_code)
+                    else:
+                        st.info("No code to preview")
             
             elif st.session_state.show_live_preview:
                 st.markdown("### 🔴 Live Preview")
                 if current_code:
-                    st.components.v1.html(current_code, height=700, scrolling=True)
+                    render_live_preview(current_code)
                 else:
                     st.info("No code to preview")
             
@@ -906,8 +1656,8 @@ if app_mode == "🎨 Code Viewer":
                         help="Edit the code and see live preview updates"
                     )
                     if edited_code != current_code:
-                        st.session_state.current_code = edited_code
-                        st.rerun()
+                        record_code_edit(edited_code)
+                        current_code = edited_code
                 else:
                     st.code(code_to_display, language="html", line_numbers=True)
             else:
@@ -915,36 +1665,21 @@ if app_mode == "🎨 Code Viewer":
             
             st.markdown("---")
             st.markdown("### 📥 Download Options")
+            st.checkbox(
+                "🗜️ Minify HTML export and inline local assets",
+                key="optimize_html_export",
+                help=f"Minifies CSS and markup, drops repeated style rules and embeds images/fonts/CSS from static/ "
+                     f"up to {INLINE_ASSET_MAX_BYTES // 1024} KB each ({INLINE_ASSET_BUDGET_BYTES // 1024} KB per page) as data URIs"
+            )
             
-            col1, col2, col3, col4 = st.columns(4)
+            export_col, col3, col4 = st.columns([2, 1, 1])
             
             if current_code and current_code.strip():
-                clean_html = clean_html_for_download(current_code)
+                export_title = selected_row.get('Title', 'Document')
                 
-                with col1:
-                    st.download_button(
-                        label="🌐 Download HTML",
-                        data=clean_html,
-                        file_name=f"{selected_row.get('Title', 'document').replace(' ', '_')}.html",
-                        mime="text/html",
-                        help="Download as HTML file with embedded CSS",
-                        use_container_width=True
-                    )
-                
-                with col2:
-                    pdf_data = generate_pdf_from_html(current_code, selected_row.get('Title', 'Document'))
-                    if pdf_data:
-                        st.download_button(
-                            label="📄 Download PDF",
-                            data=pdf_data,
-                            file_name=f"{selected_row.get('Title', 'document').replace(' ', '_')}.pdf",
-                            mime="application/pdf",
-                            help="Download as formatted PDF document",
-                            use_container_width=True
-                        )
-                    else:
-                        st.button("📄 Download PDF", use_container_width=True, disabled=True, 
-                                help="ReportLab not installed or PDF generation failed.")
+                with export_col:
+                    render_export_downloads(current_code, export_title,
+                                            selected_row.get('Title', 'document').replace(' ', '_'))
                 
                 with col3:
                     st.text_input("Copy Code:", code_to_display, label_visibility="collapsed", key="copy_code_input")
@@ -953,16 +1688,24 @@ if app_mode == "🎨 Code Viewer":
                 with col4:
                     if st.session_state.edit_mode and not st.session_state.halt_edit:
                         if st.button("🔄 Reset Code", use_container_width=True):
-                            st.session_state.current_code = df_filtered.loc[st.session_state.selected_code_number]['Code']
+                            st.session_state.current_code = df.loc[st.session_state.selected_code_number]['Code']
                             st.rerun()
                     else:
                         st.write("")
+                
+                export_metrics = get_export_service().metrics()
+                st.caption(f"Export pool: {export_metrics['pending']} pending · {export_metrics['done']} rendered · "
+                           f"{export_metrics['cached']} cached · {export_metrics['failed']} failed · "
+                           f"{export_metrics['rejected']} rejected · avg render {export_metrics['avg_render_time']:.2f}s · "
+                           f"avg wait {export_metrics['avg_wait_time']:.2f}s")
             else:
                 st.info("No code available for download.")
         
         else:
             st.info("No entries found for the selected category.")
     
+    elif st.session_state.sheet_load_job is not None:
+        st.caption("Waiting for the sheet to finish loading...")
     elif st.session_state.sheet_url:
         st.error("❌ No data loaded. Please check your Google Sheet URL and ensure it contains 'Number' and 'Code' columns.")
         st.markdown("""
@@ -974,6 +1717,13 @@ if app_mode == "🎨 Code Viewer":
         """)
     else:
         st.warning("⚠️ Please enter a Google Sheet URL and click 'Load Data' to begin.")
+    
+    # Poll background sheet loads, index builds and bulk exports without blocking widget interaction
+    bulk_job = st.session_state.bulk_export_job
+    if (st.session_state.sheet_load_job is not None or search_index_pending
+            or (bulk_job is not None and not bulk_job.done())):
+        time.sleep(0.3)
+        st.rerun()
 
 elif app_mode == "🤖 AI Webhook Chat":
     st.markdown("""
@@ -999,6 +1749,7 @@ elif app_mode == "🤖 AI Webhook Chat":
     <div class="webhook-card">
         <h3>{webhook_info['icon']} {webhook_choice}</h3>
         <p style='color: #666; font-size: 0.9rem;'>{webhook_info['description']}</p>
+        <p>{circuit_badge_html(webhook_info['url'])}</p>
     </div>
     """, unsafe_allow_html=True)
     
@@ -1067,9 +1818,14 @@ elif app_mode == "🤖 AI Webhook Chat":
                 """, unsafe_allow_html=True)
             
             elif role == "assistant":
+                timing = message.get('metadata', {})
+                timing_note = (f" · TTFB {timing['ttfb']:.2f}s · total {timing['total_time']:.2f}s"
+                               if timing.get('ttfb') is not None else "")
+                if timing.get('cached'):
+                    timing_note += f" · ♻️ {timing['cached']}, saved {timing['saved_time']:.1f}s upstream"
                 st.markdown(f"""
                 <div class="chat-message assistant-message">
-                    <strong>🤖 Assistant</strong> <span style='font-size: 0.8rem; opacity: 0.7;'>({timestamp[:19]})</span><br>
+                    <strong>🤖 Assistant</strong> <span style='font-size: 0.8rem; opacity: 0.7;'>({timestamp[:19]}{timing_note})</span><br>
                     {content}
                 </div>
                 """, unsafe_allow_html=True)
@@ -1104,35 +1860,147 @@ elif app_mode == "🤖 AI Webhook Chat":
         st.markdown("<br>", unsafe_allow_html=True)
         
         send_as_webhook = st.checkbox("📤 Send to Webhook", value=True, key="send_as_webhook_toggle")
+        st.checkbox("♻️ Reuse identical responses", key="use_webhook_cache",
+                    help=f"Answer a prompt already sent to the same webhook in the last {WEBHOOK_CACHE_TTL_SECONDS // 60} "
+                         "minutes from memory, and let identical sends in flight share one call. Applies to batch mode too.")
         
         if st.button("🚀 Send", type="primary", use_container_width=True):
             if user_input.strip():
                 add_to_chat_history("user", user_input)
                 
                 if send_as_webhook:
-                    payload = {
-                        "title": f"{webhook_choice} - Custom Prompt",
-                        "type": "text",
-                        "text": user_input,
-                        "category": webhook_choice,
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
+                    payload = webhook_prompt_payload(webhook_choice, user_input)
                     
-                    response_data = send_webhook(webhook_url, payload)
+                    # Render the reply inside the conversation as it streams in
+                    stream = WebhookStream(
+                        webhook_url, payload, get_http_client(), get_circuit_breakers(),
+                        cache=get_webhook_response_cache() if st.session_state.use_webhook_cache else None
+                    )
+                    with chat_container:
+                        st.markdown("**🤖 Assistant** · receiving webhook response...")
+                        st.write_stream(stream)
+                    response_data = stream.result
                     st.session_state.webhook_history.append(response_data)
+                    # SSE/NDJSON framing stays in webhook_history; the chat keeps the text it carried
+                    response_text = stream.text if response_data["status_code"] else response_data["response"]
                     
                     status = "success" if response_data["success"] else "error"
-                    system_message = f"Webhook sent to `{webhook_url}`. Status Code: **{response_data['status_code']}**."
+                    if response_data.get("circuit_open"):
+                        system_message = f"Webhook to `{webhook_url}` skipped: {response_data['response']}."
+                    elif response_data.get("cached"):
+                        system_message = (f"Identical prompt already answered by `{webhook_url}`; reused that response "
+                                          f"({response_data['cached']}). Status Code: **{response_data['status_code']}**.")
+                    else:
+                        system_message = f"Webhook sent to `{webhook_url}`. Status Code: **{response_data['status_code']}**."
                     add_to_chat_history("system", system_message, {"status": status})
                     
-                    assistant_response = f"**Webhook Response:**\n\n```json\n{response_data['response'][:500]}...\n```"
-                    add_to_chat_history("assistant", assistant_response)
+                    assistant_response = f"**Webhook Response:**\n\n```json\n{response_text}\n```"
+                    add_to_chat_history("assistant", assistant_response, {
+                        "ttfb": response_data.get("ttfb"),
+                        "total_time": response_data.get("total_time"),
+                        "cached": response_data.get("cached"),
+                        "saved_time": response_data.get("saved_time")
+                    })
                 else:
                     add_to_chat_history("assistant", f"Message received: '{user_input[:50]}...' (Webhook send disabled)")
                 
                 st.rerun()
             else:
                 st.warning("Please enter a message to send.")
+    
+    if st.session_state.use_webhook_cache:
+        response_cache = get_webhook_response_cache()
+        cache_stats = response_cache.snapshot()
+        session_saved = sum((message.get("metadata", {}).get("saved_time") or 0.0)
+                            for message in st.session_state.chat_history if message["role"] == "assistant")
+        cache_col1, cache_col2, cache_col3, cache_col4 = st.columns(4)
+        with cache_col1:
+            st.metric("Cache Hits", cache_stats["hits"])
+        with cache_col2:
+            st.metric("Coalesced", cache_stats["coalesced"], help="Identical sends that shared a call already in flight")
+        with cache_col3:
+            st.metric("Upstream Time Avoided", f"{cache_stats['seconds_saved']:.1f}s",
+                      help=f"{session_saved:.1f}s of it in this conversation")
+        with cache_col4:
+            st.metric("Cached Responses", cache_stats["entries"])
+        cache_caption_col, cache_clear_col = st.columns([4, 1])
+        with cache_caption_col:
+            st.caption(f"Hit rate {cache_stats['hit_rate']:.1f}% · {cache_stats['misses']} upstream calls · "
+                       f"{cache_stats['evictions']} evicted · TTL {WEBHOOK_CACHE_TTL_SECONDS // 60} min · "
+                       f"keyed by webhook and payload, ignoring {', '.join(WEBHOOK_CACHE_VOLATILE_FIELDS)}")
+        with cache_clear_col:
+            if st.button("🧹 Clear Cache", use_container_width=True, key="clear_webhook_cache"):
+                response_cache.clear()
+                st.rerun()
+    
+    st.markdown("---")
+    
+    # Stream finished batch results into the history before anything renders it
+    batch_running = collect_webhook_batch_results()
+    
+    with st.expander("📦 Batch Mode - send many prompts at once", expanded=batch_running):
+        batch_source = st.radio(
+            "Prompts:",
+            ["Examples of every webhook", f"Examples of {webhook_choice}", f"Uploaded CSV for {webhook_choice}"],
+            key="batch_source",
+            horizontal=True
+        )
+        batch_rows = None
+        batch_webhooks = list(WEBHOOKS.keys()) if batch_source == "Examples of every webhook" else [webhook_choice]
+        if batch_source.startswith("Uploaded CSV"):
+            batch_file = st.file_uploader(f"CSV with columns: {', '.join(prompt_fields)}", type=["csv"], key="batch_csv")
+            if batch_file is not None:
+                batch_frame = pd.read_csv(batch_file, dtype=str).fillna("")
+                missing_fields = [field for field in prompt_fields if field not in batch_frame.columns]
+                if missing_fields:
+                    st.error(f"❌ Missing columns: {', '.join(missing_fields)}")
+                else:
+                    batch_rows = batch_frame[prompt_fields].to_dict("records")
+        
+        batch_col1, batch_col2 = st.columns(2)
+        with batch_col1:
+            batch_concurrency = st.number_input("Concurrent requests per endpoint:", min_value=1, max_value=16,
+                                                value=BATCH_PER_ENDPOINT_CONCURRENCY, key="batch_concurrency")
+        with batch_col2:
+            batch_timeout = st.number_input("Timeout per request (s):", min_value=1, max_value=120,
+                                            value=BATCH_REQUEST_TIMEOUT_SECONDS, key="batch_timeout")
+        
+        batch_items, batch_skipped = ([], []) if batch_source.startswith("Uploaded CSV") and batch_rows is None \
+            else build_batch_items(batch_webhooks, batch_rows)
+        if batch_skipped:
+            st.warning(f"⚠️ {len(batch_skipped)} prompt(s) will not be sent because a field their template needs is missing: "
+                       + "; ".join(f"{skip['webhook']} {skip['source']} (no '{skip['field']}')" for skip in batch_skipped[:10])
+                       + (f"; and {len(batch_skipped) - 10} more" if len(batch_skipped) > 10 else ""))
+        batch_job = st.session_state.webhook_batch_job
+        if st.button(f"🚀 Send {len(batch_items)} Prompts", type="primary", use_container_width=True,
+                     disabled=batch_running or not batch_items):
+            start_webhook_batch(batch_items, int(batch_concurrency), int(batch_timeout),
+                                get_webhook_response_cache() if st.session_state.use_webhook_cache else None)
+            st.rerun()
+        
+        if batch_job is not None:
+            batch_summary = batch_job.summary()
+            st.progress(batch_summary["completed"] / max(batch_job.total, 1),
+                        text=f"Batch {batch_job.id}: {batch_summary['completed']}/{batch_job.total} done · "
+                             f"{batch_summary['succeeded']} succeeded")
+            if batch_job.done():
+                st.caption(f"Finished in {batch_summary['elapsed']:.1f}s · {batch_summary['throughput']:.2f} requests/s · "
+                           f"p50 {batch_summary['p50']:.2f}s · p95 {batch_summary['p95']:.2f}s")
+                if batch_job.error:
+                    st.error(f"❌ Batch stopped: {batch_job.error}")
+            batch_results = [record for record in st.session_state.webhook_history if record.get("batch_id") == batch_job.id]
+            if batch_results:
+                st.dataframe(pd.DataFrame([{
+                    "Webhook": record["webhook"],
+                    "Status": record["status_code"],
+                    "Latency (s)": round(record["latency"], 2),
+                    "Cached": record.get("cached") or "",
+                    "Response": record["response"][:80]
+                } for record in batch_results]), use_container_width=True, hide_index=True)
+    
+    if batch_running:
+        time.sleep(0.3)
+        st.rerun()
 
 elif app_mode == "📊 Data Analysis":
     st.markdown("""
@@ -1345,6 +2213,7 @@ elif app_mode == "📤 Simple Webhook Sender":
     
     webhook_choice = st.selectbox("Select webhook type", list(WEBHOOKS.keys()), key="simple_webhook_select")
     webhook_url = st.text_input("Webhook URL", value=WEBHOOKS[webhook_choice]['url'], key="simple_webhook_url")
+    st.markdown(f"Endpoint status: {circuit_badge_html(webhook_url, 20)}", unsafe_allow_html=True)
     
     title = st.text_input("Title", value=f"{webhook_choice} - {datetime.utcnow().isoformat()[:19]}", key="simple_title")
     
@@ -1355,6 +2224,14 @@ elif app_mode == "📤 Simple Webhook Sender":
         key="simple_text_input"
     )
     
+    delivery_mode = st.radio(
+        "Delivery:",
+        ["Queue in outbox", "Send now"],
+        horizontal=True,
+        key="simple_delivery_mode",
+        help="Queued messages are stored on disk and retried in the background until delivered"
+    )
+    
     send_button = st.button("Send Webhook", type="primary", use_container_width=True)
     
     if send_button:
@@ -1369,45 +2246,190 @@ elif app_mode == "📤 Simple Webhook Sender":
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            try:
+            if delivery_mode == "Queue in outbox":
+                # The key leaves out the timestamp, so sending the same message again while it is queued is a no-op
+                idempotency_key = outbox_idempotency_key(webhook_url, {"title": title, "text": text_input})
+                message_id, created = get_webhook_outbox().enqueue(webhook_url, payload, idempotency_key)
+                if created:
+                    st.success(f"📮 Queued as message #{message_id}; it will be delivered in the background.")
+                else:
+                    st.info(f"ℹ️ This message is already in the outbox as #{message_id}.")
+            else:
                 with st.spinner("Sending webhook..."):
-                    resp = requests.post(webhook_url, json=payload, timeout=20)
-                
-                try:
-                    resp_body = resp.text
-                except:
-                    resp_body = ""
-                
-                st.session_state.webhook_simple_history.insert(0, {
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "webhook": webhook_url,
-                    "status_code": resp.status_code,
-                    "payload": payload,
-                    "response": resp_body,
-                })
-                
-                st.subheader("Response")
-                st.code(resp_body)
+                    response_data = send_webhook(webhook_url, payload, get_http_client(), get_circuit_breakers(), timeout=20)
                 
-                if resp.status_code < 300:
-                    st.success(f"✅ Sent successfully! Status {resp.status_code}")
+                if response_data.get("circuit_open"):
+                    st.error(f"🔴 {response_data['response']}")
+                elif response_data["status_code"] == 0:
+                    st.error(f"❌ Request failed: {response_data['response']}")
                 else:
-                    st.warning(f"⚠️ Request returned status {resp.status_code}")
-            
-            except Exception as e:
-                st.error(f"❌ Request failed: {e}")
+                    st.session_state.webhook_simple_history.insert(0, {
+                        "timestamp": datetime.utcnow().isoformat(),
+                        "webhook": webhook_url,
+                        "status_code": response_data["status_code"],
+                        "payload": payload,
+                        "response": response_data["response"],
+                    })
+                    
+                    st.subheader("Response")
+                    st.code(response_data["response"])
+                    
+                    if response_data["success"]:
+                        st.success(f"✅ Sent successfully! Status {response_data['status_code']}")
+                    else:
+                        st.warning(f"⚠️ Request returned status {response_data['status_code']}")
     
     st.markdown("---")
     st.header("📜 Webhook History (Last 10)")
     
-    if st.session_state.webhook_simple_history:
-        for i, rec in enumerate(st.session_state.webhook_simple_history[:10]):
-            status_emoji = "✅" if rec['status_code'] < 300 else "❌"
-            with st.expander(f"{status_emoji} {i+1}. {rec['timestamp'][:19]} → Status {rec['status_code']}"):
-                st.subheader("Payload Sent")
-                st.json(rec["payload"])
-                st.subheader("Response Received")
-                st.code(rec["response"])
-                st.caption(f"Webhook URL: {rec['webhook']}")
+    outbox = get_webhook_outbox()
+    outbox_counts = outbox.counts()
+    sent_tab, outbox_tab, dead_tab = st.tabs([
+        "✅ Sent",
+        f"📮 Outbox ({outbox_counts['pending'] + outbox_counts['delivering']} waiting)",
+        f"☠️ Dead Letters ({outbox_counts['dead']})"
+    ])
+    
+    with sent_tab:
+        if st.session_state.webhook_simple_history:
+            for i, rec in enumerate(st.session_state.webhook_simple_history[:10]):
+                status_emoji = "✅" if rec['status_code'] < 300 else "❌"
+                with st.expander(f"{status_emoji} {i+1}. {rec['timestamp'][:19]} → Status {rec['status_code']}"):
+                    st.subheader("Payload Sent")
+                    st.json(rec["payload"])
+                    st.subheader("Response Received")
+                    st.code(rec["response"])
+                    st.caption(f"Webhook URL: {rec['webhook']}")
+        else:
+            st.info("No webhooks sent yet. Send your first webhook above!")
+    
+    with outbox_tab:
+        st.caption(f"{outbox_counts['pending']} pending · {outbox_counts['delivering']} delivering · "
+                   f"{outbox_counts['delivered']} delivered · at most {OUTBOX_RATE_LIMIT_PER_SECOND:g} sends/s per endpoint · "
+                   f"up to {OUTBOX_MAX_ATTEMPTS} attempts")
+        waiting = outbox.messages("delivering", limit=10) + outbox.messages("pending", limit=10)
+        delivered = outbox.messages("delivered", limit=10)
+        if waiting:
+            st.dataframe(pd.DataFrame([{
+                "ID": message["id"],
+                "Status": message["status"],
+                "Attempts": message["attempts"],
+                "Next Attempt": datetime.fromtimestamp(message["next_attempt_at"]).strftime("%H:%M:%S"),
+                "Last Error": message["last_error"] or "",
+                "Webhook URL": message["url"]
+            } for message in waiting]), use_container_width=True, hide_index=True)
+        for message in delivered:
+            with st.expander(f"✅ #{message['id']} {datetime.fromtimestamp(message['updated_at']).isoformat()[:19]} → "
+                             f"Status {message['last_status_code']} after {message['attempts']} attempt(s)"):
+                st.json(json.loads(message["payload"]))
+                st.code(message["response"] or "")
+                st.caption(f"Webhook URL: {message['url']} · Idempotency key: {message['idempotency_key']}")
+        if not waiting and not delivered:
+            st.info("The outbox is empty.")
+    
+    with dead_tab:
+        dead_letters = outbox.messages("dead")
+        if dead_letters:
+            for message in dead_letters:
+                with st.expander(f"☠️ #{message['id']} {datetime.fromtimestamp(message['updated_at']).isoformat()[:19]} → "
+                                 f"{message['last_status_code'] or 'no response'} after {message['attempts']} attempt(s)"):
+                    st.error(message["last_error"] or "Delivery failed")
+                    st.json(json.loads(message["payload"]))
+                    st.caption(f"Webhook URL: {message['url']} · Idempotency key: {message['idempotency_key']}")
+                    retry_col, delete_col = st.columns(2)
+                    with retry_col:
+                        if st.button("🔁 Retry", key=f"outbox_retry_{message['id']}", use_container_width=True):
+                            if outbox.requeue(message["id"]):
+                                st.rerun()
+                            st.warning("This message has been queued again since; discard this copy instead.")
+                    with delete_col:
+                        if st.button("🗑️ Discard", key=f"outbox_discard_{message['id']}", use_container_width=True):
+                            outbox.delete(message["id"])
+                            st.rerun()
+        else:
+            st.info("No dead letters. Messages that fail permanently or run out of retries show up here.")
+    
+    # Follow deliveries that are under way or about to be attempted; later retries show up on the next visit
+    next_attempt_in = outbox.next_attempt_in()
+    if outbox_counts["delivering"] or (next_attempt_in is not None and next_attempt_in <= 5):
+        time.sleep(1)
+        st.rerun()
+
+elif app_mode == "📈 Webhook Telemetry":
+    st.markdown("""
+    <div class="main-header">
+        <h1>📈 Webhook Telemetry</h1>
+        <p>DNS, connect, time-to-first-byte and total latency percentiles plus payload sizes for every webhook endpoint</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    telemetry = get_webhook_telemetry()
+    endpoint_names = webhook_endpoint_names()
+    summary = telemetry.summary()
+    
+    if not summary:
+        st.info("No webhook calls recorded yet. Send something from the chat, batch mode or the Simple Webhook Sender.")
+    else:
+        outcomes = telemetry.outcomes()
+        total_calls = sum(sum(counts.values()) for counts in outcomes.values())
+        failed_calls = sum(counts.get("error", 0) + counts.get("5xx", 0) for counts in outcomes.values())
+        metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+        with metric_col1:
+            st.metric("Calls", total_calls)
+        with metric_col2:
+            st.metric("Failed", failed_calls)
+        with metric_col3:
+            st.metric("Endpoints", len(outcomes))
+        with metric_col4:
+            st.metric("Histogram Memory", f"{telemetry.memory_bytes() / 1024:.0f} KB")
+        
+        st.markdown("### ⏱️ Percentiles by Endpoint")
+        summary_df = pd.DataFrame(summary)
+        summary_df["endpoint"] = summary_df["endpoint"].map(lambda url: endpoint_names.get(url, url))
+        summary_df = summary_df[summary_df["count"] > 0]
+        timing_df = summary_df[summary_df["metric"].isin(TELEMETRY_TIMING_METRICS)].copy()
+        for column in ("p50", "p95", "p99"):
+            timing_df[column] = (timing_df[column] * 1000).round(1)
+        st.dataframe(timing_df.rename(columns={"p50": "p50 (ms)", "p95": "p95 (ms)", "p99": "p99 (ms)"}),
+                     use_container_width=True, hide_index=True)
+        st.caption("DNS and connect are only measured when a call opens a new connection; reused keep-alive "
+                   f"connections skip both. Percentiles are accurate to within {TELEMETRY_HISTOGRAM_GROWTH - 1:.0%}.")
+        size_df = summary_df[summary_df["metric"].isin(TELEMETRY_SIZE_METRICS)]
+        st.dataframe(size_df.rename(columns={"p50": "p50 (bytes)", "p95": "p95 (bytes)", "p99": "p99 (bytes)"}),
+                     use_container_width=True, hide_index=True)
+        
+        st.markdown("### 📉 Total Latency Over Time")
+        endpoint_options = ["All endpoints"] + telemetry.endpoints()
+        timeline_endpoint = st.selectbox("Endpoint:", endpoint_options, key="telemetry_endpoint",
+                                         format_func=lambda url: endpoint_names.get(url, url))
+        timeline = telemetry.timeline(None if timeline_endpoint == "All endpoints" else timeline_endpoint)
+        if timeline:
+            timeline_df = pd.DataFrame(timeline).melt(
+                id_vars=["window", "requests"], value_vars=["p50", "p95", "p99"],
+                var_name="percentile", value_name="seconds"
+            )
+            chart = alt.Chart(timeline_df).mark_line(point=True).encode(
+                x=alt.X("window:T", title="Minute"),
+                y=alt.Y("seconds:Q", title="Total time (s)"),
+                color="percentile:N",
+                tooltip=["window:T", "percentile:N", alt.Tooltip("seconds:Q", format=".3f"), "requests:Q"]
+            ).properties(height=320)
+            st.altair_chart(chart, use_container_width=True)
+            st.caption(f"One point per {TELEMETRY_WINDOW_SECONDS}s window, last {TELEMETRY_WINDOWS} windows kept")
+        else:
+            st.info("No calls to this endpoint in the retained windows.")
+    
+    st.markdown("### 📤 Prometheus Export")
+    prometheus_text = telemetry.prometheus_text(endpoint_names)
+    if TELEMETRY_METRICS_PORT:
+        if TELEMETRY_METRICS_HOST == "127.0.0.1":
+            st.caption(f"Scrape http://127.0.0.1:{TELEMETRY_METRICS_PORT}/metrics "
+                       "(local only; set WEBHOOK_METRICS_HOST to listen on other interfaces)")
+        else:
+            st.caption(f"Scrape http://<host>:{TELEMETRY_METRICS_PORT}/metrics (listening on {TELEMETRY_METRICS_HOST})")
     else:
-        st.info("No webhooks sent yet. Send your first webhook above!")
+        st.caption("Set WEBHOOK_METRICS_PORT to serve these metrics at /metrics for a Prometheus scraper.")
+    st.download_button("📥 Download metrics", prometheus_text, file_name="webhook_metrics.prom",
+                       mime="text/plain", use_container_width=True)
+    with st.expander("View exposition text"):
+        st.code(prometheus_text, language="text")
@@ -0,0 +1,129 @@
+"""
+Micro-benchmarks for the export/preview rendering code in html_export.py.
+
+    python bench.py                      # every benchmark on a 1 MB page
+    python bench.py --size-kb 4096 prettify
+
+Each benchmark times the current implementation and, where one exists, the
+implementation it replaced. Nothing here is imported by the app.
+"""
+import argparse
+import re
+import time
+
+from html_export import (
+    REPORTLAB_AVAILABLE, EnhancedHTMLParser, build_pdf_styles, get_pdf_styles, clean_html_for_download,
+    prettify_html, optimize_html_for_download
+)
+
+def build_benchmark_page(target_bytes=1024 * 1024):
+    """Synthetic minified landing page (inline CSS, nested markup) of roughly target_bytes"""
+    css = ("body{margin:0;font-family:'Inter',sans-serif}.hero{display:flex;padding:4rem 2rem;"
+           "background:linear-gradient(135deg,#1e3c72,#2a5298)}@media (max-width:600px){.hero{padding:2rem 1rem}}")
+    section = ('<section class="hero"><div class="container"><h2>Feature</h2>'
+               '<p>Build faster with <b>reusable</b> blocks &amp; templates.<br>Ship today.</p>'
+               '<img src="hero.png" alt="hero"><ul><li>Fast</li><li>Secure</li></ul>'
+               '<a class="cta" href="#" onclick="track()">Start</a></div></section>')
+    head = f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><style>{css}</style></head><body>'
+    tail = '<script>function track(){}</script></body></html>'
+    repeats = max(1, (target_bytes - len(head) - len(tail)) // len(section))
+    return head + section * repeats + tail
+
+def legacy_clean_html_for_download(html_content):
+    """Regex-chain cleanup that clean_html_for_download replaced"""
+    css_pattern = r'<style[^>]*>(.*?)</style>'
+    css_matches = re.findall(css_pattern, html_content, re.DOTALL)
+    
+    # Remove script tags completely for security
+    html_content = re.sub(r'<script[^>]*>.*?</script>', '', html_content, flags=re.DOTALL)
+    
+    # Embed CSS properly in head
+    if css_matches:
+        combined_css = '\n'.join(css_matches)
+        html_content = re.sub(css_pattern, '', html_content, flags=re.DOTALL)
+        
+        if '<head>' in html_content:
+            html_content = html_content.replace('<head>', f'<head>\n<style>\n{combined_css}\n</style>')
+        elif '<html>' in html_content:
+            html_content = html_content.replace('<html>', f'<html>\n<head>\n<style>\n{combined_css}\n</style>\n</head>')
+        else:
+            html_content = f'<!DOCTYPE html>\n<html>\n<head>\n<style>\n{combined_css}\n</style>\n</head>\n<body>\n{html_content}\n</body>\n</html>'
+    
+    return html_content
+
+def legacy_pdf_document_setup(html_content):
+    """Per-document setup generate_pdf_from_html used to do: a fresh parser class and style set"""
+    parser_class = type("EnhancedHTMLParser", (EnhancedHTMLParser,), {})
+    parser_class()
+    build_pdf_styles()
+
+def pdf_document_setup(html_content):
+    """Per-document setup generate_pdf_from_html does now: the shared styles and a parser instance"""
+    EnhancedHTMLParser()
+    get_pdf_styles()
+
+# The regex prettifier prettify_html replaced raised on every call, so it has no baseline here
+BENCHMARKS = {
+    "prettify": {
+        "functions": {"prettify_html": prettify_html},
+        "input": build_benchmark_page
+    },
+    "cleanup": {
+        "functions": {
+            "clean_html_for_download": clean_html_for_download,
+            "legacy_clean_html_for_download": legacy_clean_html_for_download
+        },
+        "input": build_benchmark_page
+    },
+    "minify": {
+        "functions": {"optimize_html_for_download": optimize_html_for_download},
+        "input": build_benchmark_page
+    }
+}
+if REPORTLAB_AVAILABLE:
+    BENCHMARKS["pdf-setup"] = {
+        "functions": {"pdf_document_setup": pdf_document_setup, "legacy_pdf_document_setup": legacy_pdf_document_setup},
+        "input": lambda size: "",
+        "number": 200
+    }
+
+def benchmark_functions(functions, argument, repeat=3, number=1):
+    """
+    Best-of-repeat wall time per call (each timing averages `number` calls) of each
+    named function on the same input.
+    """
+    input_mb = len(argument) / (1024 * 1024)
+    results = []
+    for name, func in functions.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                func(argument)
+            timings.append((time.perf_counter() - started) / number)
+        best = min(timings)
+        results.append((name, best * 1000, input_mb / best if input_mb else None))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("benchmarks", nargs="*", help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--size-kb", type=int, default=1024, help="input page size in KB")
+    parser.add_argument("--repeat", type=int, default=3, help="timings per function; the best is reported")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    
+    for name in args.benchmarks or list(BENCHMARKS):
+        benchmark = BENCHMARKS[name]
+        argument = benchmark["input"](args.size_kb * 1024)
+        print(f"{name} ({len(argument) / 1024:.0f} KB input)")
+        for function, best_ms, throughput in benchmark_functions(
+            benchmark["functions"], argument, args.repeat, benchmark.get("number", 1)
+        ):
+            rate = f"{throughput:8.2f} MB/s" if throughput else ""
+            print(f"  {function:<34} {best_ms:10.2f} ms  {rate}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Full-text search over the code library: an inverted index of Title, Description
+and tokenized Code, built with numpy so a large sheet indexes in seconds and a
+query scores whole posting lists at once. Kept free of Streamlit so indexes can
+be built on the sheet loader threads and tested on their own.
+"""
+import re
+import bisect
+import threading
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+SEARCH_FIELD_WEIGHTS = {"Title": 3.0, "Description": 2.0, "Code": 1.0}
+SEARCH_PREFIX_EXPANSION = 50
+SEARCH_PREFIX_FACTOR = 0.6
+SEARCH_RESULT_LIMIT = 200
+SEARCH_TOKEN_PATTERN = re.compile(r"[a-z0-9_]{2,}")
+# Byte table that blanks everything SEARCH_TOKEN_PATTERN does not match, so rows are
+# tokenized with bytes.translate/split (non-ASCII characters encode to '?' and act
+# as separators, as they do for the pattern); one-letter tokens are dropped afterwards
+SEARCH_TOKEN_BYTES = bytes(
+    byte if chr(byte) in "abcdefghijklmnopqrstuvwxyz0123456789_" else ord(" ") for byte in range(256)
+)
+# Changed rows are indexed into a new segment; past this many segments everything is rebuilt
+SEARCH_MAX_SEGMENTS = 8
+
+class SearchSegment:
+    """
+    Immutable postings for a batch of rows in CSR form: the postings of the
+    term with id t (terms sorted) are slots/weights[offsets[t]:offsets[t + 1]].
+    """
+
+    def __init__(self, numbers, terms, offsets, slots, weights):
+        self.numbers = numbers
+        self.terms = terms
+        self.offsets = offsets
+        self.slots = slots
+        self.weights = weights
+        self.alive = np.ones(len(numbers), dtype=bool)
+
+    @classmethod
+    def build(cls, numbers, columns):
+        """
+        Index rows given as Numbers plus {field: values}. The tokens of all rows
+        are factorized at once and term frequencies, field weights and postings
+        come from one sort of packed (term, slot, field) keys, instead of
+        per-term appends.
+        """
+        numbers = np.asarray(numbers, dtype=np.int64)
+        fields = [field for field in SEARCH_FIELD_WEIGHTS if columns.get(field) is not None]
+        tokens, keys = [], []
+        for field_index, field in enumerate(fields):
+            # Every distinct term is indexed, so rare identifiers deep in long code still match
+            field_tokens = [value.lower().encode("ascii", "replace").translate(SEARCH_TOKEN_BYTES).split()
+                            if isinstance(value, str) else [] for value in columns[field]]
+            lengths = np.fromiter(map(len, field_tokens), dtype=np.int64, count=len(field_tokens))
+            tokens.append(chain.from_iterable(field_tokens))
+            keys.append(np.repeat(np.arange(len(numbers), dtype=np.int64) * len(fields) + field_index, lengths))
+        flat_tokens = list(chain.from_iterable(tokens))
+        if not flat_tokens:
+            return cls(numbers, [], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                       np.zeros(0, dtype=np.float32))
+        codes, vocabulary = pd.factorize(pd.Series(flat_tokens, dtype=object), sort=True)
+        del flat_tokens
+        keys = np.concatenate(keys)
+        indexed = np.fromiter(map(len, vocabulary), dtype=np.int64, count=len(vocabulary)) > 1
+        if not indexed.all():
+            occurrences = indexed[codes]
+            codes = (np.cumsum(indexed) - 1)[codes[occurrences]]
+            keys = keys[occurrences]
+            vocabulary = vocabulary[indexed]
+
+        # One key per token occurrence; equal keys are repeats of a term in one field of one row
+        keys = np.sort(codes.astype(np.int64) * (len(numbers) * len(fields)) + keys)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        tf = np.diff(np.r_[starts, len(keys)])
+        keys = keys[starts]
+        field_weights = np.array([SEARCH_FIELD_WEIGHTS[field] for field in fields])
+        weights = field_weights[keys % len(fields)] * (1 + np.log(tf))
+
+        # A term found in several fields of one row becomes one posting
+        keys //= len(fields)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        keys = keys[starts]
+        weights = np.add.reduceat(weights, starts)
+        term_ids = keys // len(numbers)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+        terms = [term.decode("ascii") for term in vocabulary]
+        return cls(numbers, terms, offsets, (keys % len(numbers)).astype(np.int32),
+                   weights.astype(np.float32))
+
+    def document_frequency(self, term):
+        position = bisect.bisect_left(self.terms, term)
+        if position < len(self.terms) and self.terms[position] == term:
+            return int(self.offsets[position + 1] - self.offsets[position])
+        return 0
+
+    def expand(self, token):
+        """Ids of the indexed terms matching token, with their score factor"""
+        start = bisect.bisect_left(self.terms, token)
+        matches = []
+        for term_id in range(start, min(start + SEARCH_PREFIX_EXPANSION + 1, len(self.terms))):
+            term = self.terms[term_id]
+            if not term.startswith(token):
+                break
+            matches.append((term_id, 1.0 if term == token else SEARCH_PREFIX_FACTOR))
+        return matches
+
+    def without(self, slots):
+        """Copy of this segment with the given slots retired (postings are shared)"""
+        segment = SearchSegment(self.numbers, self.terms, self.offsets, self.slots, self.weights)
+        segment.alive = self.alive.copy()
+        segment.alive[slots] = False
+        return segment
+
+class CodeSearchIndex:
+    """
+    In-memory inverted index over Title, Description and tokenized Code.
+    Postings live in immutable segments: a full build makes one, and updated or
+    deleted rows are retired while their new versions go into a small extra
+    segment. Everything is rebuilt once retired rows outnumber live ones or
+    segments pile up. Searches read a snapshot of the segments without locking.
+    Queries AND their terms, rank by tf-idf and expand each term to indexed
+    terms that start with it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._segments = ()
+        self._locations = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    @staticmethod
+    def _columns(df):
+        return {field: df[field].tolist() for field in SEARCH_FIELD_WEIGHTS if field in df.columns}
+
+    def _publish(self, segments):
+        locations = {}
+        for position, segment in enumerate(segments):
+            for slot in np.flatnonzero(segment.alive).tolist():
+                locations[int(segment.numbers[slot])] = (position, slot)
+        self._segments = tuple(segments)
+        self._locations = locations
+
+    def rebuild(self, df):
+        segment = SearchSegment.build(df.index.tolist(), self._columns(df))
+        with self._lock:
+            self._publish([segment])
+
+    def apply_changes(self, df, changed, deleted):
+        """Re-index the changed (inserted or updated) Numbers and drop the deleted ones"""
+        changed = list(changed)
+        with self._lock:
+            retired = {}
+            for number in list(deleted) + changed:
+                location = self._locations.get(number)
+                if location is not None:
+                    retired.setdefault(location[0], []).append(location[1])
+            segments = [segment.without(retired[position]) if position in retired else segment
+                        for position, segment in enumerate(self._segments)]
+            live = sum(int(segment.alive.sum()) for segment in segments)
+            dead = sum(len(segment.numbers) for segment in segments) - live
+            if dead > live or len(segments) >= SEARCH_MAX_SEGMENTS:
+                segments = [SearchSegment.build(df.index.tolist(), self._columns(df))]
+            elif changed:
+                rows = df.loc[changed]
+                segments.append(SearchSegment.build(rows.index.tolist(), self._columns(rows)))
+            self._publish(segments)
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """Return up to limit (number, score) pairs matching every query token, best first"""
+        tokens = list(dict.fromkeys(SEARCH_TOKEN_PATTERN.findall(query.lower())))
+        segments = self._segments
+        live_count = max(len(self._locations), 1)
+        if not tokens or not segments:
+            return []
+
+        expansions = [[segment.expand(token) for segment in segments] for token in tokens]
+        results = []
+        for position, segment in enumerate(segments):
+            combined = None
+            for token_expansions in expansions:
+                # Best score over the token's expansions, scored a whole posting list at a time
+                scores = np.zeros(len(segment.numbers), dtype=np.float32)
+                for term_id, factor in token_expansions[position]:
+                    term = segment.terms[term_id]
+                    frequency = sum(other.document_frequency(term) for other in segments)
+                    start, end = segment.offsets[term_id], segment.offsets[term_id + 1]
+                    slots = segment.slots[start:end]
+                    term_scores = segment.weights[start:end] * np.float32(np.log(1 + live_count / frequency) * factor)
+                    scores[slots] = np.maximum(scores[slots], term_scores)
+                if combined is None:
+                    combined = scores
+                else:
+                    combined = np.where((combined > 0) & (scores > 0), combined + scores, 0)
+                if not combined.any():
+                    break
+            matched = np.flatnonzero((combined > 0) & segment.alive)
+            if len(matched) > limit:
+                matched = matched[np.argpartition(combined[matched], -limit)[-limit:]]
+            results.extend(zip(segment.numbers[matched].tolist(), combined[matched].astype(float).tolist()))
+        results.sort(key=lambda result: result[1], reverse=True)
+        return results[:limit]
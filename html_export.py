@@ -0,0 +1,801 @@
+"""
+HTML and PDF rendering for Code Viewer exports: download cleanup, prettifying,
+minification/asset inlining and ReportLab PDFs. Kept free of Streamlit so export
+worker processes can import it directly.
+"""
+import re
+import os
+import time
+import base64
+import tempfile
+import textwrap
+import functools
+from io import BytesIO
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import unquote
+
+# Attempt to import ReportLab for PDF generation
+try:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+# Rendered exports at least this large are handed back as temp files rather than bytes
+EXPORT_SPOOL_THRESHOLD_BYTES = 256 * 1024
+EXPORT_SPOOL_PREFIX = "code-export-"
+
+# ==========================================
+# DOWNLOAD CLEANUP
+# ==========================================
+# Attribute text up to the closing '>', which may appear inside quoted values
+HTML_TAG_ATTRIBUTES = r"""[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*"""
+# The legacy regex chain, folded into one pattern: comments are copied through
+# (so a <style> inside one stays put), <script> blocks are dropped and <style> blocks
+# collected. Tag names are matched case-sensitively so the scan keeps the engine's
+# fast '<' prefix search; IGNORECASE or an on* attribute branch made it slower than
+# the chain it replaced.
+CLEANUP_BLOCK_PATTERN = re.compile(
+    r"<(?:!--.*?-->"
+    r"|script\b" + HTML_TAG_ATTRIBUTES + r">.*?</script\s*>"
+    r"|style\b" + HTML_TAG_ATTRIBUTES + r">(?P<css>.*?)</style\s*>)",
+    re.DOTALL
+)
+# Only searched when there are styles to place, and usually found near the top
+DOCUMENT_TAG_PATTERN = re.compile(r"<(?P<tag_name>html|head)(?=[\s/>])" + HTML_TAG_ATTRIBUTES + r">", re.IGNORECASE)
+
+def find_document_tag(html_content, blocks):
+    """First <head> (else <html>) tag outside the matched blocks, or None"""
+    found = {}
+    position = 0
+    while len(found) < 2:
+        match = DOCUMENT_TAG_PATTERN.search(html_content, position)
+        if match is None:
+            break
+        position = match.end()
+        enclosing = next((block for block in blocks if block.start() <= match.start() < block.end()), None)
+        if enclosing is not None:
+            position = enclosing.end()
+            continue
+        found.setdefault(match.group('tag_name').lower(), match)
+        if 'head' in found:
+            break
+    return found.get('head') or found.get('html')
+
+def clean_html_for_download(html_content):
+    """
+    Clean HTML content for download: <style> blocks are moved into <head> and
+    <script> blocks are dropped. The page is scanned once for blocks and copied
+    once; <head>/<html> may carry attributes or be upper case (<HEAD>, <html lang="en">).
+    """
+    blocks = list(CLEANUP_BLOCK_PATTERN.finditer(html_content))
+    if not blocks:
+        return html_content
+    css_blocks = [block.group('css') for block in blocks if block.group('css') is not None]
+    
+    # Embed CSS properly in head
+    insert_at = style_block = None
+    if css_blocks:
+        style_block = '\n<style>\n' + '\n'.join(css_blocks) + '\n</style>'
+        document_tag = find_document_tag(html_content, blocks)
+        if document_tag is not None:
+            insert_at = document_tag.end()
+            if document_tag.group('tag_name').lower() == 'html':
+                style_block = f'\n<head>{style_block}\n</head>'
+    
+    pieces = []
+    position = 0
+    for block in blocks:
+        if insert_at is not None and position <= insert_at <= block.start():
+            pieces += [html_content[position:insert_at], style_block]
+            position = insert_at
+        pieces.append(html_content[position:block.start()])
+        position = block.end()
+        if block.group(0).startswith('<!--'):
+            pieces.append(block.group(0))
+        # Script and style blocks are removed completely (scripts for security)
+    if insert_at is not None and insert_at >= position:
+        pieces += [html_content[position:insert_at], style_block]
+        position = insert_at
+    pieces.append(html_content[position:])
+    
+    if css_blocks and insert_at is None:
+        return f'<!DOCTYPE html>\n<html>\n<head>{style_block}\n</head>\n<body>\n' + ''.join(pieces) + '\n</body>\n</html>'
+    return ''.join(pieces)
+
+# ==========================================
+# PRETTIFY
+# ==========================================
+PRETTIFY_INDENT = '    '
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+])
+PRESERVE_WHITESPACE_ELEMENTS = frozenset(['pre', 'textarea'])
+# Open elements that a new start tag implicitly closes (e.g. <li> after an unclosed <li>)
+IMPLICITLY_CLOSED_BY = {
+    'li': frozenset(['li']),
+    'p': frozenset(['p']),
+    'option': frozenset(['option']),
+    'tr': frozenset(['tr', 'td', 'th']),
+    'td': frozenset(['td', 'th']),
+    'th': frozenset(['td', 'th']),
+    'dt': frozenset(['dt', 'dd']),
+    'dd': frozenset(['dt', 'dd'])
+}
+CSS_TOKEN_PATTERN = re.compile(
+    r"/\*.*?(?:\*/|$)"                 # comment
+    r"|\"(?:\\.|[^\"\\])*\"?"       # double-quoted string
+    r"|'(?:\\.|[^'\\])*'?"            # single-quoted string
+    r"|url\([^)]*\)"                    # url(...) may hold ';' in data URIs
+    r"|[{};]"
+    r"|[^{};\"'/u]+|[/u]",
+    re.DOTALL | re.IGNORECASE
+)
+
+def format_css(css, depth=0):
+    """Single-pass CSS formatter: one declaration per line, nested blocks indented"""
+    lines = []
+    current = []
+    base_depth = depth
+    
+    def flush(suffix=''):
+        text = ''.join(current).strip()
+        current.clear()
+        if text:
+            lines.append(PRETTIFY_INDENT * depth + text + suffix)
+    
+    for match in CSS_TOKEN_PATTERN.finditer(css):
+        token = match.group()
+        if token == '{':
+            text = ''.join(current).strip()
+            current.clear()
+            lines.append(PRETTIFY_INDENT * depth + (f"{text} {{" if text else '{'))
+            depth += 1
+        elif token == ';':
+            flush(';')
+        elif token == '}':
+            flush(';')
+            depth = max(base_depth, depth - 1)
+            lines.append(PRETTIFY_INDENT * depth + '}')
+        elif token.startswith('/*'):
+            flush()
+            lines.append(PRETTIFY_INDENT * depth + token.strip())
+        else:
+            current.append(token)
+    flush()
+    return lines
+
+HTML_TOKEN_PATTERN = re.compile(
+    r"(?P<text>[^<]+)"
+    r"|<(?P<start>[a-zA-Z][^\s/>]*)" + HTML_TAG_ATTRIBUTES + r">"
+    r"|</(?P<end>[a-zA-Z][^\s/>]*)[^>]*>"
+    r"|(?P<comment><!--.*?-->)"
+    r"|(?P<markup><![^>]*>|<\?[^>]*>)"
+    r"|(?P<stray><)",
+    re.DOTALL
+)
+# Raw-text elements end at their first matching end tag, whatever they contain
+RAW_TEXT_END_PATTERNS = {
+    'script': re.compile(r"</\s*script\s*>", re.IGNORECASE),
+    'style': re.compile(r"</\s*style\s*>", re.IGNORECASE)
+}
+
+def prettify_html(html_content):
+    """
+    Prettify HTML/CSS content for better readability in a single tokenizer pass.
+    Every tag goes on its own line indented by open-element depth, void elements
+    never indent, <style> bodies go through format_css and <pre>/<textarea>
+    content is kept verbatim.
+    """
+    lines = []
+    append_line = lines.append
+    stack = []
+    indent = ''
+    pending = []
+    # Nesting depth inside <pre>/<textarea>, whose content is copied as is
+    raw_depth = 0
+    position = 0
+    length = len(html_content)
+    
+    while position < length:
+        # The token scan restarts after each <script>/<style> body, which is consumed whole
+        resume_at = length
+        for match in HTML_TOKEN_PATTERN.finditer(html_content, position):
+            kind = match.lastgroup
+            if kind == 'text' or kind == 'stray':
+                pending.append(match.group())
+                continue
+            
+            if raw_depth:
+                token = match.group()
+                if kind == 'start':
+                    if match.group('start').lower() in PRESERVE_WHITESPACE_ELEMENTS and not token.endswith('/>'):
+                        raw_depth += 1
+                elif kind == 'end':
+                    tag = match.group('end').lower()
+                    token = f"</{tag}>"
+                    if tag in PRESERVE_WHITESPACE_ELEMENTS:
+                        raw_depth -= 1
+                        if not raw_depth:
+                            lines[-1] += ''.join(pending) + token
+                            pending = []
+                            stack.pop()
+                            indent = PRETTIFY_INDENT * len(stack)
+                            continue
+                pending.append(token)
+                continue
+            
+            if kind == 'end':
+                tag = match.group('end').lower()
+                if tag in VOID_ELEMENTS:
+                    continue
+            if pending:
+                text = ' '.join(''.join(pending).split())
+                pending = []
+                if text:
+                    append_line(indent + text)
+            
+            if kind == 'start':
+                token = match.group()
+                if token[-2] == '/':
+                    append_line(indent + token)
+                    continue
+                tag = match.group('start').lower()
+                closes = IMPLICITLY_CLOSED_BY.get(tag)
+                if closes and stack and stack[-1] in closes:
+                    while stack and stack[-1] in closes:
+                        stack.pop()
+                    indent = PRETTIFY_INDENT * len(stack)
+                append_line(indent + token)
+                if tag in VOID_ELEMENTS:
+                    continue
+                raw_text_end = RAW_TEXT_END_PATTERNS.get(tag)
+                if raw_text_end is not None:
+                    body_start = match.end()
+                    end = raw_text_end.search(html_content, body_start)
+                    body = html_content[body_start:end.start() if end else length]
+                    depth = len(stack) + 1
+                    if tag == 'style':
+                        lines.extend(format_css(body, depth))
+                    else:
+                        body_indent = PRETTIFY_INDENT * depth
+                        lines.extend(body_indent + line for line in textwrap.dedent(body).strip('\n').split('\n')
+                                     if line.strip())
+                    if end is not None:
+                        append_line(indent + f"</{tag}>")
+                        resume_at = end.end()
+                    break
+                stack.append(tag)
+                indent += PRETTIFY_INDENT
+                if tag in PRESERVE_WHITESPACE_ELEMENTS:
+                    raw_depth = 1
+            elif kind == 'end':
+                if tag in stack:
+                    # Close any elements left open inside this one (e.g. <li> without </li>)
+                    while stack.pop() != tag:
+                        pass
+                    indent = PRETTIFY_INDENT * len(stack)
+                append_line(indent + f"</{tag}>")
+            else:
+                append_line(indent + match.group())
+        position = resume_at
+    
+    if raw_depth:
+        lines[-1] += ''.join(pending)
+    elif pending:
+        text = ' '.join(''.join(pending).split())
+        if text:
+            append_line(indent + text)
+    return '\n'.join(lines)
+
+# ==========================================
+# MINIFY & ASSET INLINING
+# ==========================================
+# Only this directory is ever read; the app directory itself holds secrets and databases
+EXPORT_ASSET_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+INLINE_ASSET_MAX_BYTES = 64 * 1024
+INLINE_ASSET_BUDGET_BYTES = 512 * 1024
+# The only file types that are inlined; anything else stays a link
+ASSET_MIME_TYPES = {
+    '.woff': 'font/woff', '.woff2': 'font/woff2', '.ttf': 'font/ttf', '.otf': 'font/otf',
+    '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.gif': 'image/gif',
+    '.svg': 'image/svg+xml', '.webp': 'image/webp', '.avif': 'image/avif', '.ico': 'image/x-icon',
+    '.css': 'text/css'
+}
+EXTERNAL_REFERENCE_PATTERN = re.compile(r"^(?:[a-z][a-z0-9+.-]*:|//|#)", re.IGNORECASE)
+CSS_WHITESPACE_PATTERN = re.compile(r"\s+")
+CSS_PUNCTUATION_PATTERN = re.compile(r"\s*([,>])\s*")
+CSS_PROPERTY_PATTERN = re.compile(r"^([^:\"']*?)\s*:\s*")
+CSS_URL_PATTERN = re.compile(r"url\(\s*(?P<quote>[\"']?)(?P<reference>[^\"')]*)(?P=quote)\s*\)", re.IGNORECASE)
+HTML_MINIFY_PATTERN = re.compile(
+    r"<(?:(?P<raw>(?P<raw_tag>pre|textarea|script)\b.*?</(?P=raw_tag)\s*>)"
+    r"|style\b(?P<style_attributes>" + HTML_TAG_ATTRIBUTES + r")>(?P<css>.*?)</style\s*>"
+    r"|(?P<comment>!--(?!\[if).*?-->)"
+    r"|(?P<asset_tag>(?:img|source|link|video|audio|input|embed|track)\b" + HTML_TAG_ATTRIBUTES + r">))",
+    re.IGNORECASE | re.DOTALL
+)
+ASSET_ATTRIBUTE_PATTERN = re.compile(
+    r"""(?P<name>\b(?:src|href|poster))\s*=\s*(?:"(?P<double>[^"]*)"|'(?P<single>[^']*)'|(?P<bare>[^\s"'>]+))""",
+    re.IGNORECASE
+)
+STYLE_ATTRIBUTE_PATTERN = re.compile(r"""\bstyle\s*=\s*(?:"[^"]*"|'[^']*')""", re.IGNORECASE)
+
+class AssetInliner:
+    """
+    Turns references to files under root into data URIs. Assets larger than
+    max_asset_bytes are left as links, and inlining stops once budget_bytes
+    of encoded data has been embedded in the document.
+    """
+
+    def __init__(self, root=EXPORT_ASSET_ROOT, max_asset_bytes=INLINE_ASSET_MAX_BYTES,
+                 budget_bytes=INLINE_ASSET_BUDGET_BYTES):
+        self.root = os.path.realpath(root)
+        self.max_asset_bytes = max_asset_bytes
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.inlined = 0
+        self.skipped = 0
+        self._data_uris = {}
+
+    def _resolve(self, reference):
+        reference = reference.strip()
+        if not reference or EXTERNAL_REFERENCE_PATTERN.match(reference):
+            return None
+        relative = unquote(reference.split('#', 1)[0].split('?', 1)[0]).lstrip('/')
+        path = os.path.realpath(os.path.join(self.root, relative))
+        # Never read outside the asset root, whatever '..' the page contains
+        if not path.startswith(self.root + os.sep):
+            return None
+        # Dotfiles and dot-directories (.streamlit/, .git/) are never assets
+        if any(part.startswith('.') for part in path[len(self.root) + 1:].split(os.sep)):
+            return None
+        if os.path.splitext(path)[1].lower() not in ASSET_MIME_TYPES or not os.path.isfile(path):
+            return None
+        return path
+
+    def data_uri(self, reference):
+        """The data URI for a local reference, or None to keep the reference as is"""
+        path = self._resolve(reference)
+        if path is None:
+            return None
+        if path not in self._data_uris:
+            data_uri = None
+            if os.path.getsize(path) <= self.max_asset_bytes:
+                mime = ASSET_MIME_TYPES[os.path.splitext(path)[1].lower()]
+                with open(path, 'rb') as asset_file:
+                    data_uri = f"data:{mime};base64," + base64.b64encode(asset_file.read()).decode('ascii')
+            self._data_uris[path] = data_uri
+        data_uri = self._data_uris[path]
+        # Every occurrence is embedded separately, so each one counts against the budget
+        if data_uri is None or self.used_bytes + len(data_uri) > self.budget_bytes:
+            self.skipped += 1
+            return None
+        self.used_bytes += len(data_uri)
+        self.inlined += 1
+        return data_uri
+
+def inline_css_urls(css, inliner):
+    """Replace local url(...) references in css with data URIs"""
+    def replace(match):
+        data_uri = inliner.data_uri(match.group('reference')) if inliner else None
+        # Base64 data URIs need no quoting, which keeps them safe inside style="..." attributes
+        return f'url({data_uri})' if data_uri else match.group()
+    return CSS_URL_PATTERN.sub(replace, css)
+
+def minify_css(css, inliner=None):
+    """
+    CSS minifier on the format_css tokenizer: drops comments and redundant
+    whitespace, removes repeated identical rules/declarations within a block
+    (keeping the last, which is the one the cascade uses) and inlines url()s.
+    """
+    blocks = [[]]
+    preludes = []
+    current = []
+    
+    def take():
+        text = ''.join(current).strip()
+        current.clear()
+        return text
+    
+    def close_block():
+        items = list(reversed(OrderedDict.fromkeys(reversed(blocks.pop()))))
+        body = ''.join(items)
+        return preludes.pop() + '{' + (body[:-1] if body.endswith(';') else body) + '}'
+    
+    for match in CSS_TOKEN_PATTERN.finditer(css):
+        token = match.group()
+        if token == '{':
+            preludes.append(take())
+            blocks.append([])
+        elif token in (';', '}'):
+            declaration = take()
+            if declaration:
+                blocks[-1].append(CSS_PROPERTY_PATTERN.sub(r'\1:', declaration, count=1) + ';')
+            if token == '}' and preludes:
+                rule = close_block()
+                blocks[-1].append(rule)
+        elif token.startswith('/*'):
+            continue
+        elif token[0] in '"\'':
+            current.append(token)
+        elif token[:4].lower() == 'url(':
+            current.append(inline_css_urls(token, inliner))
+        else:
+            current.append(CSS_PUNCTUATION_PATTERN.sub(r'\1', CSS_WHITESPACE_PATTERN.sub(' ', token)))
+    
+    trailing = take()
+    if trailing:
+        blocks[-1].append(trailing)
+    while preludes:
+        rule = close_block()
+        blocks[-1].append(rule)
+    return ''.join(reversed(OrderedDict.fromkeys(reversed(blocks[0]))))
+
+def optimize_html_for_download(html_content, inliner=None):
+    """
+    Optional export stage after clean_html_for_download: minifies <style> blocks
+    and markup whitespace, drops comments (conditional comments are kept) and
+    inlines local src/href/url() assets through inliner. <pre>, <textarea> and
+    <script> content is copied verbatim.
+    """
+    inliner = inliner or AssetInliner()
+    
+    def inline_attribute(match):
+        reference = match.group('double') or match.group('single') or match.group('bare') or ''
+        data_uri = inliner.data_uri(reference)
+        return f'{match.group("name")}="{data_uri}"' if data_uri else match.group()
+    
+    def minify_text(text):
+        text = CSS_WHITESPACE_PATTERN.sub(' ', text)
+        return STYLE_ATTRIBUTE_PATTERN.sub(lambda match: inline_css_urls(match.group(), inliner), text)
+    
+    pieces = []
+    position = 0
+    for match in HTML_MINIFY_PATTERN.finditer(html_content):
+        pieces.append(minify_text(html_content[position:match.start()]))
+        position = match.end()
+        if match.group('raw') is not None:
+            pieces.append(match.group())
+        elif match.group('css') is not None:
+            attributes = CSS_WHITESPACE_PATTERN.sub(' ', match.group('style_attributes')).rstrip()
+            pieces.append(f"<style{attributes}>{minify_css(match.group('css'), inliner)}</style>")
+        elif match.group('asset_tag') is not None:
+            pieces.append(ASSET_ATTRIBUTE_PATTERN.sub(inline_attribute, minify_text(match.group())))
+        # Comments are dropped
+    pieces.append(minify_text(html_content[position:]))
+    return ''.join(pieces).strip()
+
+# ==========================================
+# PDF GENERATION
+# ==========================================
+class EnhancedHTMLParser(HTMLParser):
+    """Collects headers, paragraphs, lists and tables from HTML for PDF layout"""
+
+    def __init__(self):
+        super().__init__()
+        self.content = []
+        self.current_text = ""
+        self.in_title = False
+        self.in_header = False
+        self.in_paragraph = False
+        self.in_list = False
+        self.in_table = False
+        self.header_level = 1
+        self.list_items = []
+        self.table_rows = []
+        self.current_row = []
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+            self.in_header = True
+            self.header_level = int(tag[1])
+        elif tag == 'p':
+            self.in_paragraph = True
+        elif tag in ['ul', 'ol']:
+            self.in_list = True
+            self.list_items = []
+        elif tag == 'li':
+            self.current_text = ""
+        elif tag == 'title':
+            self.in_title = True
+        elif tag == 'table':
+            self.in_table = True
+            self.table_rows = []
+        elif tag == 'tr':
+            self.current_row = []
+        elif tag == 'br':
+            self.current_text += "\n"
+    
+    def handle_endtag(self, tag):
+        if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+            if self.current_text.strip():
+                self.content.append(('header', self.current_text.strip(), self.header_level))
+            self.current_text = ""
+            self.in_header = False
+        elif tag == 'p':
+            if self.current_text.strip():
+                self.content.append(('paragraph', self.current_text.strip()))
+            self.current_text = ""
+            self.in_paragraph = False
+        elif tag in ['ul', 'ol']:
+            if self.list_items:
+                self.content.append(('list', self.list_items))
+            self.in_list = False
+        elif tag == 'li':
+            if self.current_text.strip():
+                self.list_items.append(self.current_text.strip())
+            self.current_text = ""
+        elif tag == 'title':
+            self.in_title = False
+        elif tag == 'table':
+            if self.table_rows:
+                self.content.append(('table', self.table_rows))
+            self.in_table = False
+        elif tag == 'tr':
+            if self.current_row:
+                self.table_rows.append(self.current_row)
+        elif tag in ['td', 'th']:
+            if self.current_text.strip():
+                self.current_row.append(self.current_text.strip())
+            self.current_text = ""
+    
+    def handle_data(self, data):
+        if not self.in_title:
+            self.current_text += data
+    
+    def get_content(self):
+        if self.current_text.strip():
+            self.content.append(('paragraph', self.current_text.strip()))
+        return self.content
+
+def build_pdf_styles():
+    """Build the paragraph and table styles used by generate_pdf_from_html"""
+    styles = getSampleStyleSheet()
+    
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontSize=24,
+        spaceAfter=30,
+        textColor=colors.HexColor('#2c3e50'),
+        alignment=TA_CENTER
+    )
+    
+    heading_styles = {
+        1: ParagraphStyle('CustomH1', parent=styles['Heading1'], fontSize=20, spaceAfter=20, textColor=colors.HexColor('#34495e')),
+        2: ParagraphStyle('CustomH2', parent=styles['Heading2'], fontSize=18, spaceAfter=18, textColor=colors.HexColor('#34495e')),
+        3: ParagraphStyle('CustomH3', parent=styles['Heading3'], fontSize=16, spaceAfter=16, textColor=colors.HexColor('#34495e')),
+        4: ParagraphStyle('CustomH4', parent=styles['Heading4'], fontSize=14, spaceAfter=14, textColor=colors.HexColor('#34495e')),
+        5: ParagraphStyle('CustomH5', parent=styles['Heading5'], fontSize=12, spaceAfter=12, textColor=colors.HexColor('#34495e')),
+        6: ParagraphStyle('CustomH6', parent=styles['Heading6'], fontSize=11, spaceAfter=11, textColor=colors.HexColor('#34495e'))
+    }
+    
+    body_style = ParagraphStyle(
+        'CustomBody',
+        parent=styles['Normal'],
+        fontSize=11,
+        spaceAfter=12,
+        leading=14,
+        textColor=colors.HexColor('#2c3e50'),
+        alignment=TA_JUSTIFY
+    )
+    
+    list_style = ParagraphStyle(
+        'CustomList',
+        parent=styles['Normal'],
+        fontSize=11,
+        leftIndent=20,
+        spaceAfter=6,
+        leading=14,
+        textColor=colors.HexColor('#2c3e50')
+    )
+    
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f8f9fa')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#2c3e50')),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#dee2e6'))
+    ])
+    
+    return {
+        "title": title_style,
+        "headings": heading_styles,
+        "body": body_style,
+        "list": list_style,
+        "table": table_style
+    }
+
+@functools.lru_cache(maxsize=None)
+def get_pdf_styles():
+    """PDF styles built once per process (each export worker builds its own copy)"""
+    return build_pdf_styles()
+
+def generate_pdf_from_html(html_content, title="Document", output_path=None):
+    """
+    Generate PDF from HTML with enhanced formatting. With output_path, ReportLab
+    writes the document straight to that file and the path is returned instead of bytes.
+    """
+    if not REPORTLAB_AVAILABLE:
+        return None
+    
+    try:
+        buffer = output_path or BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch, bottomMargin=1*inch)
+        
+        pdf_styles = get_pdf_styles()
+        title_style = pdf_styles["title"]
+        heading_styles = pdf_styles["headings"]
+        body_style = pdf_styles["body"]
+        list_style = pdf_styles["list"]
+        
+        parser = EnhancedHTMLParser()
+        parser.feed(html_content)
+        content_elements = parser.get_content()
+        
+        story = []
+        story.append(Paragraph(title, title_style))
+        story.append(Spacer(1, 20))
+        
+        for element in content_elements:
+            if element[0] == 'header':
+                level = element[2] if len(element) > 2 else 1
+                style = heading_styles.get(level, heading_styles[1])
+                story.append(Paragraph(element[1], style))
+            
+            elif element[0] == 'paragraph':
+                text = element[1].replace('&nbsp;', ' ').replace('&amp;', '&')
+                story.append(Paragraph(text, body_style))
+            
+            elif element[0] == 'list':
+                for item in element[1]:
+                    story.append(Paragraph(f"• {item}", list_style))
+                story.append(Spacer(1, 10))
+            
+            elif element[0] == 'table':
+                if element[1]:
+                    table_data = element[1]
+                    table = Table(table_data)
+                    table.setStyle(pdf_styles["table"])
+                    story.append(table)
+                    story.append(Spacer(1, 15))
+        
+        if not story or len(story) <= 2:
+            clean_text = re.sub(r'<[^>]+>', ' ', html_content)
+            clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+            
+            if clean_text:
+                paragraphs = [p.strip() for p in clean_text.split('\n') if p.strip()]
+                if not paragraphs:
+                    paragraphs = [clean_text[:1000] + "..." if len(clean_text) > 1000 else clean_text]
+                
+                for para in paragraphs:
+                    if para:
+                        story.append(Paragraph(para, body_style))
+                        story.append(Spacer(1, 12))
+        
+        # build() consumes the story as it lays out pages, releasing flowables as it goes
+        doc.build(story)
+        if output_path:
+            return output_path
+        return buffer.getvalue()
+    
+    except Exception as e:
+        # Runs inside export workers, so report the failure to the caller instead of the page
+        raise RuntimeError(f"Error generating PDF: {str(e)}") from e
+
+# ==========================================
+# EXPORT TASKS
+# ==========================================
+class SpooledExport:
+    """A rendered export written to a temp file instead of being returned as bytes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    @staticmethod
+    def reserve(suffix):
+        """Create an empty temp file for a renderer to write into and return its path"""
+        handle = tempfile.NamedTemporaryFile(prefix=EXPORT_SPOOL_PREFIX, suffix=suffix, delete=False)
+        handle.close()
+        return handle.name
+
+    @classmethod
+    def write(cls, data, suffix):
+        """Spool data (bytes or str) to a new temp file"""
+        path = cls.reserve(suffix)
+        try:
+            with open(path, 'wb') as spooled_file:
+                spooled_file.write(data.encode() if isinstance(data, str) else data)
+        except Exception:
+            os.remove(path)
+            raise
+        return cls(path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def open(self):
+        """Open the spooled file for reading; the caller (or st.download_button) consumes it"""
+        return open(self.path, 'rb')
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def artifact_size(artifact):
+    """Bytes an export artifact occupies, in memory or on disk"""
+    return artifact.size if isinstance(artifact, SpooledExport) else len(artifact)
+
+def discard_artifact(artifact):
+    if isinstance(artifact, SpooledExport):
+        artifact.discard()
+
+def purge_spooled_exports(max_age_seconds, keep=()):
+    """
+    Delete spooled exports and bulk ZIPs older than max_age_seconds (other than the
+    paths in keep) from the temp directory, including ones left behind by earlier
+    server processes. Returns how many were deleted.
+    """
+    directory = tempfile.gettempdir()
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(directory):
+        if not name.startswith(EXPORT_SPOOL_PREFIX):
+            continue
+        path = os.path.join(directory, name)
+        if path in keep:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # Removed by another process in the meantime
+            continue
+    return removed
+
+def render_export(kind, html_content, title):
+    """
+    Export worker entry point: render one 'pdf' or 'html' artifact and time it.
+    Artifacts of EXPORT_SPOOL_THRESHOLD_BYTES or more are written to a temp file
+    and come back as a SpooledExport, so the app never holds large exports in memory.
+    PDFs are always rendered to the temp file and only read back when they are small.
+    """
+    started = time.time()
+    if kind == "pdf":
+        if not REPORTLAB_AVAILABLE:
+            raise RuntimeError("ReportLab is not installed")
+        path = SpooledExport.reserve(".pdf")
+        try:
+            spooled = SpooledExport(generate_pdf_from_html(html_content, title, output_path=path))
+        except Exception:
+            os.remove(path)
+            raise
+        if spooled.size >= EXPORT_SPOOL_THRESHOLD_BYTES:
+            return spooled, time.time() - started
+        with spooled.open() as spooled_file:
+            data = spooled_file.read()
+        spooled.discard()
+        return data, time.time() - started
+    elif kind == "html-min":
+        data = optimize_html_for_download(clean_html_for_download(html_content))
+    else:
+        data = clean_html_for_download(html_content)
+    if len(data) >= EXPORT_SPOOL_THRESHOLD_BYTES:
+        data = SpooledExport.write(data, ".pdf" if kind == "pdf" else ".html")
+    return data, time.time() - started
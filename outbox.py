@@ -0,0 +1,274 @@
+"""
+Durable webhook delivery: a SQLite-backed outbox drained by a background thread
+with per-endpoint rate limiting, retries with backoff and a dead-letter state.
+Kept free of Streamlit so it can be tested on its own.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sheets import backoff_delay, is_transient_fetch_error
+
+OUTBOX_PATH = os.environ.get(
+    "WEBHOOK_OUTBOX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_outbox.db")
+)
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE_SECONDS = 2.0
+OUTBOX_RETRY_MAX_SECONDS = 300.0
+OUTBOX_RATE_LIMIT_PER_SECOND = 2.0
+OUTBOX_REQUEST_TIMEOUT_SECONDS = 20
+OUTBOX_WORKERS = 4
+# Delivered messages are kept this long for the Sent list, then purged
+OUTBOX_RETENTION_SECONDS = 7 * 24 * 60 * 60
+OUTBOX_PURGE_INTERVAL_SECONDS = 60 * 60
+# Only messages still waiting to go out are deduplicated, so a delivered message can be sent again
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_status_code INTEGER,
+    last_error TEXT,
+    response TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE UNIQUE INDEX IF NOT EXISTS outbox_open_key ON outbox (idempotency_key) WHERE status IN ('pending', 'delivering');
+"""
+# Outboxes created before dedupe was scoped to open messages have a table-wide UNIQUE key
+OUTBOX_UNIQUE_KEY_MIGRATION = """
+ALTER TABLE outbox RENAME TO outbox_unique_key;
+DROP INDEX IF EXISTS outbox_due;
+""" + OUTBOX_SCHEMA + """
+INSERT INTO outbox SELECT * FROM outbox_unique_key;
+DROP TABLE outbox_unique_key;
+"""
+outbox_logger = logging.getLogger("webhook_outbox")
+
+def outbox_idempotency_key(url, payload):
+    """Stable key for a message, so re-submitting the same send while it is queued does not enqueue it twice"""
+    text = url + "\n" + json.dumps(payload, sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+class WebhookOutbox:
+    """
+    Durable at-least-once webhook delivery backed by SQLite. Messages are enqueued
+    under an idempotency key, which deduplicates them while they are pending, and
+    drained by a background thread: each endpoint gets at most rate_limit sends per
+    second, transient failures are retried with jittered exponential backoff, and
+    messages that fail permanently or run out of attempts move to the dead-letter
+    state. Every attempt at one message carries the same Idempotency-Key header.
+    Messages left mid-delivery by a restart are picked up again, and delivered
+    messages are purged after retention_seconds. Between passes the thread sleeps
+    until the next message or rate limit slot is due, or until it is woken.
+    """
+
+    def __init__(self, path=OUTBOX_PATH, client=None, rate_limit=OUTBOX_RATE_LIMIT_PER_SECOND,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS, workers=OUTBOX_WORKERS, retention_seconds=OUTBOX_RETENTION_SECONDS):
+        self.path = path
+        self.client = client
+        self.rate_limit = rate_limit
+        self.max_attempts = max_attempts
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._next_send_at = {}
+        self._busy = set()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            table = self._db.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'outbox'").fetchone()
+            if table is not None and "UNIQUE" in table["sql"]:
+                self._db.executescript("BEGIN;" + OUTBOX_UNIQUE_KEY_MIGRATION + "COMMIT;")
+            self._db.executescript(OUTBOX_SCHEMA)
+            self._db.execute("UPDATE outbox SET status = 'pending' WHERE status = 'delivering'")
+        self._thread = None
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="webhook-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def enqueue(self, url, payload, idempotency_key=None):
+        """
+        Add a message; returns (id, created) where created is False when a message
+        with the same key is still pending or being delivered
+        """
+        key = idempotency_key or outbox_idempotency_key(url, payload)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, url, payload, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, url, json.dumps(payload), now, now, now)
+            )
+            created = cursor.rowcount == 1
+            if created:
+                message_id = cursor.lastrowid
+            else:
+                message_id = self._db.execute(
+                    "SELECT id FROM outbox WHERE idempotency_key = ? AND status IN ('pending', 'delivering')", (key,)
+                ).fetchone()["id"]
+        self._wake.set()
+        return message_id, created
+
+    def requeue(self, message_id):
+        """
+        Give a dead-lettered message a fresh set of attempts. Returns False (and leaves
+        it dead) when the same message has since been enqueued again and is still open.
+        """
+        now = time.time()
+        try:
+            self._execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'dead'",
+                (now, now, message_id)
+            )
+        except sqlite3.IntegrityError:
+            return False
+        self._wake.set()
+        return True
+
+    def delete(self, message_id):
+        self._execute("DELETE FROM outbox WHERE id = ? AND status != 'delivering'", (message_id,))
+
+    def messages(self, status, limit=50):
+        rows = self._execute(
+            "SELECT * FROM outbox WHERE status = ? ORDER BY updated_at DESC LIMIT ?", (status, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def next_attempt_in(self):
+        """Seconds until the earliest pending message is due, or None when nothing is pending"""
+        row = self._execute("SELECT MIN(next_attempt_at) AS due FROM outbox WHERE status = 'pending'")[0]
+        return None if row["due"] is None else max(0.0, row["due"] - time.time())
+
+    def counts(self):
+        rows = self._execute("SELECT status, COUNT(*) AS total FROM outbox GROUP BY status")
+        counts = {"pending": 0, "delivering": 0, "delivered": 0, "dead": 0}
+        counts.update({row["status"]: row["total"] for row in rows})
+        return counts
+
+    def _claim(self, now):
+        """Mark due messages for idle, non-throttled endpoints as delivering and return them"""
+        # Skip endpoints that cannot send yet in SQL, so they cannot fill the batch and stall the rest
+        blocked = set(self._busy) | {url for url, send_at in list(self._next_send_at.items()) if send_at > now}
+        due = self._execute(
+            "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+            "AND url NOT IN (SELECT value FROM json_each(?)) ORDER BY next_attempt_at LIMIT 200",
+            (now, json.dumps(sorted(blocked)))
+        )
+        claimed = []
+        for row in due:
+            url = row["url"]
+            if url in self._busy or self._next_send_at.get(url, 0.0) > now or len(self._busy) >= self.workers:
+                continue
+            with self._lock:
+                updated = self._db.execute(
+                    "UPDATE outbox SET status = 'delivering', updated_at = ? WHERE id = ? AND status = 'pending'",
+                    (now, row["id"])
+                ).rowcount
+            if updated:
+                self._busy.add(url)
+                self._next_send_at[url] = now + 1.0 / self.rate_limit
+                claimed.append(dict(row))
+        return claimed
+
+    def _deliver(self, message):
+        attempt = message["attempts"] + 1
+        status_code, error, response_text = None, None, None
+        try:
+            resp = self.client.post(
+                message["url"],
+                data=message["payload"],
+                headers={
+                    "Content-Type": "application/json",
+                    # Per message, so a deliberate re-send is not dropped by the receiver as a retry
+                    "Idempotency-Key": f"{message['idempotency_key']}-{message['id']}"
+                },
+                timeout=OUTBOX_REQUEST_TIMEOUT_SECONDS
+            )
+            status_code, response_text = resp.status_code, resp.text
+            resp.raise_for_status()
+            status = "delivered"
+        except Exception as e:
+            error = str(e)
+            if is_transient_fetch_error(e) and attempt < self.max_attempts:
+                status = "pending"
+            else:
+                status = "dead"
+        now = time.time()
+        next_attempt_at = now + backoff_delay(attempt, OUTBOX_RETRY_BASE_SECONDS, OUTBOX_RETRY_MAX_SECONDS)
+        self._execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, updated_at = ?, "
+            "last_status_code = ?, last_error = ?, response = ? WHERE id = ?",
+            (status, attempt, next_attempt_at, now, status_code, error, response_text, message["id"])
+        )
+
+    def purge_delivered(self, now=None):
+        """Delete delivered messages older than retention_seconds; returns how many"""
+        cutoff = (now or time.time()) - self.retention_seconds
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM outbox WHERE status = 'delivered' AND updated_at < ?", (cutoff,)
+            ).rowcount
+
+    def _next_wake_at(self, now):
+        """
+        When the next message can go out: its endpoint must be idle, past its rate
+        limit slot and the message due. Busy endpoints are skipped, as finishing a
+        delivery wakes the thread anyway. None when nothing is waiting.
+        """
+        busy = set(self._busy)
+        if len(busy) >= self.workers:
+            return None
+        rows = self._execute("SELECT url, MIN(next_attempt_at) AS due FROM outbox WHERE status = 'pending' GROUP BY url")
+        wake_times = [max(row["due"], self._next_send_at.get(row["url"], 0.0)) for row in rows if row["url"] not in busy]
+        return min(wake_times, default=None)
+
+    def _run(self):
+        next_purge_at = 0.0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="webhook-outbox-send") as pool:
+            while True:
+                # Cleared before the pass, so an enqueue or finished delivery during it is not missed
+                self._wake.clear()
+                wake_at = None
+                # One bad pass (a locked database, a failed submit) must not stop delivery for good
+                try:
+                    now = time.time()
+                    if now >= next_purge_at:
+                        self.purge_delivered(now)
+                        next_purge_at = now + OUTBOX_PURGE_INTERVAL_SECONDS
+                    for message in self._claim(now):
+                        pool.submit(self._deliver_and_release, message)
+                    wake_at = self._next_wake_at(now)
+                except Exception:
+                    outbox_logger.exception("Webhook outbox pass failed")
+                    wake_at = time.time() + OUTBOX_RETRY_BASE_SECONDS
+                # Sleep until the earliest due message or rate limit slot, or the next purge
+                wake_at = next_purge_at if wake_at is None else min(wake_at, next_purge_at)
+                self._wake.wait(max(0.0, wake_at - time.time()))
+
+    def _deliver_and_release(self, message):
+        try:
+            self._deliver(message)
+        finally:
+            self._busy.discard(message["url"])
+            self._wake.set()
@@ -0,0 +1,478 @@
+"""
+Loading the code library from a published Google Sheet: the shared cache of
+parsed frames, the streamed and retried download with conditional
+revalidation, chunked CSV parsing and row-level diffing against the previous
+load. Kept free of Streamlit so loads run on worker threads and can be tested
+against a local server.
+"""
+import sys
+import time
+import random
+import threading
+import http.client
+from collections import OrderedDict
+
+import pandas as pd
+import requests
+from urllib3.exceptions import ProtocolError, TimeoutError as UrllibTimeoutError, DecodeError
+
+from code_search import CodeSearchIndex
+
+# ==========================================
+# SHEET CACHE
+# ==========================================
+SHEET_CACHE_TTL_SECONDS = 600
+SHEET_CACHE_MAX_ENTRIES = 8
+SHEET_CSV_CHUNK_ROWS = 5000
+SHEET_FETCH_CONNECT_TIMEOUT = 5
+SHEET_FETCH_READ_TIMEOUT = 30
+SHEET_FETCH_ATTEMPT_TIMEOUT = 120
+SHEET_FETCH_BASE_BACKOFF = 1.0
+SHEET_FETCH_MAX_BACKOFF = 20.0
+TRANSIENT_HTTP_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Reading resp.raw directly raises urllib3's own errors rather than the requests wrappers
+TRANSIENT_READ_ERRORS = (ProtocolError, UrllibTimeoutError, DecodeError, http.client.IncompleteRead)
+REQUIRED_SHEET_COLUMNS = ['Number', 'Code']
+OPTIONAL_SHEET_COLUMNS = ['Title', 'Category', 'Description']
+
+class SheetCache:
+    """
+    Process-wide LRU cache of parsed sheet frames, keyed by sheet URL.
+    Entries go stale after `ttl` seconds but are kept (with their ETag /
+    Last-Modified validators) for conditional revalidation; the least recently
+    used entry is evicted once `max_entries` is exceeded. Cached frames are
+    shared by every session and must be treated as read-only.
+    """
+
+    def __init__(self, ttl=SHEET_CACHE_TTL_SECONDS, max_entries=SHEET_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, url):
+        """Return the entry for url if it is still within its TTL, else None"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or time.time() - entry["stored_at"] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return entry
+
+    def peek(self, url):
+        """Return the entry for url even if expired, so its validators can be reused"""
+        with self._lock:
+            return self._entries.get(url)
+
+    def put(self, url, df, stats, validators=None, row_hashes=None, search_index=None):
+        with self._lock:
+            self._entries[url] = {
+                "df": df,
+                "stats": stats,
+                "validators": validators or {},
+                "row_hashes": row_hashes,
+                "search_index": search_index,
+                "stored_at": time.time()
+            }
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups * 100) if lookups else 0.0,
+            }
+
+# ==========================================
+# SHEET LOADING
+# ==========================================
+def load_data_with_retry(url, cache, max_retries=3, force_refresh=False, incremental=True, progress_callback=None):
+    """
+    Load ALL data from Google Sheets, served from the shared sheet cache when possible.
+    Stale entries and force_refresh are revalidated with a conditional request, so an
+    unchanged sheet is neither re-downloaded nor re-parsed. With incremental=True a
+    re-downloaded sheet is merged row-by-row into the previously cached frame.
+    `cache` is the SheetCache to serve from and store into.
+    """
+    start_time = time.time()
+    
+    entry = None if force_refresh else cache.get(url)
+    if entry is not None:
+        stats = dict(entry["stats"])
+        stats["load_time"] = time.time() - start_time
+        stats["fetch_time"] = 0.0
+        stats["parse_time"] = 0.0
+        stats["source"] = "cache"
+        stats["bytes_transferred"] = 0
+        stats["cache_age"] = time.time() - entry["stored_at"]
+        return entry["df"], stats
+    
+    previous = cache.peek(url)
+    df, stats = fetch_sheet_data(url, max_retries=max_retries, force_refresh=force_refresh,
+                                 previous=previous, incremental=incremental,
+                                 progress_callback=progress_callback)
+    row_hashes = stats.pop("row_hashes", None)
+    if "error" not in stats:
+        if row_hashes is None and previous is not None:
+            row_hashes = previous.get("row_hashes")
+        search_index = sync_search_index(previous, df, row_hashes)
+        cache.put(url, df, stats, stats.get("validators"), row_hashes, search_index)
+    return df, stats
+
+def compute_row_hashes(df):
+    """Content hash of every row, indexed by Number"""
+    return pd.Series(pd.util.hash_pandas_object(df, index=False).values, index=df.index)
+
+def diff_row_hashes(previous_hashes, hashes):
+    """Numbers that were inserted, updated and deleted between two row hash series"""
+    common = hashes.index.intersection(previous_hashes.index)
+    updated = common[hashes.loc[common].values != previous_hashes.loc[common].values]
+    inserted = hashes.index.difference(previous_hashes.index)
+    deleted = previous_hashes.index.difference(hashes.index)
+    return inserted, updated, deleted
+
+def merge_sheet_diff(previous_df, previous_hashes, df):
+    """
+    Apply only the inserted, updated and deleted rows of `df` on top of `previous_df`.
+    Unchanged rows keep the previous frame's values, so anything derived from them
+    (prettified code, rendered PDFs) stays valid. Returns (frame, row_hashes, diff).
+    """
+    hashes = compute_row_hashes(df)
+    if previous_hashes is None:
+        previous_hashes = compute_row_hashes(previous_df)
+    
+    inserted, updated, deleted = diff_row_hashes(previous_hashes, hashes)
+    
+    diff = {
+        "inserted": len(inserted),
+        "updated": len(updated),
+        "deleted": len(deleted),
+        "unchanged": len(hashes) - len(inserted) - len(updated)
+    }
+    
+    if not (len(inserted) or len(updated) or len(deleted)) and previous_df.index.equals(df.index):
+        return previous_df, previous_hashes, diff
+    
+    kept = previous_df.drop(index=deleted.union(updated))
+    merged = pd.concat([kept, df.loc[inserted.union(updated)]])
+    # Restore the sheet's row order
+    merged = merged.loc[df.index]
+    return compact_code_frame(merged), hashes, diff
+
+def sync_search_index(previous, df, row_hashes):
+    """
+    Return the search index for a freshly loaded frame, updating the previous
+    cache entry's index in place with only the rows that changed.
+    """
+    search_index = previous.get("search_index") if previous is not None else None
+    if search_index is None or previous.get("row_hashes") is None or row_hashes is None:
+        search_index = CodeSearchIndex()
+        search_index.rebuild(df)
+    elif df is not previous["df"]:
+        inserted, updated, deleted = diff_row_hashes(previous["row_hashes"], row_hashes)
+        search_index.apply_changes(df, inserted.union(updated).tolist(), deleted.tolist())
+    return search_index
+
+class ByteCountingStream:
+    """
+    File-like wrapper that counts the bytes read through it and the time spent
+    waiting on the network, and enforces an overall deadline for the transfer.
+    """
+
+    def __init__(self, raw, deadline=None):
+        self.raw = raw
+        self.deadline = deadline
+        self.bytes_read = 0
+        self.read_time = 0.0
+
+    def read(self, size=-1):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise requests.exceptions.Timeout("Sheet download exceeded the per-attempt time limit")
+        started = time.time()
+        data = self.raw.read(size)
+        self.read_time += time.time() - started
+        self.bytes_read += len(data)
+        return data
+
+def read_sheet_csv_stream(stream, chunk_rows=SHEET_CSV_CHUNK_ROWS, progress_callback=None):
+    """
+    Parse a sheet CSV from a file-like stream chunk by chunk.
+    Column validation, dedupe-by-first-occurrence and Number coercion run per chunk,
+    so only cleaned rows are kept and peak memory stays near the final frame size.
+    Returns (df, duplicates_count, missing_columns).
+    """
+    reader = pd.read_csv(
+        stream,
+        chunksize=chunk_rows,
+        dtype=str,  # Read all as strings to avoid type inference issues
+        na_filter=True,
+        keep_default_na=True,
+        encoding='utf-8'
+    )
+    
+    chunks = []
+    seen_numbers = set()
+    duplicates_count = 0
+    rows_read = 0
+    
+    for chunk in reader:
+        missing_columns = [col for col in REQUIRED_SHEET_COLUMNS if col not in chunk.columns]
+        if missing_columns:
+            return None, 0, missing_columns
+        rows_read += len(chunk)
+        
+        # Add optional columns if missing
+        for col in OPTIONAL_SHEET_COLUMNS:
+            if col not in chunk.columns:
+                if col == 'Title':
+                    chunk[col] = chunk['Number'].astype(str) + " - Custom Code"
+                elif col == 'Category':
+                    chunk[col] = "Custom"
+                elif col == 'Description':
+                    chunk[col] = "Custom HTML/CSS code from Google Sheets"
+        
+        # Remove completely empty rows
+        chunk = chunk.dropna(how='all')
+        
+        # Keep first occurrence of duplicates, including ones seen in earlier chunks
+        is_duplicate = chunk['Number'].duplicated() | chunk['Number'].isin(seen_numbers)
+        duplicates_count += int(is_duplicate.sum())
+        chunk = chunk[~is_duplicate]
+        seen_numbers.update(chunk['Number'].tolist())
+        
+        # Convert Number column, dropping rows where it couldn't be converted
+        chunk = chunk.assign(Number=pd.to_numeric(chunk['Number'], errors='coerce'))
+        chunk = chunk.dropna(subset=['Number'])
+        chunk = chunk.assign(Number=chunk['Number'].astype(int))
+        chunks.append(chunk)
+        
+        if progress_callback:
+            progress_callback(phase="parsing", rows=rows_read, bytes_read=getattr(stream, "bytes_read", 0))
+    
+    if chunks:
+        df = pd.concat(chunks, ignore_index=True)
+    else:
+        df = pd.DataFrame(columns=REQUIRED_SHEET_COLUMNS + OPTIONAL_SHEET_COLUMNS)
+    del chunks
+    
+    # Number becomes the (only) lookup key
+    df = df.set_index('Number')
+    return compact_code_frame(df), duplicates_count, []
+
+def intern_text_column(series):
+    """Make equal strings in a column share one object, so repeated text is stored once"""
+    pool = {}
+    return pd.Series([pool.setdefault(value, value) if isinstance(value, str) else value
+                      for value in series.values], index=series.index, dtype=object)
+
+def compact_code_frame(df):
+    """
+    Shrink a loaded code library frame: int32 Number index, categorical Category,
+    and one shared string object per distinct Title/Code/Description value.
+    """
+    df = df.copy(deep=False)
+    df.index = df.index.astype('int32')
+    df.index.name = 'Number'
+    if 'Category' in df.columns:
+        df['Category'] = df['Category'].astype('category')
+    for col in ('Title', 'Code', 'Description'):
+        if col in df.columns:
+            df[col] = intern_text_column(df[col])
+    return df
+
+def frame_memory_bytes(df):
+    """Memory held by a code library frame, counting each shared string object once"""
+    total = df.index.nbytes
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object:
+            unique_objects = {id(value): value for value in series.values}
+            total += series.values.nbytes + sum(sys.getsizeof(value) for value in unique_objects.values())
+        else:
+            total += int(series.memory_usage(deep=True, index=False))
+    return total
+
+def is_transient_fetch_error(exc):
+    """True for failures worth retrying: connection drops, timeouts, throttling and 5xx replies"""
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is not None and exc.response.status_code in TRANSIENT_HTTP_STATUSES
+    return isinstance(exc, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        requests.exceptions.ContentDecodingError
+    ) + TRANSIENT_READ_ERRORS)
+
+def backoff_delay(attempt, base=SHEET_FETCH_BASE_BACKOFF, cap=SHEET_FETCH_MAX_BACKOFF):
+    """Exponential backoff with full jitter for the given zero-based attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def fetch_sheet_data(url, max_retries=3, force_refresh=False, previous=None, incremental=True,
+                     progress_callback=None):
+    """
+    Fetch ALL data from Google Sheets with retry logic and conditional revalidation.
+    If `previous` (a sheet cache entry) carries ETag / Last-Modified validators they are
+    sent along, and a 304 reply returns its frame without re-parsing anything.
+    With incremental=True a changed sheet is row-diffed against `previous` by Number.
+    The body is streamed and parsed in chunks. Transient failures are retried with
+    jittered exponential backoff; permanent ones (4xx, malformed sheets) fail at once.
+    progress_callback(**fields) receives phase/attempt/rows/bytes updates.
+    This never touches Streamlit, so it can run on a worker thread.
+    """
+    start_time = time.time()
+    report = progress_callback or (lambda **fields: None)
+    
+    def failure(error_msg, attempt):
+        return pd.DataFrame(columns=REQUIRED_SHEET_COLUMNS + OPTIONAL_SHEET_COLUMNS), {
+            "total_rows": 0,
+            "load_time": time.time() - start_time,
+            "duplicates": 0,
+            "attempt": attempt,
+            "error": error_msg
+        }
+    
+    headers = {}
+    if force_refresh:
+        # Ask intermediate caches to revalidate instead of busting the URL
+        headers["Cache-Control"] = "no-cache"
+    validators = (previous or {}).get("validators", {})
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    
+    for attempt in range(max_retries):
+        report(phase="fetching", attempt=attempt + 1, max_attempts=max_retries, rows=0, bytes_read=0)
+        try:
+            request_started = time.time()
+            resp = requests.get(
+                url,
+                headers=headers,
+                timeout=(SHEET_FETCH_CONNECT_TIMEOUT, SHEET_FETCH_READ_TIMEOUT),
+                stream=True
+            )
+            response_time = time.time() - request_started
+            
+            if resp.status_code == 304 and previous is not None:
+                resp.close()
+                stats = dict(previous["stats"])
+                stats.update({
+                    "load_time": time.time() - start_time,
+                    "fetch_time": response_time,
+                    "parse_time": 0.0,
+                    "attempt": attempt + 1,
+                    "source": "revalidated",
+                    "bytes_transferred": 0,
+                    "diff": {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": len(previous["df"])}
+                })
+                return previous["df"], stats
+            
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            stream = ByteCountingStream(resp.raw, deadline=request_started + SHEET_FETCH_ATTEMPT_TIMEOUT)
+            
+            parse_started = time.time()
+            try:
+                df, duplicates_count, missing_columns = read_sheet_csv_stream(
+                    stream, progress_callback=report
+                )
+            finally:
+                resp.close()
+            
+            if missing_columns:
+                return failure(f"Missing required columns: {', '.join(missing_columns)}", attempt + 1)
+            
+            if incremental and previous is not None and not previous["df"].empty:
+                df, row_hashes, diff = merge_sheet_diff(previous["df"], previous.get("row_hashes"), df)
+            else:
+                row_hashes = compute_row_hashes(df)
+                diff = {"inserted": len(df), "updated": 0, "deleted": 0, "unchanged": 0}
+            
+            load_time = time.time() - start_time
+            memory_bytes = frame_memory_bytes(df)
+            
+            stats = {
+                "total_rows": len(df),
+                "memory_bytes": memory_bytes,
+                "bytes_per_row": memory_bytes / len(df) if len(df) else 0,
+                "load_time": load_time,
+                "fetch_time": response_time + stream.read_time,
+                "parse_time": time.time() - parse_started - stream.read_time,
+                "duplicates": duplicates_count,
+                "columns": [df.index.name] + list(df.columns),
+                "attempt": attempt + 1,
+                "source": "downloaded",
+                "bytes_transferred": stream.bytes_read,
+                "validators": {
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified")
+                },
+                "diff": diff,
+                "row_hashes": row_hashes
+            }
+            
+            return df, stats
+        
+        except Exception as e:
+            if not is_transient_fetch_error(e):
+                return failure(f"Permanent error loading data: {str(e)}", attempt + 1)
+            if attempt == max_retries - 1:
+                return failure(f"Failed to load data after {max_retries} attempts: {str(e)}", attempt + 1)
+            
+            wait_time = backoff_delay(attempt)
+            report(phase="retrying", attempt=attempt + 1, max_attempts=max_retries,
+                   wait=wait_time, message=str(e))
+            time.sleep(wait_time)  # Runs on the loader thread, not the script thread
+    
+    # Should never reach here
+    return failure("Unknown error", max_retries)
+
+class SheetLoadJob:
+    """
+    A sheet load running on the shared loader pool. The script thread polls
+    progress() on each rerun instead of blocking while the sheet downloads.
+    """
+
+    def __init__(self, url, force_refresh=False):
+        self.url = url
+        self.force_refresh = force_refresh
+        self.started_at = time.time()
+        self._progress = {"phase": "queued", "attempt": 0, "rows": 0, "bytes_read": 0}
+        self._lock = threading.Lock()
+        self._future = None
+
+    def update(self, **fields):
+        with self._lock:
+            self._progress.update(fields)
+
+    def progress(self):
+        with self._lock:
+            snapshot = dict(self._progress)
+        snapshot["elapsed"] = time.time() - self.started_at
+        return snapshot
+
+    def start(self, executor, cache):
+        self._future = executor.submit(
+            load_data_with_retry, self.url, cache,
+            force_refresh=self.force_refresh,
+            progress_callback=self.update
+        )
+        return self
+
+    def done(self):
+        return self._future is not None and self._future.done()
+
+    def result(self):
+        return self._future.result()
@@ -0,0 +1,70 @@
+import pandas as pd
+
+from code_search import SEARCH_TOKEN_PATTERN, CodeSearchIndex, SearchSegment
+
+
+def make_frame(rows):
+    return pd.DataFrame(rows, columns=['Number', 'Title', 'Description', 'Code']).set_index('Number')
+
+
+FRAME = make_frame([
+    (1, 'Pricing table', 'Three tiers', '<div class="pricing-grid">plans</div>'),
+    (2, 'Hero banner', 'Landing page pricing', '<section class="hero">Hello</section>'),
+    (3, 'Footer', 'Links', '<footer id="site_footer">© 2024 Ünïcode</footer>'),
+])
+
+
+def build_index(df=FRAME):
+    index = CodeSearchIndex()
+    index.rebuild(df)
+    return index
+
+
+def test_title_matches_outrank_description_matches():
+    assert [number for number, _ in build_index().search('pricing')] == [1, 2]
+
+
+def test_all_query_terms_must_match():
+    assert [number for number, _ in build_index().search('pricing hero')] == [2]
+    assert build_index().search('pricing footer') == []
+
+
+def test_prefixes_expand_to_indexed_terms():
+    index = build_index()
+    assert [number for number, _ in index.search('foot')] == [3]
+    exact, = index.search('footer')
+    prefix, = index.search('foot')
+    assert prefix[1] < exact[1]
+
+
+def test_segment_tokens_match_the_query_tokenizer():
+    text = '<footer id="site_footer">© 2024 Ünïcode a</footer>'
+    segment = SearchSegment.build([3], {'Code': [text]})
+    assert segment.terms == sorted(set(SEARCH_TOKEN_PATTERN.findall(text.lower())))
+
+
+def test_changed_rows_replace_their_old_postings():
+    index = build_index()
+    updated = FRAME.copy()
+    updated.loc[1, 'Title'] = 'Comparison table'
+    updated = pd.concat([updated.drop(index=[3]), make_frame([(4, 'Pricing FAQ', 'Questions', '<dl></dl>')])])
+    index.apply_changes(updated, [1, 4], [3])
+    assert len(index) == 3
+    assert [number for number, _ in index.search('pricing')] == [4, 2, 1]
+    assert [number for number, _ in index.search('comparison')] == [1]
+    assert index.search('footer') == []
+
+
+def test_empty_frame_has_no_results():
+    assert build_index(make_frame([])).search('anything') == []
+
+
+def test_small_changes_go_into_a_new_segment():
+    df = make_frame([(number, f'Card {number}', 'Widget', '<div></div>') for number in range(1, 7)])
+    index = build_index(df)
+    updated = df.copy()
+    updated.loc[2, 'Title'] = 'Carousel'
+    index.apply_changes(updated, [2], [])
+    assert len(index._segments) == 2
+    assert [number for number, _ in index.search('carousel')] == [2]
+    assert sorted(number for number, _ in index.search('card')) == [1, 3, 4, 5, 6]
@@ -0,0 +1,150 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+import html_export
+from html_export import AssetInliner, clean_html_for_download, prettify_html
+
+
+def test_styles_move_into_uppercase_head():
+    cleaned = clean_html_for_download('<HTML><HEAD><TITLE>t</TITLE></HEAD><BODY><style>a{color:red}</style>x</BODY></HTML>')
+    assert cleaned == '<HTML><HEAD>\n<style>\na{color:red}\n</style><TITLE>t</TITLE></HEAD><BODY>x</BODY></HTML>'
+
+
+def test_html_tag_with_attributes_gets_head():
+    cleaned = clean_html_for_download('<html lang="en"><body><style>b{}</style><p>x</p></body></html>')
+    assert cleaned == '<html lang="en">\n<head>\n<style>\nb{}\n</style>\n</head><body><p>x</p></body></html>'
+
+
+def test_head_after_html_tag_receives_styles():
+    cleaned = clean_html_for_download('<html><head lang="en"></head><style>e{}</style></html>')
+    assert cleaned == '<html><head lang="en">\n<style>\ne{}\n</style></head></html>'
+
+
+def test_fragment_without_html_tag_is_wrapped():
+    cleaned = clean_html_for_download('<p>x</p><style>c{}</style>')
+    assert cleaned.startswith('<!DOCTYPE html>\n<html>\n<head>\n<style>\nc{}\n</style>\n</head>\n<body>\n')
+    assert cleaned.endswith('<p>x</p>\n</body>\n</html>')
+
+
+def test_comment_containing_style_is_kept_in_place():
+    cleaned = clean_html_for_download('<head></head><!-- <style>d{}</style> --><p>hi</p>')
+    assert cleaned == '<head></head><!-- <style>d{}</style> --><p>hi</p>'
+
+
+def test_scripts_are_removed():
+    assert clean_html_for_download('<p>a</p><script type="x>y">alert(1)</script ><p>b</p>') == '<p>a</p><p>b</p>'
+
+
+def test_cleanup_is_not_slower_than_legacy_chain():
+    bench = pytest.importorskip('bench')
+    page = bench.build_benchmark_page(1024 * 1024)
+    timings = dict((name, best_ms) for name, best_ms, _ in bench.benchmark_functions({
+        'current': clean_html_for_download,
+        'legacy': bench.legacy_clean_html_for_download
+    }, page, repeat=5))
+    assert timings['current'] <= timings['legacy']
+
+
+def make_asset_root(tmp_path):
+    root = tmp_path / 'static'
+    (root / 'img').mkdir(parents=True)
+    (root / 'img' / 'logo.png').write_bytes(b'png')
+    (root / 'notes.txt').write_text('text')
+    (root / '.secret.png').write_bytes(b'png')
+    (root / '.streamlit').mkdir()
+    (root / '.streamlit' / 'logo.png').write_bytes(b'png')
+    (tmp_path / 'secrets.toml').write_text('token = "x"')
+    return root
+
+
+def test_prettify_indents_nested_tags_and_collapses_text():
+    assert prettify_html('<div><span>  a\n  b </span></div>') == '<div>\n    <span>\n        a b\n    </span>\n</div>'
+
+
+def test_prettify_keeps_pre_and_textarea_verbatim():
+    assert prettify_html('<div><pre>  a\n    b <b>x</b></pre></div>') == '<div>\n    <pre>  a\n    b <b>x</b></pre>\n</div>'
+    assert prettify_html('<textarea>  raw\n text</textarea>') == '<textarea>  raw\n text</textarea>'
+
+
+def test_prettify_passes_script_bodies_through():
+    pretty = prettify_html('<script>if (a<b) {\n  x("</div>");\n}</script><p>1</p>')
+    assert pretty == '<script>\n    if (a<b) {\n      x("</div>");\n    }\n</script>\n<p>\n    1\n</p>'
+
+
+def test_prettify_formats_style_bodies():
+    assert prettify_html('<style>a{color:red}</style>') == '<style>\n    a {\n        color:red;\n    }\n</style>'
+
+
+def test_prettify_never_indents_void_elements():
+    pretty = prettify_html('<div><br><img src="x.png"><input/></br>text</div>')
+    assert pretty == '<div>\n    <br>\n    <img src="x.png">\n    <input/>\n    text\n</div>'
+
+
+def test_prettify_keeps_comments_whole():
+    assert prettify_html('<div><!-- a <b>c</b> --></div>') == '<div>\n    <!-- a <b>c</b> -->\n</div>'
+
+
+def test_prettify_closes_implicitly_and_tolerates_unclosed_tags():
+    assert prettify_html('<ul><li>a<li>b</ul>') == '<ul>\n    <li>\n        a\n    <li>\n        b\n</ul>'
+    assert prettify_html('<div><p>open<span>deep') == '<div>\n    <p>\n        open\n        <span>\n            deep'
+    # An end tag with no open element is still emitted
+    assert prettify_html('</section><p>x</p>') == '</section>\n<p>\n    x\n</p>'
+
+
+def test_asset_inliner_reads_allowed_assets(tmp_path):
+    inliner = AssetInliner(root=make_asset_root(tmp_path))
+    assert inliner.data_uri('/img/logo.png?v=2') == 'data:image/png;base64,cG5n'
+
+
+@pytest.mark.parametrize('reference', [
+    'notes.txt', '.secret.png', '.streamlit/logo.png', 'img/../.streamlit/logo.png',
+    '../secrets.toml', 'img/missing.png', 'https://example.com/logo.png'
+])
+def test_asset_inliner_refuses_other_files(tmp_path, reference):
+    assert AssetInliner(root=make_asset_root(tmp_path)).data_uri(reference) is None
+
+
+def test_render_export_spools_large_output(monkeypatch):
+    monkeypatch.setattr(html_export, 'EXPORT_SPOOL_THRESHOLD_BYTES', 64)
+    small, _ = html_export.render_export('html', '<p>x</p>', 'Title')
+    large, _ = html_export.render_export('html', '<p>' + 'x' * 100 + '</p>', 'Title')
+    assert isinstance(small, str)
+    assert isinstance(large, html_export.SpooledExport)
+    try:
+        with large.open() as spooled_file:
+            assert spooled_file.read().startswith(b'<p>xxx')
+        assert html_export.artifact_size(large) == large.size
+    finally:
+        large.discard()
+    assert not large.exists()
+
+
+@pytest.mark.skipif(not html_export.REPORTLAB_AVAILABLE, reason='ReportLab is not installed')
+def test_render_export_writes_pdf_to_disk(monkeypatch, tmp_path):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    small, _ = html_export.render_export('pdf', '<p>x</p>', 'Title')
+    assert isinstance(small, bytes) and small.startswith(b'%PDF')
+    assert list(tmp_path.iterdir()) == []
+    monkeypatch.setattr(html_export, 'EXPORT_SPOOL_THRESHOLD_BYTES', 64)
+    large, _ = html_export.render_export('pdf', '<p>x</p>', 'Title')
+    assert isinstance(large, html_export.SpooledExport)
+    assert os.path.dirname(large.path) == str(tmp_path)
+    with large.open() as spooled_file:
+        assert spooled_file.read(4) == b'%PDF'
+
+
+def test_purge_spooled_exports_removes_only_expired_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    expired = tmp_path / (html_export.EXPORT_SPOOL_PREFIX + 'old.zip')
+    kept = tmp_path / (html_export.EXPORT_SPOOL_PREFIX + 'kept.pdf')
+    fresh = tmp_path / (html_export.EXPORT_SPOOL_PREFIX + 'new.pdf')
+    unrelated = tmp_path / 'other.zip'
+    for path in (expired, kept, fresh, unrelated):
+        path.write_bytes(b'data')
+    for path in (expired, kept, unrelated):
+        os.utime(path, (time.time() - 7200, time.time() - 7200))
+    assert html_export.purge_spooled_exports(3600, keep={str(kept)}) == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([kept.name, fresh.name, unrelated.name])
@@ -0,0 +1,188 @@
+import json
+import sqlite3
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import outbox
+from outbox import WebhookOutbox
+from webhooks import PooledHTTPClient
+
+# The outbox table as created before dedupe was scoped to open messages
+UNIQUE_KEY_SCHEMA = """
+CREATE TABLE outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_status_code INTEGER,
+    last_error TEXT,
+    response TEXT
+);
+CREATE INDEX outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+class HookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.received.append((self.headers.get("Idempotency-Key"), json.loads(body)))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        reply = b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), HookHandler)
+    server.daemon_threads = True
+    server.received = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(outbox, "backoff_delay", lambda attempt, base, cap: 0.05)
+
+
+def hook_url(server):
+    return f"http://127.0.0.1:{server.server_port}/hook"
+
+
+def make_outbox(tmp_path, **options):
+    return WebhookOutbox(str(tmp_path / "outbox.db"), client=PooledHTTPClient(), **options)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_open_messages_are_deduplicated(tmp_path, server):
+    box = make_outbox(tmp_path)
+    first_id, created = box.enqueue(hook_url(server), {"text": "hi"})
+    assert created
+    assert box.enqueue(hook_url(server), {"text": "hi"}) == (first_id, False)
+    assert box.enqueue(hook_url(server), {"text": "other"})[1]
+    box.start()
+    wait_for(lambda: box.counts()["delivered"] == 2)
+    # A delivered message can be sent again
+    second_id, created = box.enqueue(hook_url(server), {"text": "hi"})
+    assert created and second_id != first_id
+
+
+def test_transient_failures_are_retried_with_the_same_key(tmp_path, server):
+    server.statuses = [503, 502]
+    box = make_outbox(tmp_path).start()
+    message_id, _ = box.enqueue(hook_url(server), {"text": "hi"})
+    wait_for(lambda: box.counts()["delivered"] == 1)
+    delivered, = box.messages("delivered")
+    assert delivered["attempts"] == 3
+    assert len({key for key, _ in server.received}) == 1
+    assert server.received[0][0].endswith(f"-{message_id}")
+
+
+def test_permanent_failures_are_dead_lettered_at_once(tmp_path, server):
+    server.statuses = [400]
+    box = make_outbox(tmp_path).start()
+    box.enqueue(hook_url(server), {"text": "hi"})
+    wait_for(lambda: box.counts()["dead"] == 1)
+    dead, = box.messages("dead")
+    assert dead["attempts"] == 1
+    assert dead["last_status_code"] == 400
+
+
+def test_exhausted_retries_are_dead_lettered_and_can_be_requeued(tmp_path, server):
+    server.statuses = [503, 503]
+    box = make_outbox(tmp_path, max_attempts=2).start()
+    message_id, _ = box.enqueue(hook_url(server), {"text": "hi"})
+    wait_for(lambda: box.counts()["dead"] == 1)
+    assert box.messages("dead")[0]["attempts"] == 2
+    assert box.requeue(message_id)
+    wait_for(lambda: box.counts()["delivered"] == 1)
+    assert len(server.received) == 3
+
+
+def test_requeue_refuses_while_the_same_message_is_open(tmp_path, server):
+    server.statuses = [400]
+    box = make_outbox(tmp_path).start()
+    message_id, _ = box.enqueue(hook_url(server), {"text": "hi"})
+    wait_for(lambda: box.counts()["dead"] == 1)
+    box._next_send_at[hook_url(server)] = time.time() + 60
+    box.enqueue(hook_url(server), {"text": "hi"})
+    assert not box.requeue(message_id)
+    assert box.counts()["dead"] == 1
+
+
+def test_delivered_messages_are_purged_after_retention(tmp_path, server):
+    box = make_outbox(tmp_path, retention_seconds=60).start()
+    box.enqueue(hook_url(server), {"text": "hi"})
+    wait_for(lambda: box.counts()["delivered"] == 1)
+    assert box.purge_delivered() == 0
+    assert box.purge_delivered(now=time.time() + 61) == 1
+    assert box.counts()["delivered"] == 0
+
+
+def test_thread_sleeps_until_the_rate_limit_slot(tmp_path, server):
+    box = make_outbox(tmp_path, rate_limit=4).start()
+    for number in range(3):
+        box.enqueue(hook_url(server), {"number": number})
+    wait_for(lambda: box.counts()["delivered"] == 3)
+    # Sends to one endpoint are spaced by 1 / rate_limit seconds
+    deliveries = sorted(message["updated_at"] for message in box.messages("delivered"))
+    assert deliveries[-1] - deliveries[0] >= 0.45
+
+
+def test_next_wake_is_the_earliest_due_message_or_send_slot(tmp_path, server):
+    box = make_outbox(tmp_path)
+    now = time.time()
+    assert box._next_wake_at(now) is None
+    box.enqueue(hook_url(server), {"text": "hi"})
+    box._execute("UPDATE outbox SET next_attempt_at = ?", (now + 30,))
+    assert box._next_wake_at(now) == pytest.approx(now + 30)
+    box._next_send_at[hook_url(server)] = now + 45
+    assert box._next_wake_at(now) == pytest.approx(now + 45)
+    box._busy.add(hook_url(server))
+    assert box._next_wake_at(now) is None
+
+
+def test_table_wide_unique_key_is_migrated(tmp_path, server):
+    path = tmp_path / "outbox.db"
+    db = sqlite3.connect(path)
+    db.executescript(UNIQUE_KEY_SCHEMA)
+    db.execute(
+        "INSERT INTO outbox (idempotency_key, url, payload, status, attempts, next_attempt_at, created_at, updated_at) "
+        "VALUES ('key', ?, '{\"text\": \"hi\"}', 'delivered', 1, 0, 0, ?)",
+        (hook_url(server), time.time())
+    )
+    db.commit()
+    db.close()
+
+    box = make_outbox(tmp_path)
+    table = box._execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'outbox'")[0]
+    assert "UNIQUE" not in table["sql"]
+    assert box.messages("delivered")[0]["idempotency_key"] == "key"
+    assert box.enqueue(hook_url(server), {"text": "hi"}, idempotency_key="key")[1]
+    assert box.enqueue(hook_url(server), {"text": "hi"}, idempotency_key="key")[1] is False
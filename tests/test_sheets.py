@@ -0,0 +1,196 @@
+import io
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import sheets
+from sheets import SheetCache, load_data_with_retry, merge_sheet_diff, read_sheet_csv_stream
+
+SHEET_CSV = (
+    "Number,Title,Category,Description,Code\n"
+    "1,Pricing table,Layout,Three tiers,<div>plans</div>\n"
+    "2,Hero banner,Layout,Landing page,<section>Hello</section>\n"
+    "3,Footer,Footer,Links,<footer>Bye</footer>\n"
+)
+
+
+class SheetHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        body = self.server.body.encode("utf-8")
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.server.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.server.drops:
+            # Cut the connection halfway through the promised body
+            self.server.drops -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SheetHandler)
+    server.daemon_threads = True
+    server.body = SHEET_CSV
+    server.etag = '"v1"'
+    server.requests = []
+    server.drops = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def sheet_url(server):
+    return f"http://127.0.0.1:{server.server_port}/sheet.csv"
+
+
+def test_first_load_downloads_and_parses_the_sheet(server):
+    df, stats = load_data_with_retry(sheet_url(server), SheetCache())
+    assert stats["source"] == "downloaded"
+    assert stats["bytes_transferred"] == len(SHEET_CSV)
+    assert df.index.tolist() == [1, 2, 3]
+    assert df.loc[2, "Title"] == "Hero banner"
+
+
+def test_fresh_entries_are_served_from_the_cache(server):
+    cache = SheetCache()
+    first, _ = load_data_with_retry(sheet_url(server), cache)
+    df, stats = load_data_with_retry(sheet_url(server), cache)
+    assert stats["source"] == "cache"
+    assert df is first
+    assert len(server.requests) == 1
+    assert cache.hits == 1
+
+
+def test_stale_entries_revalidate_with_their_etag(server):
+    cache = SheetCache(ttl=0)
+    first, _ = load_data_with_retry(sheet_url(server), cache)
+    df, stats = load_data_with_retry(sheet_url(server), cache)
+    assert stats["source"] == "revalidated"
+    assert stats["bytes_transferred"] == 0
+    assert df is first
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+
+
+def test_changed_etag_downloads_the_new_sheet(server):
+    cache = SheetCache(ttl=0)
+    load_data_with_retry(sheet_url(server), cache)
+    server.body = SHEET_CSV.replace("Footer,Footer", "Site footer,Footer")
+    server.etag = '"v2"'
+    df, stats = load_data_with_retry(sheet_url(server), cache)
+    assert stats["source"] == "downloaded"
+    assert df.loc[3, "Title"] == "Site footer"
+    assert cache.peek(sheet_url(server))["validators"]["etag"] == '"v2"'
+
+
+def test_force_refresh_skips_the_cache_and_asks_for_revalidation(server):
+    cache = SheetCache()
+    first, _ = load_data_with_retry(sheet_url(server), cache)
+    df, stats = load_data_with_retry(sheet_url(server), cache, force_refresh=True)
+    assert len(server.requests) == 2
+    assert server.requests[1]["Cache-Control"] == "no-cache"
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+    assert stats["source"] == "revalidated"
+    assert df is first
+
+
+def test_missing_required_columns_fail_without_caching(server):
+    server.body = "Number,Title\n1,Only a title\n"
+    cache = SheetCache()
+    df, stats = load_data_with_retry(sheet_url(server), cache)
+    assert "Code" in stats["error"]
+    assert df.empty
+    assert cache.peek(sheet_url(server)) is None
+
+
+def test_dropped_download_is_retried(server, monkeypatch):
+    monkeypatch.setattr(sheets, "backoff_delay", lambda attempt: 0)
+    server.drops = 1
+    progress = []
+    df, stats = load_data_with_retry(sheet_url(server), SheetCache(),
+                                     progress_callback=lambda **fields: progress.append(fields))
+    assert "error" not in stats
+    assert stats["attempt"] == 2
+    assert df.index.tolist() == [1, 2, 3]
+    assert [fields["attempt"] for fields in progress if fields["phase"] == "retrying"] == [1]
+
+
+def test_download_gives_up_after_max_retries(server, monkeypatch):
+    monkeypatch.setattr(sheets, "backoff_delay", lambda attempt: 0)
+    server.drops = 2
+    cache = SheetCache()
+    df, stats = load_data_with_retry(sheet_url(server), cache, max_retries=2)
+    assert stats["error"].startswith("Failed to load data after 2 attempts")
+    assert df.empty
+    assert cache.peek(sheet_url(server)) is None
+
+
+def test_csv_stream_drops_duplicates_across_chunks():
+    csv = SHEET_CSV + "2,Second hero,Layout,Duplicate,<b></b>\nx,Bad number,Layout,Skipped,<i></i>\n"
+    df, duplicates, missing = read_sheet_csv_stream(io.StringIO(csv), chunk_rows=2)
+    assert missing == []
+    assert duplicates == 1
+    assert df.index.tolist() == [1, 2, 3]
+    assert df.loc[2, "Title"] == "Hero banner"
+    assert str(df.index.dtype) == "int32"
+
+
+def test_csv_stream_fills_optional_columns():
+    df, _, missing = read_sheet_csv_stream(io.StringIO("Number,Code\n7,<p></p>\n"))
+    assert missing == []
+    assert df.loc[7, "Title"] == "7 - Custom Code"
+    assert df.loc[7, "Category"] == "Custom"
+
+
+def test_merge_keeps_unchanged_rows_and_applies_the_diff():
+    previous, _, _ = read_sheet_csv_stream(io.StringIO(SHEET_CSV))
+    changed = SHEET_CSV.replace("<footer>Bye</footer>", "<footer>Later</footer>")
+    changed = changed.replace("1,Pricing table,Layout,Three tiers,<div>plans</div>\n", "")
+    changed += "4,Card,Cards,Single card,<article></article>\n"
+    df, _, _ = read_sheet_csv_stream(io.StringIO(changed))
+    merged, hashes, diff = merge_sheet_diff(previous, None, df)
+    assert diff == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1}
+    assert merged.index.tolist() == [2, 3, 4]
+    assert merged.loc[3, "Code"] == "<footer>Later</footer>"
+    # Unchanged rows keep the previous frame's string objects
+    assert merged.loc[2, "Code"] is previous.loc[2, "Code"]
+    assert hashes.index.tolist() == [2, 3, 4]
+
+
+def test_merge_of_an_identical_sheet_returns_the_previous_frame():
+    previous, _, _ = read_sheet_csv_stream(io.StringIO(SHEET_CSV))
+    df, _, _ = read_sheet_csv_stream(io.StringIO(SHEET_CSV))
+    merged, _, diff = merge_sheet_diff(previous, None, df)
+    assert merged is previous
+    assert diff["unchanged"] == 3
+
+
+def test_changed_sheet_updates_the_cached_search_index(server):
+    cache = SheetCache(ttl=0)
+    load_data_with_retry(sheet_url(server), cache)
+    index = cache.peek(sheet_url(server))["search_index"]
+    server.body = SHEET_CSV.replace("Footer,Footer", "Pricing footer,Footer")
+    server.etag = '"v2"'
+    df, stats = load_data_with_retry(sheet_url(server), cache)
+    assert stats["diff"]["updated"] == 1
+    assert cache.peek(sheet_url(server))["search_index"] is index
+    assert sorted(number for number, _ in index.search("pricing")) == [1, 3]
@@ -0,0 +1,226 @@
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import webhooks
+from webhooks import CircuitBreaker, PooledHTTPClient, WebhookResponseCache, WebhookStream
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in (b"first ", b"second"):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.flush()
+            # Hold the rest of the body back until the test has read the first chunk
+            self.server.release.wait(5)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TrickleHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # Every read completes quickly, but the whole body takes about a second
+        for _ in range(20):
+            self.wfile.write(b"1\r\n.\r\n")
+            self.wfile.flush()
+            time.sleep(0.05)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, handler=ChunkedHandler):
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.release = threading.Event()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def stop_server(server):
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server():
+    server = start_server()
+    yield server
+    stop_server(server)
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=0)
+    breaker.record(False)
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_completed_stream_closes_half_open_breaker(server):
+    url = f"http://127.0.0.1:{server.server_port}/hook"
+    breaker = half_open_breaker()
+    server.release.set()
+    stream = WebhookStream(url, {"text": "hi"}, PooledHTTPClient(), {url: breaker}, timeout=5)
+    assert "".join(stream) == "first second"
+    assert stream.result["success"]
+    assert breaker.state == "closed"
+
+
+def test_abandoned_stream_releases_half_open_probe(server):
+    url = f"http://127.0.0.1:{server.server_port}/hook"
+    breaker = half_open_breaker()
+    stream = WebhookStream(url, {"text": "hi"}, PooledHTTPClient(), {url: breaker}, timeout=5)
+    pieces = iter(stream)
+    assert next(pieces) == "first "
+    assert not breaker.allow()
+    pieces.close()
+    server.release.set()
+    assert stream.result is None
+    assert breaker.state == "half-open"
+    # The next call is let through as the new probe
+    assert breaker.allow()
+
+
+def finished_flight(cache, key, success, total_time=2.0):
+    outcome, flight = cache.begin(key)
+    assert outcome == "fetch"
+    assert cache.begin(key)[0] == "wait"
+    cache.finish(key, flight, {"success": success, "status_code": 200 if success else 500, "total_time": total_time}, "")
+    return flight
+
+
+def test_waiting_on_successful_flight_counts_as_saved():
+    cache = WebhookResponseCache()
+    entry = cache.wait(finished_flight(cache, "key", success=True), timeout=1)
+    assert entry["result"]["success"]
+    assert cache.snapshot()["coalesced"] == 1
+    assert cache.snapshot()["seconds_saved"] == 2.0
+
+
+def test_waiting_on_failed_flight_saves_nothing():
+    cache = WebhookResponseCache()
+    entry = cache.wait(finished_flight(cache, "key", success=False), timeout=1)
+    assert not entry["result"]["success"]
+    assert cache.snapshot()["coalesced"] == 0
+    assert cache.snapshot()["seconds_saved"] == 0.0
+    # Failures are not remembered, so the next identical call goes upstream
+    assert cache.begin("key")[0] == "fetch"
+
+
+def test_sequential_calls_reuse_one_connection(server):
+    url = f"http://127.0.0.1:{server.server_port}/hook"
+    server.release.set()
+    client = PooledHTTPClient()
+    responses = [client.post(url, json={"text": "hi"}, timeout=5) for _ in range(3)]
+    assert [resp.text for resp in responses] == ["first second"] * 3
+    assert responses[0].connection_timings["connect"] is not None
+    assert all(resp.connection_timings["connect"] is None for resp in responses[1:])
+    stats = client.stats()
+    assert stats["calls"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 2
+
+
+def test_unread_stream_forces_a_new_connection(server):
+    url = f"http://127.0.0.1:{server.server_port}/hook"
+    client = PooledHTTPClient()
+    held = client.post(url, json={"text": "hi"}, timeout=5, stream=True)
+    server.release.set()
+    client.post(url, json={"text": "hi"}, timeout=5)
+    held.close()
+    assert client.stats()["new_connections"] == 2
+
+
+def test_refused_connections_are_retried_until_the_server_is_up():
+    port = unused_port()
+    servers = []
+    # The first retry is immediate and the next one waits, so the server comes up in between
+    timer = threading.Timer(0.1, lambda: servers.append(start_server(port)))
+    timer.start()
+    client = PooledHTTPClient(connect_retries=2)
+    try:
+        started = time.perf_counter()
+        resp = client.post(f"http://127.0.0.1:{port}/hook", json={"text": "hi"}, timeout=5, stream=True)
+        servers[0].release.set()
+        assert resp.status_code == 200
+        assert time.perf_counter() - started >= 0.1
+        assert client.stats()["retries"] == 2
+        assert client.stats()["failures"] == 0
+        resp.close()
+    finally:
+        timer.join()
+        for started_server in servers:
+            stop_server(started_server)
+
+
+def test_connect_failures_surface_after_the_retries():
+    client = PooledHTTPClient(connect_retries=1)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.post(f"http://127.0.0.1:{unused_port()}/hook", json={"text": "hi"}, timeout=5)
+    stats = client.stats()
+    assert stats["calls"] == 1
+    assert stats["failures"] == 1
+    assert stats["new_connections"] == 0
+
+
+def test_adaptive_timeout_is_a_deadline_for_the_whole_call(monkeypatch):
+    monkeypatch.setattr(webhooks, "ADAPTIVE_TIMEOUT_FLOOR_SECONDS", 0.1)
+    server = start_server(handler=TrickleHandler)
+    url = f"http://127.0.0.1:{server.server_port}/hook"
+    breaker = CircuitBreaker()
+    for _ in range(5):
+        breaker.record(True, 0.1)
+    try:
+        started = time.perf_counter()
+        stream = WebhookStream(url, {"text": "hi"}, PooledHTTPClient(), {url: breaker}, timeout=5)
+        text = "".join(stream)
+        assert time.perf_counter() - started < 0.6
+        assert not stream.result["success"]
+        assert "within 0.3s" in stream.result["response"]
+        assert 0 < len(text) < 20
+        assert breaker.consecutive_failures == 1
+    finally:
+        stop_server(server)
+
+
+def test_calls_within_the_deadline_succeed():
+    server = start_server(handler=TrickleHandler)
+    url = f"http://127.0.0.1:{server.server_port}/hook"
+    breaker = CircuitBreaker()
+    for _ in range(5):
+        breaker.record(True, 1.0)
+    try:
+        stream = WebhookStream(url, {"text": "hi"}, PooledHTTPClient(), {url: breaker}, timeout=5)
+        assert "".join(stream) == "." * 20
+        assert stream.result["success"]
+    finally:
+        stop_server(server)
@@ -0,0 +1,784 @@
+"""
+Webhook transport shared by every part of the app that calls a webhook: the
+pooled, timed HTTP client and its telemetry, per-endpoint circuit breakers, the
+response memo and the streaming call itself. Kept free of Streamlit so it can
+be used from worker threads and tested on its own.
+"""
+import os
+import json
+import math
+import time
+import codecs
+import socket
+import bisect
+import hashlib
+import threading
+from array import array
+from datetime import datetime
+from collections import OrderedDict, Counter, deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ==========================================
+# WEBHOOK TELEMETRY
+# ==========================================
+TELEMETRY_HISTOGRAM_GROWTH = 1.1
+TELEMETRY_WINDOW_SECONDS = 60
+TELEMETRY_WINDOWS = 60
+# Further endpoints (e.g. hand-typed Simple Sender URLs) share one "other" series
+TELEMETRY_MAX_ENDPOINTS = 50
+TELEMETRY_TIMING_METRICS = ("dns", "connect", "ttfb", "total")
+TELEMETRY_SIZE_METRICS = ("request_bytes", "response_bytes")
+PROMETHEUS_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PROMETHEUS_BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class LogHistogram:
+    """
+    Fixed-memory histogram with log-spaced buckets (HDR style): values between
+    `lowest` and `highest` land in buckets `growth` apart, so any percentile is
+    reported within a factor of `growth` however many values are recorded.
+    """
+
+    def __init__(self, lowest, highest, growth=TELEMETRY_HISTOGRAM_GROWTH):
+        count = int(math.ceil(math.log(highest / lowest, growth))) + 1
+        self.bounds = [lowest * growth ** i for i in range(count)]
+        self.counts = array('q', bytes(8 * (count + 1)))
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0-100), clipped to the observed range"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                bound = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    def count_at_most(self, value):
+        """Values recorded in buckets that end at or below `value` (a Prometheus 'le' count)"""
+        return sum(self.counts[:bisect.bisect_right(self.bounds, value)])
+
+    def memory_bytes(self):
+        return self.counts.itemsize * len(self.counts) + 8 * len(self.bounds)
+
+def new_timing_histogram():
+    return LogHistogram(0.0001, 600)
+
+def new_size_histogram():
+    return LogHistogram(1, 1024 ** 3)
+
+class WebhookTelemetry:
+    """
+    Per-endpoint webhook timings (DNS, connect, TTFB, total) and payload/response
+    sizes in fixed-memory histograms, plus per-minute histograms of total time for
+    the last TELEMETRY_WINDOWS minutes. Memory stays constant however many
+    requests are recorded.
+    """
+
+    def __init__(self):
+        self._endpoints = {}
+        self._windows = deque(maxlen=TELEMETRY_WINDOWS)
+        self._lock = threading.Lock()
+
+    def _endpoint(self, url):
+        if url not in self._endpoints:
+            stats = {metric: new_timing_histogram() for metric in TELEMETRY_TIMING_METRICS}
+            stats.update({metric: new_size_histogram() for metric in TELEMETRY_SIZE_METRICS})
+            stats["outcomes"] = Counter()
+            self._endpoints[url] = stats
+        return self._endpoints[url]
+
+    def record(self, url, total, ttfb=None, dns=None, connect=None, request_bytes=None, response_bytes=None,
+               status_code=0):
+        """Record one webhook call; dns/connect are only known when it opened a new connection"""
+        now = time.time()
+        window_start = now - now % TELEMETRY_WINDOW_SECONDS
+        outcome = "error" if not status_code else f"{status_code // 100}xx"
+        with self._lock:
+            if url not in self._endpoints and len(self._endpoints) >= TELEMETRY_MAX_ENDPOINTS:
+                url = "other"
+            stats = self._endpoint(url)
+            for metric, value in (("dns", dns), ("connect", connect), ("ttfb", ttfb), ("total", total),
+                                  ("request_bytes", request_bytes), ("response_bytes", response_bytes)):
+                if value is not None:
+                    stats[metric].record(value)
+            stats["outcomes"][outcome] += 1
+            if not self._windows or self._windows[-1][0] != window_start:
+                self._windows.append((window_start, {}))
+            window = self._windows[-1][1]
+            if url not in window:
+                window[url] = new_timing_histogram()
+            window[url].record(total)
+
+    def endpoints(self):
+        with self._lock:
+            return list(self._endpoints)
+
+    def summary(self, quantiles=(50, 95, 99)):
+        """Rows of count and percentiles per endpoint and metric"""
+        rows = []
+        with self._lock:
+            for url, stats in self._endpoints.items():
+                for metric in TELEMETRY_TIMING_METRICS + TELEMETRY_SIZE_METRICS:
+                    histogram = stats[metric]
+                    row = {"endpoint": url, "metric": metric, "count": histogram.count}
+                    row.update({f"p{q}": histogram.percentile(q) for q in quantiles})
+                    rows.append(row)
+        return rows
+
+    def outcomes(self):
+        with self._lock:
+            return {url: dict(stats["outcomes"]) for url, stats in self._endpoints.items()}
+
+    def timeline(self, url=None, quantiles=(50, 95, 99)):
+        """Total-time percentiles per minute window for one endpoint, or all endpoints merged"""
+        rows = []
+        with self._lock:
+            for window_start, histograms in self._windows:
+                selected = [histograms[url]] if url in histograms else [] if url else list(histograms.values())
+                if not selected:
+                    continue
+                merged = new_timing_histogram()
+                for histogram in selected:
+                    for index, bucket_count in enumerate(histogram.counts):
+                        merged.counts[index] += bucket_count
+                    merged.count += histogram.count
+                    merged.total += histogram.total
+                    merged.min = histogram.min if merged.min is None else min(merged.min, histogram.min)
+                    merged.max = histogram.max if merged.max is None else max(merged.max, histogram.max)
+                row = {"window": datetime.fromtimestamp(window_start), "requests": merged.count}
+                row.update({f"p{q}": merged.percentile(q) for q in quantiles})
+                rows.append(row)
+        return rows
+
+    def memory_bytes(self):
+        with self._lock:
+            histograms = [stats[metric] for stats in self._endpoints.values()
+                          for metric in TELEMETRY_TIMING_METRICS + TELEMETRY_SIZE_METRICS]
+            histograms += [histogram for _, window in self._windows for histogram in window.values()]
+            return sum(histogram.memory_bytes() for histogram in histograms)
+
+    def prometheus_text(self, endpoint_names=None):
+        """All endpoint histograms and outcome counters in the Prometheus text exposition format"""
+        endpoint_names = endpoint_names or {}
+        
+        def label(url):
+            return endpoint_names.get(url, url).replace("\\", "\\\\").replace('"', '\\"')
+        
+        lines = []
+        families = [
+            ("webhook_request_duration_seconds", "Webhook request phase durations.", TELEMETRY_TIMING_METRICS,
+             "phase", PROMETHEUS_SECONDS_BUCKETS),
+            ("webhook_message_size_bytes", "Webhook payload and response sizes.", TELEMETRY_SIZE_METRICS,
+             "direction", PROMETHEUS_BYTES_BUCKETS)
+        ]
+        with self._lock:
+            for name, help_text, metrics, label_name, buckets in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for url, stats in self._endpoints.items():
+                    for metric in metrics:
+                        histogram = stats[metric]
+                        labels = f'endpoint="{label(url)}",{label_name}="{metric.replace("_bytes", "")}"'
+                        for bound in buckets:
+                            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {histogram.count_at_most(bound)}')
+                        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                        lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+                        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            lines.append("# HELP webhook_requests_total Webhook calls by outcome.")
+            lines.append("# TYPE webhook_requests_total counter")
+            for url, stats in self._endpoints.items():
+                for outcome, total in sorted(stats["outcomes"].items()):
+                    lines.append(f'webhook_requests_total{{endpoint="{label(url)}",outcome="{outcome}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+class TimedConnectionMixin:
+    """
+    urllib3 connection that times DNS resolution and connection setup (TCP plus TLS)
+    whenever it opens a socket, leaving the numbers in the `timings` thread-local
+    for the request that caused it. Each resolved address is tried in turn, as
+    urllib3 itself would.
+    """
+    timings = None
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        host = self._dns_host
+        try:
+            addresses = list(dict.fromkeys(
+                info[4][0] for info in socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+            ))
+        except OSError:
+            # Let urllib3 raise its usual resolution error
+            addresses = [host]
+        self.timings.dns = time.perf_counter() - started
+        last_error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except Exception as e:
+                    last_error = e
+            raise last_error
+        finally:
+            self._dns_host = host
+
+    def connect(self):
+        started = time.perf_counter()
+        self.timings.dns = 0.0
+        super().connect()
+        self.timings.connect = time.perf_counter() - started - self.timings.dns
+        self.timings.opened = True
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools open TimedConnectionMixin connections reporting into `timings`"""
+
+    def __init__(self, timings, **kwargs):
+        self.timings = timings
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = {}
+        for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items():
+            connection_class = type(f"Timed{pool_class.ConnectionCls.__name__}",
+                                    (TimedConnectionMixin, pool_class.ConnectionCls), {"timings": self.timings})
+            pool_classes[scheme] = type(f"Timed{pool_class.__name__}", (pool_class,), {"ConnectionCls": connection_class})
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+# ==========================================
+# SHARED HTTP CLIENT
+# ==========================================
+HTTP_POOL_HOSTS = 10
+# Server-wide setting: every session shares the one client, so it is not adjustable from the UI
+HTTP_POOL_MAXSIZE = int(os.environ.get("WEBHOOK_POOL_MAXSIZE", 8))
+HTTP_CONNECT_RETRIES = 2
+HTTP_RETRY_BACKOFF = 0.2
+
+class PooledHTTPClient:
+    """
+    A requests.Session with keep-alive connection pools (pool_maxsize connections
+    per host) shared by every webhook call. Only failures to connect are retried:
+    nothing has been sent at that point, so even POSTs are safe to repeat, while
+    read errors surface immediately. Counts new connections against reused ones
+    and records every call's timings and sizes in `telemetry`.
+    """
+
+    def __init__(self, pool_maxsize=HTTP_POOL_MAXSIZE, connect_retries=HTTP_CONNECT_RETRIES):
+        self.session = requests.Session()
+        self.connect_retries = connect_retries
+        self._lock = threading.Lock()
+        self.pool_maxsize = pool_maxsize
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.telemetry = WebhookTelemetry()
+        # DNS/connect timings of the connection opened by this thread's current request
+        self._timings = threading.local()
+        retry = Retry(
+            total=self.connect_retries,
+            connect=self.connect_retries,
+            read=False,
+            status=0,
+            backoff_factor=HTTP_RETRY_BACKOFF
+        )
+        self._adapter = TimedHTTPAdapter(
+            self._timings, pool_connections=HTTP_POOL_HOSTS, pool_maxsize=pool_maxsize, max_retries=retry
+        )
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+        session.request plus telemetry. The response carries `connection_timings`
+        (dns/connect, None when a pooled connection was reused); streamed responses
+        are left for the caller to report through observe() once the body is read.
+        """
+        with self._lock:
+            self.calls += 1
+        self._timings.__dict__.clear()
+        started = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+                self.new_connections += int(getattr(self._timings, "opened", False))
+            self.telemetry.record(url, time.perf_counter() - started, **self._connection_timings())
+            raise
+        resp.connection_timings = self._connection_timings()
+        history = getattr(getattr(resp.raw, "retries", None), "history", None) or ()
+        # Counted from the connect timings: the pools' own counters include connects that failed
+        opened = getattr(self._timings, "opened", False)
+        with self._lock:
+            self.retries += len(history)
+            if opened:
+                self.new_connections += 1
+            else:
+                self.reused_connections += 1
+        if not kwargs.get("stream"):
+            self.observe(url, resp, time.perf_counter() - started, len(resp.content))
+        return resp
+
+    def _connection_timings(self):
+        return {"dns": getattr(self._timings, "dns", None), "connect": getattr(self._timings, "connect", None)}
+
+    def observe(self, url, resp, total, response_bytes, ttfb=None, interrupted=False):
+        """Record a finished call; ttfb defaults to requests' send-to-headers time"""
+        body = resp.request.body or b""
+        self.telemetry.record(
+            url,
+            total,
+            ttfb=resp.elapsed.total_seconds() if ttfb is None else ttfb,
+            request_bytes=len(body.encode("utf-8") if isinstance(body, str) else body),
+            response_bytes=response_bytes,
+            status_code=0 if interrupted else resp.status_code,
+            **getattr(resp, "connection_timings", {})
+        )
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "retries": self.retries,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "pool_maxsize": self.pool_maxsize
+            }
+
+# ==========================================
+# ENDPOINT CIRCUIT BREAKERS
+# ==========================================
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_OPEN_SECONDS = 30
+BREAKER_LATENCY_WINDOW = 50
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 5
+ADAPTIVE_TIMEOUT_MULTIPLIER = 3.0
+ADAPTIVE_TIMEOUT_FLOOR_SECONDS = 3.0
+
+def latency_percentile(latencies, q):
+    """Nearest-rank q-th percentile (0-100) of a list of latencies"""
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one webhook endpoint. failure_threshold
+    consecutive failures open it and calls fail fast; after open_seconds a single
+    half-open probe is let through, which closes it on success or re-opens it.
+    Recent total call times drive an adaptive timeout of multiplier x p95, which
+    callers enforce as a deadline for the whole call.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, open_seconds=BREAKER_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self.latencies = deque(maxlen=BREAKER_LATENCY_WINDOW)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out now; a half-open breaker admits one probe at a time"""
+        with self._lock:
+            if self.state == "open" and time.time() - self.opened_at >= self.open_seconds:
+                self.state = "half-open"
+            if self.state == "closed" or (self.state == "half-open" and not self._probe_in_flight):
+                self._probe_in_flight = self.state == "half-open"
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success, latency=None):
+        with self._lock:
+            self._probe_in_flight = False
+            if success:
+                if latency is not None:
+                    self.latencies.append(latency)
+                self.state = "closed"
+                self.consecutive_failures = 0
+                return
+            self.consecutive_failures += 1
+            if self.state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def release(self):
+        """Give back a probe whose call ended without an outcome (the caller abandoned it)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def timeout(self, ceiling):
+        """Adaptive timeout from observed latency, never above the caller's ceiling"""
+        with self._lock:
+            latencies = list(self.latencies)
+        if len(latencies) < ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+            return ceiling
+        adaptive = latency_percentile(latencies, 95) * ADAPTIVE_TIMEOUT_MULTIPLIER
+        return min(ceiling, max(ADAPTIVE_TIMEOUT_FLOOR_SECONDS, adaptive))
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through"""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.opened_at + self.open_seconds - time.time())
+
+    def snapshot(self, ceiling=30):
+        with self._lock:
+            latencies = list(self.latencies)
+            snapshot = {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "rejected": self.rejected,
+                "samples": len(latencies)
+            }
+        snapshot["p95"] = latency_percentile(latencies, 95)
+        snapshot["timeout"] = self.timeout(ceiling)
+        snapshot["retry_in"] = self.retry_in()
+        return snapshot
+
+class CircuitBreakerRegistry:
+    """One CircuitBreaker per endpoint URL, created on first use"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            if url not in self._breakers:
+                self._breakers[url] = CircuitBreaker()
+            return self._breakers[url]
+
+# ==========================================
+# WEBHOOK RESPONSE CACHE
+# ==========================================
+WEBHOOK_CACHE_TTL_SECONDS = 900
+WEBHOOK_CACHE_MAX_ENTRIES = 256
+# Payload fields that change on every send without changing what is being asked for
+WEBHOOK_CACHE_VOLATILE_FIELDS = ("timestamp",)
+
+def webhook_cache_key(url, payload):
+    """Endpoint plus payload minus its volatile fields, with surrounding whitespace stripped from text"""
+    normalized = {
+        field: value.strip() if isinstance(value, str) else value
+        for field, value in payload.items() if field not in WEBHOOK_CACHE_VOLATILE_FIELDS
+    }
+    key = url + "\n" + json.dumps(normalized, sort_keys=True)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+class WebhookResponseCache:
+    """
+    Opt-in, process-wide memo of successful webhook responses keyed by
+    webhook_cache_key. Entries expire after `ttl` seconds and the least recently
+    used is evicted past `max_entries`. An identical call made while one is in
+    flight waits for that call instead of going upstream itself. Every avoided call
+    adds the upstream time it would have cost to seconds_saved.
+    """
+
+    def __init__(self, ttl=WEBHOOK_CACHE_TTL_SECONDS, max_entries=WEBHOOK_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    def begin(self, key):
+        """
+        ("hit", entry) for a fresh cached response, ("wait", flight) while an identical
+        call is in flight, else ("fetch", flight): the caller makes the call and must
+        hand the flight back to finish(), whatever the outcome.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["stored_at"] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.seconds_saved += entry["upstream_time"]
+                return "hit", entry
+            if entry is not None:
+                del self._entries[key]
+            flight = self._flights.get(key)
+            if flight is not None:
+                return "wait", flight
+            self.misses += 1
+            flight = {"done": threading.Event(), "entry": None}
+            self._flights[key] = flight
+            return "fetch", flight
+
+    def wait(self, flight, timeout):
+        """
+        Entry of the in-flight call once it finishes, or None if it takes longer than
+        timeout. Only a successful call counts as coalesced; a failure is passed on
+        as is, but nothing was saved by waiting for it.
+        """
+        if not flight["done"].wait(timeout):
+            return None
+        entry = flight["entry"]
+        if entry["result"]["success"]:
+            with self._lock:
+                self.coalesced += 1
+                self.seconds_saved += entry["upstream_time"]
+        return entry
+
+    def finish(self, key, flight, result, text):
+        """Release the callers waiting on flight; only successful responses are kept"""
+        entry = {
+            # Copied so callers can annotate their own result without touching the cached one
+            "result": dict(result),
+            "text": text,
+            "upstream_time": result.get("total_time") or 0.0,
+            "stored_at": time.time()
+        }
+        with self._lock:
+            self._flights.pop(key, None)
+            if result["success"]:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        flight["entry"] = entry
+        flight["done"].set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                "entries": len(self._entries),
+                "in_flight": len(self._flights),
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "seconds_saved": self.seconds_saved,
+                "hit_rate": ((self.hits + self.coalesced) / lookups * 100) if lookups else 0.0,
+            }
+
+# ==========================================
+# STREAMING CALLS
+# ==========================================
+STREAM_TEXT_FIELDS = ("content", "text", "token", "delta", "output")
+
+def extract_stream_text(data):
+    """Text carried by one SSE data field or NDJSON line; JSON objects are unwrapped to their text field"""
+    if data == "[DONE]":
+        return ""
+    try:
+        parsed = json.loads(data)
+    except ValueError:
+        return data
+    if isinstance(parsed, str):
+        return parsed
+    if isinstance(parsed, dict):
+        for field in STREAM_TEXT_FIELDS:
+            if isinstance(parsed.get(field), str):
+                return parsed[field]
+        # Framing events such as {"type": "begin"} carry no text
+        if "type" in parsed and len(parsed) <= 2:
+            return ""
+    return data
+
+class WebhookStream:
+    """
+    One webhook call as an iterable for st.write_stream: yields the response text as
+    it arrives, with Server-Sent Events and NDJSON lines unwrapped to their text.
+    Once exhausted, .text holds the streamed text and .result send_webhook's outcome
+    dict (full raw body in "response") plus time-to-first-byte and total time. The endpoint's circuit
+    breaker fails the call fast while open and picks a deadline for the whole call
+    (at most `timeout`) from observed latency. With a WebhookResponseCache, a remembered or in-flight
+    identical call is replayed instead (result["cached"] says which).
+    """
+
+    def __init__(self, webhook_url, payload, client, breakers, timeout=30, cache=None):
+        self.webhook_url = webhook_url
+        self.payload = payload
+        self.timeout = timeout
+        self.client = client
+        self.breakers = breakers
+        self.cache = cache
+        self.result = None
+        self.text = ""
+
+    def __iter__(self):
+        pieces = []
+        for piece in self._receive():
+            pieces.append(piece)
+            yield piece
+        self.text = "".join(pieces)
+
+    def _receive(self):
+        if self.cache is None:
+            yield from self._fetch()
+            return
+        
+        started = time.time()
+        key = webhook_cache_key(self.webhook_url, self.payload)
+        outcome, found = self.cache.begin(key)
+        if outcome == "fetch":
+            pieces = []
+            try:
+                for piece in self._fetch():
+                    pieces.append(piece)
+                    yield piece
+            finally:
+                # Waiters must be released even when the reader abandons the stream
+                self.cache.finish(key, found, self.result or {
+                    "success": False,
+                    "status_code": 0,
+                    "response": "Webhook call abandoned before it finished",
+                    "timestamp": datetime.utcnow().isoformat()
+                }, "".join(pieces))
+            return
+        
+        entry = found if outcome == "hit" else self.cache.wait(found, self.timeout)
+        if entry is None:
+            # The identical call is taking too long; make our own
+            yield from self._fetch()
+            return
+        elapsed = time.time() - started
+        # Waiting on a call that failed shares its failure but saves nothing
+        shared = outcome == "hit" or entry["result"]["success"]
+        self.result = dict(
+            entry["result"],
+            timestamp=datetime.utcnow().isoformat(),
+            cached=("hit" if outcome == "hit" else "coalesced") if shared else None,
+            saved_time=entry["upstream_time"] if shared else None,
+            ttfb=elapsed,
+            total_time=elapsed
+        )
+        if entry["text"]:
+            yield entry["text"]
+
+    def _fetch(self):
+        breaker = self.breakers.get(self.webhook_url)
+        if not breaker.allow():
+            self.result = {
+                "success": False,
+                "status_code": 0,
+                "response": f"Circuit open after repeated failures; not sent (next probe in {breaker.retry_in():.0f}s)",
+                "timestamp": datetime.utcnow().isoformat(),
+                "circuit_open": True
+            }
+            return
+        
+        client = self.client
+        started = time.time()
+        ttfb = None
+        resp = None
+        received_bytes = 0
+        body = []
+        # The adaptive timeout comes from total call times, so it bounds the whole call;
+        # as the per-read timeout it also caps connecting and waiting for the headers
+        budget = breaker.timeout(self.timeout)
+        deadline = started + budget
+        try:
+            resp = client.post(self.webhook_url, json=self.payload, timeout=budget, stream=True)
+            ttfb = time.time() - started
+            content_type = resp.headers.get("Content-Type", "")
+            framed = "text/event-stream" in content_type or "ndjson" in content_type
+            decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+            partial_line = ""
+            with resp:
+                for chunk in resp.iter_content(chunk_size=None):
+                    if time.time() > deadline:
+                        raise requests.exceptions.Timeout(f"No complete response within {budget:.1f}s")
+                    received_bytes += len(chunk)
+                    text = decoder.decode(chunk)
+                    body.append(text)
+                    if not framed:
+                        if text:
+                            yield text
+                        continue
+                    lines = (partial_line + text).split("\n")
+                    partial_line = lines.pop()
+                    for line in lines:
+                        line = line.rstrip("\r")
+                        if "text/event-stream" in content_type:
+                            if not line.startswith("data:"):
+                                continue
+                            line = line[5:].lstrip()
+                        piece = extract_stream_text(line) if line else ""
+                        if piece:
+                            yield piece
+                tail = decoder.decode(b"", final=True)
+                body.append(tail)
+                if framed and (partial_line + tail).strip():
+                    yield extract_stream_text((partial_line + tail).strip())
+                elif not framed and tail:
+                    yield tail
+            total_time = time.time() - started
+            client.observe(self.webhook_url, resp, total_time, received_bytes, ttfb)
+            # 4xx means the endpoint is up and answering, so only 5xx counts against the breaker
+            breaker.record(resp.status_code < 500, total_time)
+            self.result = {
+                "success": resp.status_code < 300,
+                "status_code": resp.status_code,
+                "response": "".join(body),
+                "timestamp": datetime.utcnow().isoformat(),
+                "ttfb": ttfb,
+                "total_time": total_time
+            }
+        except Exception as e:
+            breaker.record(False)
+            if resp is not None:
+                client.observe(self.webhook_url, resp, time.time() - started, received_bytes, ttfb, interrupted=True)
+            received = "".join(body)
+            self.result = {
+                "success": False,
+                "status_code": 0,
+                "response": f"{received}\n[stream interrupted: {e}]" if received else str(e),
+                "timestamp": datetime.utcnow().isoformat(),
+                "ttfb": ttfb,
+                "total_time": time.time() - started
+            }
+        finally:
+            if self.result is None:
+                # The reader dropped the stream mid-response (GeneratorExit skips the handler
+                # above): hand back a half-open probe, or the breaker would reject calls for good
+                breaker.release()
+
+def send_webhook(webhook_url, payload, client, breakers, timeout=30, cache=None):
+    """Send webhook request and return detailed response (see WebhookStream)"""
+    stream = WebhookStream(webhook_url, payload, client, breakers, timeout, cache)
+    for _ in stream:
+        pass
+    return stream.result